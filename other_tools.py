@@ -1,3 +1,5 @@
+import multiprocessing
+
 def index_from_key(iterable,key,value):
     """ this is an augmented list index() function that allows index lookup with an arbitrary key function"""
     #  I don't think there's a built-in for this in Python? list.index() doesn't allow for checking with an arbitrary key function....
@@ -7,3 +9,16 @@ def index_from_key(iterable,key,value):
         raise ValueError('%s is not in input'%(value))
 
     return indx
+
+def get_shared_state_pool_context():
+    """ get the multiprocessing context to use for process pools whose workers are handed a large object from this process at startup (e.g. all of the accesses data)
+
+    Where fork is available, it's used regardless of the default start method (spawn on macOS, forkserver on Linux from python 3.14), because forked workers inherit the pool initializer args without them being pickled. Where it isn't (Windows), this falls back on the default start method, and every worker gets its own pickled copy of the initializer args - so memory use goes up with the number of workers.
+
+    :returns: multiprocessing context
+    :rtype: {multiprocessing.context.BaseContext}
+    """
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
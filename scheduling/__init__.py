@@ -3,4 +3,13 @@ from . import custom_window
 from . import routing_objects
 from . import schedule_objects
 from . import io_processing
+from . import accesses_store
+from . import window_cache
+from . import import_profiling
+from . import route_incidence
+from . import route_trie
+from . import contact_graph_routing
+from . import max_flow_bounds
+from . import route_validation
+from . import storage_profiles
 from . import formulation
\ No newline at end of file
@@ -0,0 +1,315 @@
+# Chunked on-disk storage for the accesses data rates structures (obs times, dlnk/xlnk times and rates, eclipse times)
+#
+# The accesses data for large constellations (particularly the xlnk rates) can run to many GB, which is too much to hold in memory at once. This stores every per-satellite or per-satellite-pair block of the data in its own file, and provides read-only views that look like the usual nested lists (e.g. xlnk_rates[sat_indx][xsat_indx][xlnk_indx]) but only load a block from disk when it's accessed. Only a small number of blocks are kept in memory at a time.
+#
+# The xlnk and dlnk rates can also be stored as flat, memory-mapped binary arrays (RatesStore), which can be opened without any parsing at all
+
+import os
+import json
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+
+ACCESSES_STORE_VERSION = 2
+
+# subdirectory and file name format for each type of block. Link times and rates go in separate blocks, so that passes that only need the times (e.g. counting or time-slicing windows) don't load the rates, which are most of the data
+OBS_BLOCK_FMT = os.path.join('obs','sat_%d.pkl')
+DLNK_TIMES_BLOCK_FMT = os.path.join('dlnk','sat_%d_times.pkl')
+DLNK_RATES_BLOCK_FMT = os.path.join('dlnk','sat_%d_rates.pkl')
+XLNK_TIMES_BLOCK_FMT = os.path.join('xlnk','sat_%d_xsat_%d_times.pkl')
+XLNK_RATES_BLOCK_FMT = os.path.join('xlnk','sat_%d_xsat_%d_rates.pkl')
+ECL_BLOCK_FMT = os.path.join('ecl','sat_%d.pkl')
+
+def _write_block(store_dir,rel_path,block):
+    path = os.path.join(store_dir,rel_path)
+    os.makedirs(os.path.dirname(path),exist_ok=True)
+    with open(path,'wb') as f:
+        pickle.dump(block,f,protocol=pickle.HIGHEST_PROTOCOL)
+
+def write_accesses_store(store_dir,accesses_data_rates,eclipse_times):
+    """ write accesses data to a chunked on-disk store
+
+    Blocks written are: obs times per sat, dlnk times and dlnk rates per sat, xlnk times and xlnk rates per sat pair and eclipse times per sat. Only the upper triangle (sat_indx < xsat_indx) of the xlnk structures is stored, as that is all that is used for window import.
+
+    :param store_dir: directory to write the store to (created if needed)
+    :type store_dir: str
+    :param accesses_data_rates: the 'accesses_data_rates' data rates params, containing obs_times, dlnk_times, dlnk_rates, xlnk_times and xlnk_rates
+    :type accesses_data_rates: dict
+    :param eclipse_times: eclipse times per sat (from the 'other_data' data rates params)
+    :type eclipse_times: list
+    """
+
+    num_sats = len(accesses_data_rates['obs_times'])
+
+    for sat_indx in range(num_sats):
+        _write_block(store_dir,OBS_BLOCK_FMT%(sat_indx),accesses_data_rates['obs_times'][sat_indx])
+        _write_block(store_dir,DLNK_TIMES_BLOCK_FMT%(sat_indx),accesses_data_rates['dlnk_times'][sat_indx])
+        _write_block(store_dir,DLNK_RATES_BLOCK_FMT%(sat_indx),accesses_data_rates['dlnk_rates'][sat_indx])
+        _write_block(store_dir,ECL_BLOCK_FMT%(sat_indx),eclipse_times[sat_indx])
+
+        for xsat_indx in range(sat_indx+1,num_sats):
+            _write_block(store_dir,XLNK_TIMES_BLOCK_FMT%(sat_indx,xsat_indx),accesses_data_rates['xlnk_times'][sat_indx][xsat_indx])
+            _write_block(store_dir,XLNK_RATES_BLOCK_FMT%(sat_indx,xsat_indx),accesses_data_rates['xlnk_rates'][sat_indx][xsat_indx])
+
+    with open(os.path.join(store_dir,'index.json'),'w') as f:
+        json.dump({'version': ACCESSES_STORE_VERSION,'num_sats': num_sats},f,indent=4)
+
+
+class AccessesStore():
+    """ read-only access to a chunked accesses store written by write_accesses_store()
+
+    The obs_times, dlnk_times, dlnk_rates, xlnk_times, xlnk_rates and eclipse_times attributes can be indexed exactly like the corresponding in-memory nested lists, but blocks are loaded lazily from disk. At most max_cached_blocks blocks are held in memory at once (least recently used are dropped first), so peak memory is bounded by a few blocks rather than the whole data set.
+    """
+
+    def __init__(self,store_dir,max_cached_blocks=2):
+        """initializes based on store directory
+
+        :param store_dir: directory containing the store
+        :type store_dir: str
+        :param max_cached_blocks: maximum number of blocks held in memory, defaults to 2 (enough to hold the times and the rates for the same sat or sat pair at once)
+        :type max_cached_blocks: int, optional
+        """
+
+        self.store_dir = store_dir
+        self.max_cached_blocks = max_cached_blocks
+
+        with open(os.path.join(store_dir,'index.json'),'r') as f:
+            index = json.load(f)
+
+        if index['version'] != ACCESSES_STORE_VERSION:
+            raise RuntimeWarning('Unexpected accesses store version %s (expected %s) in %s'%(index['version'],ACCESSES_STORE_VERSION,store_dir))
+
+        self.num_sats = index['num_sats']
+
+        self._block_cache = OrderedDict()
+
+        self.obs_times = _LazySatView(self,'obs_times')
+        self.dlnk_times = _LazySatView(self,'dlnk_times')
+        self.dlnk_rates = _LazySatView(self,'dlnk_rates')
+        self.xlnk_times = _LazySatView(self,'xlnk_times')
+        self.xlnk_rates = _LazySatView(self,'xlnk_rates')
+        self.eclipse_times = _LazySatView(self,'eclipse_times')
+
+    # no need to send cached blocks to other processes, they can load what they need
+    def __getstate__(self):
+        return {'store_dir': self.store_dir,'max_cached_blocks': self.max_cached_blocks}
+
+    def __setstate__(self,state):
+        self.__init__(state['store_dir'],state['max_cached_blocks'])
+
+    def load_block(self,rel_path):
+        """ load a block from disk (or from the in-memory cache)"""
+
+        if rel_path in self._block_cache:
+            self._block_cache.move_to_end(rel_path)
+            return self._block_cache[rel_path]
+
+        with open(os.path.join(self.store_dir,rel_path),'rb') as f:
+            block = pickle.load(f)
+
+        self._block_cache[rel_path] = block
+        while len(self._block_cache) > self.max_cached_blocks:
+            self._block_cache.popitem(last=False)
+
+        return block
+
+    def load_xlnk_block(self,block_fmt,sat_indx,xsat_indx):
+        if sat_indx == xsat_indx:
+            return []
+        if sat_indx > xsat_indx:
+            raise NotImplementedError('Only the upper triangle (sat_indx < xsat_indx) of xlnk data is stored (requested %d,%d)'%(sat_indx,xsat_indx))
+        return self.load_block(block_fmt%(sat_indx,xsat_indx))
+
+    def get_entry(self,kind,sat_indx,xsat_indx=None):
+        """ get the entry for a sat (or sat pair, for xlnk data) of the given kind of accesses data"""
+
+        if kind == 'obs_times':
+            return self.load_block(OBS_BLOCK_FMT%(sat_indx))
+        elif kind == 'dlnk_times':
+            return self.load_block(DLNK_TIMES_BLOCK_FMT%(sat_indx))
+        elif kind == 'dlnk_rates':
+            return self.load_block(DLNK_RATES_BLOCK_FMT%(sat_indx))
+        elif kind == 'xlnk_times':
+            return self.load_xlnk_block(XLNK_TIMES_BLOCK_FMT,sat_indx,xsat_indx)
+        elif kind == 'xlnk_rates':
+            return self.load_xlnk_block(XLNK_RATES_BLOCK_FMT,sat_indx,xsat_indx)
+        elif kind == 'eclipse_times':
+            return self.load_block(ECL_BLOCK_FMT%(sat_indx))
+        else:
+            raise NotImplementedError
+
+    def clear_cache(self):
+        self._block_cache.clear()
+
+
+class _LazySatView():
+    """ list-like view indexed by sat index that loads the entry for a sat only when it's accessed
+
+    xlnk data is indexed by two sat indices, so for xlnk kinds the first index gives another view (with sat_indx set), and the second index loads the pair entry
+    """
+
+    def __init__(self,store,kind,sat_indx=None):
+        self.store = store
+        self.kind = kind
+        self.sat_indx = sat_indx
+
+    def __len__(self):
+        return self.store.num_sats
+
+    def __getitem__(self,indx):
+        if indx < 0 or indx >= self.store.num_sats:
+            raise IndexError('sat index %d out of range'%(indx))
+
+        if self.kind in ['xlnk_times','xlnk_rates']:
+            if self.sat_indx is None:
+                return _LazySatView(self.store,self.kind,indx)
+            return self.store.get_entry(self.kind,self.sat_indx,indx)
+
+        return self.store.get_entry(self.kind,indx)
+
+    def __iter__(self):
+        return (self[indx] for indx in range(self.store.num_sats))
+
+
+# files for the memory-mapped rates store
+RATES_INDEX_FILE = 'rates_index.json'
+RATES_STORE_VERSION = 1
+
+def _flatten_rates(rates_by_block,num_cols):
+    """ flatten a list (by block, e.g. sat pair) of lists (by window) of rates matrices into one array, with offset indices
+
+    :returns: all rates rows, row offset for each window (num windows + 1), window offset for each block (num blocks + 1)
+    :rtype: {np.ndarray,np.ndarray,np.ndarray}
+    """
+
+    num_rows = sum(len(rates_mat) for block in rates_by_block for rates_mat in block)
+    num_winds = sum(len(block) for block in rates_by_block)
+
+    rows = np.zeros((num_rows,num_cols),dtype=np.float64)
+    wind_row_offsets = np.zeros(num_winds+1,dtype=np.int64)
+    block_wind_offsets = np.zeros(len(rates_by_block)+1,dtype=np.int64)
+
+    row_indx = 0
+    wind_indx = 0
+    for block_indx, block in enumerate(rates_by_block):
+        for rates_mat in block:
+            if len(rates_mat) > 0:
+                rows[row_indx:row_indx+len(rates_mat),:] = rates_mat
+            row_indx += len(rates_mat)
+            wind_indx += 1
+            wind_row_offsets[wind_indx] = row_indx
+        block_wind_offsets[block_indx+1] = wind_indx
+
+    return rows, wind_row_offsets, block_wind_offsets
+
+def write_rates_store(store_dir,xlnk_rates,dlnk_rates):
+    """ write xlnk and dlnk rates matrices to flat binary arrays that can be memory-mapped
+
+    Every rates matrix (the [mjd, rate, ...] rows for a single window) is stored back to back in one array per link type, along with offset indices for looking up the rows for a given (sat, partner, window). Only the upper triangle (sat_indx < xsat_indx) of xlnk_rates is stored, as that is all that is used for window import. This only needs to be done once per scenario; after that, RatesStore opens the arrays without any parsing.
+
+    :param store_dir: directory to write the store to (created if needed)
+    :type store_dir: str
+    :param xlnk_rates: xlnk rates, indexed [sat_indx][xsat_indx][xlnk_indx][row][col]
+    :type xlnk_rates: list
+    :param dlnk_rates: dlnk rates, indexed [sat_indx][gs_indx][dlnk_indx][row][col]
+    :type dlnk_rates: list
+    """
+
+    num_sats = len(xlnk_rates)
+    num_gs = len(dlnk_rates[0]) if num_sats > 0 else 0
+
+    os.makedirs(store_dir,exist_ok=True)
+
+    # blocks are every (sat_indx,xsat_indx) pair, in row-major order. lower triangle and diagonal blocks are empty
+    xlnk_rates_by_pair = [xlnk_rates[sat_indx][xsat_indx] if xsat_indx > sat_indx else [] for sat_indx in range(num_sats) for xsat_indx in range(num_sats)]
+    dlnk_rates_by_sat_gs = [dlnk_rates[sat_indx][gs_indx] for sat_indx in range(num_sats) for gs_indx in range(num_gs)]
+
+    for name,rates_by_block,num_cols in [('xlnk',xlnk_rates_by_pair,3),('dlnk',dlnk_rates_by_sat_gs,2)]:
+        rows, wind_row_offsets, block_wind_offsets = _flatten_rates(rates_by_block,num_cols)
+        np.save(os.path.join(store_dir,'%s_rates.npy'%(name)),rows)
+        np.save(os.path.join(store_dir,'%s_rates_wind_row_offsets.npy'%(name)),wind_row_offsets)
+        np.save(os.path.join(store_dir,'%s_rates_block_wind_offsets.npy'%(name)),block_wind_offsets)
+
+    with open(os.path.join(store_dir,RATES_INDEX_FILE),'w') as f:
+        json.dump({'version': RATES_STORE_VERSION,'num_sats': num_sats,'num_gs': num_gs},f,indent=4)
+
+
+class RatesStore():
+    """ read-only, memory-mapped access to xlnk and dlnk rates written by write_rates_store()
+
+    The xlnk_rates and dlnk_rates attributes can be indexed exactly like the nested lists they were created from (e.g. xlnk_rates[sat_indx][xsat_indx][xlnk_indx]). The innermost rates matrix comes back as a zero-copy 2D numpy slice of the memory-mapped array, so only the rows actually used get read from disk.
+    """
+
+    def __init__(self,store_dir):
+        self.store_dir = store_dir
+
+        with open(os.path.join(store_dir,RATES_INDEX_FILE),'r') as f:
+            index = json.load(f)
+
+        if index['version'] != RATES_STORE_VERSION:
+            raise RuntimeWarning('Unexpected rates store version %s (expected %s) in %s'%(index['version'],RATES_STORE_VERSION,store_dir))
+
+        self.num_sats = index['num_sats']
+        self.num_gs = index['num_gs']
+
+        self.xlnk_rates = _RatesView(self._load_arrays('xlnk'),self.num_sats,self.num_sats,upper_triangle_only=True)
+        self.dlnk_rates = _RatesView(self._load_arrays('dlnk'),self.num_sats,self.num_gs)
+
+    def _load_arrays(self,name):
+        rows = np.load(os.path.join(self.store_dir,'%s_rates.npy'%(name)),mmap_mode='r')
+        # the offset arrays are small, so just load them
+        wind_row_offsets = np.load(os.path.join(self.store_dir,'%s_rates_wind_row_offsets.npy'%(name)))
+        block_wind_offsets = np.load(os.path.join(self.store_dir,'%s_rates_block_wind_offsets.npy'%(name)))
+        return rows, wind_row_offsets, block_wind_offsets
+
+    # memmaps are re-opened in other processes rather than pickled
+    def __getstate__(self):
+        return {'store_dir': self.store_dir}
+
+    def __setstate__(self,state):
+        self.__init__(state['store_dir'])
+
+
+class _RatesView():
+    """ list-like view of flattened rates arrays, indexed [sat_indx][partner_indx][wind_indx]"""
+
+    def __init__(self,arrays,num_sats,num_partners,block_indx=None,upper_triangle_only=False):
+        self.arrays = arrays
+        self.num_sats = num_sats
+        self.num_partners = num_partners
+        # True if only the (sat_indx <= partner_indx) blocks are stored, as for xlnk rates
+        self.upper_triangle_only = upper_triangle_only
+        # None at the top level (indexed by sat), sat_indx at the middle level (indexed by partner), block index at the bottom level (indexed by window)
+        self.sat_indx = None
+        self.block_indx = block_indx
+
+    def __len__(self):
+        if self.block_indx is not None:
+            block_wind_offsets = self.arrays[2]
+            return int(block_wind_offsets[self.block_indx+1] - block_wind_offsets[self.block_indx])
+        if self.sat_indx is not None:
+            return self.num_partners
+        return self.num_sats
+
+    def __getitem__(self,indx):
+        rows, wind_row_offsets, block_wind_offsets = self.arrays
+
+        if self.block_indx is not None:
+            if indx < 0 or indx >= len(self):
+                raise IndexError('window index %d out of range'%(indx))
+            wind_indx = block_wind_offsets[self.block_indx] + indx
+            return rows[wind_row_offsets[wind_indx]:wind_row_offsets[wind_indx+1]]
+
+        if self.sat_indx is not None:
+            if indx < 0 or indx >= self.num_partners:
+                raise IndexError('partner index %d out of range'%(indx))
+            if self.upper_triangle_only and indx < self.sat_indx:
+                raise NotImplementedError('Only the upper triangle (sat_indx < xsat_indx) of xlnk rates is stored (requested %d,%d)'%(self.sat_indx,indx))
+            return _RatesView(self.arrays,self.num_sats,self.num_partners,block_indx=self.sat_indx*self.num_partners+indx,upper_triangle_only=self.upper_triangle_only)
+
+        if indx < 0 or indx >= self.num_sats:
+            raise IndexError('sat index %d out of range'%(indx))
+        sat_view = _RatesView(self.arrays,self.num_sats,self.num_partners,upper_triangle_only=self.upper_triangle_only)
+        sat_view.sat_indx = indx
+        return sat_view
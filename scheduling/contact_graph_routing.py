@@ -0,0 +1,401 @@
+# Contact graph routing over imported activity windows
+#
+# Builds a time-expanded contact graph from obs, xlnk and dlnk windows and finds earliest-arrival (minimum latency) routes from observations to the ground, as DataRoute objects.
+#
+# Each node in the graph is a window plus the satellite the data is on at the start of the window (the same thing DataRoute.window_start_sats keeps track of) - symmetric xlnk windows give one node for each direction. There's an edge from one node to another if data can go from the first window to the second under the same rules DataRoute.validate() checks: the second window is on the satellite the data is on after the first, starts after the first ends, and the window centers are far enough apart for the transition time from the ActivityTimingHelper.
+#
+# K-best routes per observation are found with Yen's algorithm on top of the same search, with a residual capacity ledger so that the alternatives for an observation don't all rely on the same exhausted windows. Observations are independent, so they can be enumerated in parallel worker processes.
+#
+# The data is considered to have arrived at a node at the end of its window, so arrival times are fixed per node, and the earliest-arrival search is a Dijkstra sweep in order of window end time. For every satellite, the windows data can leave on are kept sorted by start time. Expanding a node binary searches for the first window starting after it, and scans forward only as far as the windows that are not yet reached - everything after that was reached by an earlier expansion on the same satellite. Only windows skipped for transition time get rescanned, so a search is close to linear in the number of contacts.
+
+from bisect import bisect_left
+from heapq import heappush, heappop
+
+from circinus_tools  import  constants as const
+from circinus_tools  import other_tools
+from .routing_objects import DataRoute, WindowCapacityLedger
+
+# the ContactGraph used by routing worker processes. Set once per worker by the pool initializer, so the graph doesn't have to be sent along with every task
+_routing_worker_graph = None
+
+def _init_routing_worker(graph):
+    global _routing_worker_graph
+    _routing_worker_graph = graph
+
+def _run_k_best_worker_task(start_node,k,min_dv):
+    return _routing_worker_graph.find_k_earliest_arrival_paths(start_node,k,min_dv)
+
+
+class ContactGraph():
+    """ time-expanded contact graph over a set of obs, xlnk and dlnk windows
+
+    Nodes are referred to by integer index. For each node, the graph keeps the window, the satellite the data is on at the start of the window, and the satellite the data is on at the end of it (None for dlnks)
+    """
+
+    def __init__(self,obs_winds,xlnk_winds,dlnk_winds,act_timing_helper=None,min_wind_dv=0):
+        """
+        :param obs_winds: observation windows
+        :type obs_winds: iterable(ObsWindow)
+        :param xlnk_winds: crosslink windows. Each window only needs to be in here once, but duplicates are okay
+        :type xlnk_winds: iterable(XlnkWindow)
+        :param dlnk_winds: downlink windows
+        :type dlnk_winds: iterable(DlnkWindow)
+        :param act_timing_helper: used to look up the transition time required between windows. If None, no transition time is required (windows just have to be in order), defaults to None
+        :type act_timing_helper: ActivityTimingHelper, optional
+        :param min_wind_dv: windows with less data volume than this are left out of the graph (windows with no data volume are always left out), defaults to 0
+        :type min_wind_dv: float, optional
+        """
+
+        self.act_timing_helper = act_timing_helper
+        self.min_wind_dv = min_wind_dv
+
+        self.node_winds = []
+        #  the satellite the data is on at the start and end of each node's window
+        self.node_start_sats = []
+        self.node_end_sats = []
+
+        self.obs_node_by_wind = {}
+
+        #  xlnk and dlnk nodes the data can leave each satellite on, sorted by start time
+        contact_nodes_by_sat = {}
+
+        seen_winds = set()
+        def include_wind(wind):
+            if wind in seen_winds:
+                return False
+            seen_winds.add(wind)
+            return wind.data_vol > 0 and wind.data_vol >= min_wind_dv
+
+        for wind in obs_winds:
+            if include_wind(wind):
+                self.obs_node_by_wind[wind] = self._add_node(wind,wind.sat_indx,wind.sat_indx)
+
+        for wind in xlnk_winds:
+            if include_wind(wind):
+                for sat_indx in [wind.sat_indx,wind.xsat_indx]:
+                    #  for unidirectional windows, data can only go out from the tx sat
+                    if not wind.symmetric and sat_indx != wind.tx_sat:
+                        continue
+                    node = self._add_node(wind,sat_indx,wind.get_xlnk_partner(sat_indx))
+                    contact_nodes_by_sat.setdefault(sat_indx,[]).append(node)
+
+        for wind in dlnk_winds:
+            if include_wind(wind):
+                node = self._add_node(wind,wind.sat_indx,None)
+                contact_nodes_by_sat.setdefault(wind.sat_indx,[]).append(node)
+
+        #  times in seconds relative to the earliest window start, so comparisons are on floats instead of datetimes
+        if len(self.node_winds) > 0:
+            self.time_base = min(wind.start for wind in self.node_winds)
+        else:
+            self.time_base = None
+        self.node_starts = [(wind.start-self.time_base).total_seconds() for wind in self.node_winds]
+        self.node_ends = [(wind.end-self.time_base).total_seconds() for wind in self.node_winds]
+        self.node_centers = [(wind.center-self.time_base).total_seconds() for wind in self.node_winds]
+
+        #  results of can_transition(), keyed by (node1, node2). Transition time lookups are slow compared to the rest of a search, and spur searches for k-best routes check the same pairs over and over
+        self._can_transition_cache = {}
+
+        self.contact_nodes_by_sat = {}
+        self.contact_starts_by_sat = {}
+        for sat_indx, nodes in contact_nodes_by_sat.items():
+            nodes.sort(key=lambda node: (self.node_starts[node],node))
+            self.contact_nodes_by_sat[sat_indx] = nodes
+            self.contact_starts_by_sat[sat_indx] = [self.node_starts[node] for node in nodes]
+
+    def _add_node(self,wind,start_sat_indx,end_sat_indx):
+        self.node_winds.append(wind)
+        self.node_start_sats.append(start_sat_indx)
+        self.node_end_sats.append(end_sat_indx)
+        return len(self.node_winds)-1
+
+    @property
+    def num_nodes(self):
+        return len(self.node_winds)
+
+    def is_dlnk_node(self,node):
+        return self.node_end_sats[node] is None
+
+    def can_transition(self,node1,node2):
+        """ check if data can go from node1 directly to node2 (given that node2 is one of the contacts for the sat the data is on after node1)"""
+
+        #  this is the same check as in DataRoute.validate(), with the 'start_end' time option
+        if self.node_starts[node2] < self.node_ends[node1]:
+            return False
+
+        if self.act_timing_helper is None:
+            return True
+
+        can_transition = self._can_transition_cache.get((node1,node2))
+        if can_transition is None:
+            sat_indx = self.node_start_sats[node2]
+            trans_time_s = self.act_timing_helper.get_transition_time_req(self.node_winds[node1],self.node_winds[node2],sat_indx,sat_indx)
+            can_transition = self.node_centers[node2] - self.node_centers[node1] >= trans_time_s
+            self._can_transition_cache[(node1,node2)] = can_transition
+
+        return can_transition
+
+    def get_next_nodes(self,node):
+        """ get all of the nodes data can go to directly from node
+
+        :param node: node index
+        :type node: int
+        :returns: next node indices, in order of window start
+        :rtype: {list(int)}
+        """
+
+        sat_indx = self.node_end_sats[node]
+        if sat_indx is None:
+            return []
+        contact_nodes = self.contact_nodes_by_sat.get(sat_indx,[])
+        first_indx = bisect_left(self.contact_starts_by_sat.get(sat_indx,[]),self.node_ends[node])
+        return [next_node for next_node in contact_nodes[first_indx:] if self.can_transition(node,next_node)]
+
+    def find_earliest_arrival_path(self,start_node,excluded_nodes=frozenset(),excluded_edges=frozenset()):
+        """ find the path from start_node that gets data to the ground the soonest
+
+        Paths end at the dlnk window with the earliest end time that can be reached. Ties between paths to that dlnk go to the path through the earliest-ending windows
+
+        :param start_node: node to start from (e.g. an obs node)
+        :type start_node: int
+        :param excluded_nodes: nodes the path can't go through, defaults to frozenset()
+        :type excluded_nodes: set(int), optional
+        :param excluded_edges: (node, next node) edges the path can't use, defaults to frozenset()
+        :type excluded_edges: set(tuple), optional
+        :returns: node indices along the path, from start_node to a dlnk node, or None if no dlnk can be reached
+        :rtype: {list(int)}
+        """
+
+        node_ends = self.node_ends
+        node_end_sats = self.node_end_sats
+
+        prev_node_by_node = {start_node: None}
+        queue = [(node_ends[start_node],start_node)]
+        #  for each satellite, the index in its contact list from which all contacts have already been reached
+        all_reached_from_by_sat = {}
+
+        while queue:
+            end, node = heappop(queue)
+
+            sat_indx = node_end_sats[node]
+            if sat_indx is None:
+                #  first dlnk node off the queue is the earliest arrival
+                path = [node]
+                while prev_node_by_node[path[-1]] is not None:
+                    path.append(prev_node_by_node[path[-1]])
+                path.reverse()
+                return path
+
+            contact_nodes = self.contact_nodes_by_sat.get(sat_indx)
+            if contact_nodes is None:
+                continue
+
+            first_indx = bisect_left(self.contact_starts_by_sat[sat_indx],end)
+            stop_indx = all_reached_from_by_sat.get(sat_indx,len(contact_nodes))
+            if first_indx >= stop_indx:
+                continue
+
+            #  index after the last contact in the scan that's still not reached
+            unreached_end_indx = first_indx
+            for contact_indx in range(first_indx,stop_indx):
+                next_node = contact_nodes[contact_indx]
+                if next_node in prev_node_by_node:
+                    continue
+                if next_node in excluded_nodes or (node,next_node) in excluded_edges or not self.can_transition(node,next_node):
+                    unreached_end_indx = contact_indx+1
+                    continue
+
+                prev_node_by_node[next_node] = node
+                heappush(queue,(node_ends[next_node],next_node))
+
+            all_reached_from_by_sat[sat_indx] = unreached_end_indx
+
+        return None
+
+    def get_path_latency(self,path):
+        """ get the time from the start of the first window in path to the end of the last, in seconds"""
+        return self.node_ends[path[-1]] - self.node_starts[path[0]]
+
+    def get_path_dv(self,path):
+        """ get the most data volume that can go along path (the smallest window data volume)"""
+        return min(self.node_winds[node].data_vol for node in path)
+
+    def make_data_route(self,path,agent_ID,agent_ID_index,dv=None):
+        """ make a DataRoute for a path through the graph
+
+        :param path: node indices, starting from an obs node
+        :type path: list(int)
+        :param agent_ID: agent ID for the data route ID
+        :type agent_ID: str
+        :param agent_ID_index: index for the data route ID
+        :type agent_ID_index: int
+        :param dv: data volume for the route, defaults to None (the smallest window data volume along the path)
+        :type dv: float, optional
+        :rtype: {DataRoute}
+        """
+
+        route = [self.node_winds[node] for node in path]
+        window_start_sats = {self.node_winds[node]: self.node_start_sats[node] for node in path}
+        if dv is None:
+            dv = self.get_path_dv(path)
+        return DataRoute(agent_ID,agent_ID_index,route=route,window_start_sats=window_start_sats,dv=dv)
+
+    def get_earliest_arrival_route(self,obs,agent_ID='cgr',agent_ID_index=0):
+        """ find the route that gets data from obs to the ground the soonest
+
+        :param obs: observation window
+        :type obs: ObsWindow
+        :param agent_ID: agent ID for the data route ID, defaults to 'cgr'
+        :type agent_ID: str, optional
+        :param agent_ID_index: index for the data route ID, defaults to 0
+        :type agent_ID_index: int, optional
+        :returns: data route, or None if obs isn't in the graph or can't be downlinked
+        :rtype: {DataRoute}
+        """
+
+        start_node = self.obs_node_by_wind.get(obs)
+        if start_node is None:
+            return None
+
+        path = self.find_earliest_arrival_path(start_node)
+        if path is None:
+            return None
+        return self.make_data_route(path,agent_ID,agent_ID_index)
+
+    def get_earliest_arrival_routes(self,obs_winds=None,agent_ID='cgr'):
+        """ find the earliest-arrival route for every observation
+
+        :param obs_winds: observation windows to route, defaults to None (all obs in the graph)
+        :type obs_winds: iterable(ObsWindow), optional
+        :param agent_ID: agent ID for the data route IDs (which are numbered in order of obs_winds), defaults to 'cgr'
+        :type agent_ID: str, optional
+        :returns: data route for each obs, or None for obs that can't be downlinked
+        :rtype: {dict}
+        """
+
+        if obs_winds is None:
+            obs_winds = self.obs_node_by_wind.keys()
+
+        routes_by_obs = {}
+        for agent_ID_index, obs in enumerate(obs_winds):
+            routes_by_obs[obs] = self.get_earliest_arrival_route(obs,agent_ID,agent_ID_index)
+
+        return routes_by_obs
+
+    def find_k_earliest_arrival_paths(self,start_node,k,min_dv=const.dv_lowest_total_consider_Mb):
+        """ find up to k distinct paths from start_node to the ground, in order of arrival time, each with enough data volume left to be worth considering (paths with the same arrival time can come out in either order)
+
+        Paths are enumerated with Yen's algorithm, using find_earliest_arrival_path() for the spur searches. As each path is accepted, its data volume is marked as used in a capacity ledger for the xlnk and dlnk windows along it. A path gets the smallest remaining data volume along it (including the data volume of the start window, which isn't used up - all the paths carry data from the same obs). Paths with less than min_dv are dropped, and windows with less than min_dv left are left out of later searches, since any path through them would be dropped anyway.
+
+        The ledger starts from the full data volume of every window, so the paths for each start node are independent of the paths for any other
+
+        :param start_node: node to start from (e.g. an obs node)
+        :type start_node: int
+        :param k: max number of paths
+        :type k: int
+        :param min_dv: least data volume a path can have, defaults to const.dv_lowest_total_consider_Mb
+        :type min_dv: float, optional
+        :returns: list of (path, data volume), where path is a list of node indices from start_node to a dlnk node
+        :rtype: {list(tuple)}
+        """
+
+        ledger = WindowCapacityLedger()
+        start_dv = self.node_winds[start_node].data_vol
+
+        def get_path_avail_dv(path):
+            return min([start_dv]+[ledger.get_avail_dv(self.node_winds[node]) for node in path[1:]])
+
+        accepted_paths = []
+        #  every path taken off the candidates queue (including dropped ones), which spur paths need to differ from
+        found_paths = []
+        candidates = []
+        candidate_paths = set()
+        exhausted_nodes = set()
+
+        path = self.find_earliest_arrival_path(start_node)
+        if path is not None:
+            heappush(candidates,(self.node_ends[path[-1]],len(path),path))
+            candidate_paths.add(tuple(path))
+
+        while candidates and len(accepted_paths) < k:
+            end, path_len, path = heappop(candidates)
+
+            #  paths through windows that have been used up since the path was found get dropped
+            path_dv = get_path_avail_dv(path)
+            if path_dv >= min_dv:
+                accepted_paths.append((path,path_dv))
+                path_winds = [self.node_winds[node] for node in path[1:]]
+                ledger.use_dv(path_winds,path_dv)
+                for node in path[1:]:
+                    if ledger.get_avail_dv(self.node_winds[node]) < min_dv:
+                        exhausted_nodes.add(node)
+            found_paths.append(path)
+
+            if len(accepted_paths) >= k:
+                break
+
+            #  Yen's spur step: for every node along path, find the best path that follows path up to that node and then leaves it on an edge no found path with the same root has taken
+            for spur_indx in range(len(path)-1):
+                root_path = path[:spur_indx+1]
+                spur_node = path[spur_indx]
+
+                excluded_edges = set()
+                for found_path in found_paths:
+                    if len(found_path) > spur_indx+1 and found_path[:spur_indx+1] == root_path:
+                        excluded_edges.add((spur_node,found_path[spur_indx+1]))
+                excluded_nodes = exhausted_nodes.union(root_path[:-1])
+
+                spur_path = self.find_earliest_arrival_path(spur_node,excluded_nodes,excluded_edges)
+                if spur_path is None:
+                    continue
+
+                new_path = root_path[:-1] + spur_path
+                if tuple(new_path) in candidate_paths:
+                    continue
+                candidate_paths.add(tuple(new_path))
+                heappush(candidates,(self.node_ends[new_path[-1]],len(new_path),new_path))
+
+        return accepted_paths
+
+    def get_k_best_routes(self,obs_winds=None,k=5,min_dv=const.dv_lowest_total_consider_Mb,num_procs=1,agent_ID='cgr'):
+        """ find the k lowest-latency distinct routes for every observation (see find_k_earliest_arrival_paths())
+
+        :param obs_winds: observation windows to route, defaults to None (all obs in the graph)
+        :type obs_winds: iterable(ObsWindow), optional
+        :param k: max number of routes per obs, defaults to 5
+        :type k: int, optional
+        :param min_dv: least data volume a route can have, defaults to const.dv_lowest_total_consider_Mb
+        :type min_dv: float, optional
+        :param num_procs: number of worker processes to spread the observations across. With 1, everything runs in this process, defaults to 1
+        :type num_procs: int, optional
+        :param agent_ID: agent ID for the data route IDs (which are numbered in order of obs_winds, then route), defaults to 'cgr'
+        :type agent_ID: str, optional
+        :returns: list of data routes for each obs, in order of latency (empty for obs not in the graph or that can't be downlinked)
+        :rtype: {dict}
+        """
+
+        if obs_winds is None:
+            obs_winds = self.obs_node_by_wind.keys()
+        obs_winds = list(obs_winds)
+
+        routed_obs = [obs for obs in obs_winds if obs in self.obs_node_by_wind]
+        args_list = [(self.obs_node_by_wind[obs],k,min_dv) for obs in routed_obs]
+
+        if num_procs > 1 and len(args_list) > 1:
+            #  workers send back node indices rather than routes, so the routes are made here out of this process's window objects
+            with other_tools.get_shared_state_pool_context().Pool(num_procs,initializer=_init_routing_worker,initargs=(self,)) as pool:
+                paths_list = pool.starmap(_run_k_best_worker_task,args_list)
+        else:
+            paths_list = [self.find_k_earliest_arrival_paths(*args) for args in args_list]
+
+        paths_by_obs = dict(zip(routed_obs,paths_list))
+
+        routes_by_obs = {}
+        agent_ID_index = 0
+        for obs in obs_winds:
+            routes_by_obs[obs] = []
+            for path, path_dv in paths_by_obs.get(obs,[]):
+                routes_by_obs[obs].append(self.make_data_route(path,agent_ID,agent_ID_index,dv=path_dv))
+                agent_ID_index += 1
+
+        return routes_by_obs
@@ -7,6 +7,7 @@
 from datetime import datetime, timedelta
 
 from numpy import mean as np_mean
+import numpy as np
 
 from circinus_tools  import time_tools as tt
 from circinus_tools  import  constants as const
@@ -95,38 +96,74 @@ class ObsWindow(ActivityWindow):
 
 
 
-class CommWindow(ActivityWindow):
-    def __init__(self, start, end,window_ID):
-        super(CommWindow, self).__init__(start, end,window_ID)
+def calc_comm_data_vol(rates_mat,start,end,rates_mat_dv_indx=1,wind_desc=None):
+    """
+    Calculates the total data volume that can be sent over a link from start to end. Uses average data rate to determine data volume. Depending on how much the input data rates matrix is decimated, this could lead to over or underestimates of data volume.
 
-    def set_data_vol(self,rates_mat,rates_mat_dv_indx=1):
-        """
-        Calculates the total data volume that can be sent over this link. Uses average data rate to determine data volume. Depending on how much the input data rates matrix is decimated, this could lead to over or underestimates of data volume.
+    This works straight from the raw rates matrix, so that import can figure out whether a window is worth keeping before creating it
 
-        :return:
-        """
+    :param rates_mat: matrix of datarates at each time during the pass. First column is time in MJD, and the following columns are data rates in Mbps
+    :type rates_mat: list or np.ndarray
+    :param start: start of the window
+    :type start: datetime
+    :param end: end of the window
+    :type end: datetime
+    :param rates_mat_dv_indx: column of the data rate to use, defaults to 1
+    :type rates_mat_dv_indx: int, optional
+    :param wind_desc: description of the window for error messages, defaults to None
+    :type wind_desc: optional
+    :returns: data volume in Mb
+    :rtype: {float}
+    """
 
-        # Note: float[num_timepoints][2] rates_mat: matrix of datarates at each time during the pass. First column is time in MJD, and second column is data rate from sat to xsat in Mbps, third is rate from xsat to sat.
+    # Note: float[num_timepoints][2] rates_mat: matrix of datarates at each time during the pass. First column is time in MJD, and second column is data rate from sat to xsat in Mbps, third is rate from xsat to sat.
 
-        start_mjd = tt.datetime2mjd(self.start)-5/86400.0  # add 5 secs padding to evade any precision problems
-        end_mjd = tt.datetime2mjd(self.end)+5/86400.0  # add 5 secs padding to evade any precision problems
+    start_mjd = tt.datetime2mjd(start)-5/86400.0  # add 5 secs padding to evade any precision problems
+    end_mjd = tt.datetime2mjd(end)+5/86400.0  # add 5 secs padding to evade any precision problems
 
-        #  this is fixed in the structure of the data rates output file
-        rates_mat_tp_indx = 0;
+    #  this is fixed in the structure of the data rates output file
+    rates_mat_tp_indx = 0;
 
+    if isinstance(rates_mat,np.ndarray):
+        # rates matrices from a memory-mapped RatesStore come in as 2D arrays, so just mask out the rows within the window
+        if len(rates_mat) > 0:
+            rates_mat_tps = rates_mat[:,rates_mat_tp_indx]
+            data_rates = rates_mat[(rates_mat_tps >= start_mjd) & (rates_mat_tps <= end_mjd),rates_mat_dv_indx]
+        else:
+            data_rates = []
+    else:
         data_rates = []
         for i in range(len(rates_mat)):
             # if point i is within window -  this should take care of any indexing issues
             if rates_mat[i][rates_mat_tp_indx] >= start_mjd and rates_mat[i][rates_mat_tp_indx] <= end_mjd:
                 data_rates.append(rates_mat[i][rates_mat_dv_indx])
 
-        try:
-            #  take the average of all the data rates we saw and multiply by the duration of the window to get data volume
-            self.data_vol = np_mean(data_rates) * (self.end - self.start).total_seconds()
-            if self.original_data_vol is None:
-                self.original_data_vol = self.data_vol
-        except RuntimeWarning as e:
-            raise RuntimeWarning('Trouble determining average data rate. Probable no time points were found within start and end of window. Ensure that you are not overly decimating data rate calculations in data rates input file (window: %s, exception seen: %s)'%(self,str(e)))
+    try:
+        #  take the average of all the data rates we saw and multiply by the duration of the window to get data volume
+        return np_mean(data_rates) * (end - start).total_seconds()
+    except RuntimeWarning as e:
+        raise RuntimeWarning('Trouble determining average data rate. Probable no time points were found within start and end of window. Ensure that you are not overly decimating data rate calculations in data rates input file (window: %s, exception seen: %s)'%(wind_desc,str(e)))
+
+
+class CommWindow(ActivityWindow):
+    def __init__(self, start, end,window_ID):
+        super(CommWindow, self).__init__(start, end,window_ID)
+
+    def set_data_vol(self,rates_mat,rates_mat_dv_indx=1):
+        """
+        Calculates the total data volume that can be sent over this link. See calc_comm_data_vol()
+
+        :return:
+        """
+
+        self.set_calculated_data_vol(calc_comm_data_vol(rates_mat,self.start,self.end,rates_mat_dv_indx,wind_desc=self))
+
+    def set_calculated_data_vol(self,data_vol):
+        """ set the data volume for this link, as already calculated by calc_comm_data_vol()"""
+
+        self.data_vol = data_vol
+        if self.original_data_vol is None:
+            self.original_data_vol = self.data_vol
 
 
 class DlnkWindow(CommWindow):
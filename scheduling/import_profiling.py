@@ -0,0 +1,121 @@
+# Profiling and counters for window import in SchedIOProcessor
+#
+# When profiling is enabled, SchedIOProcessor swaps the functions it uses for each stage of import (MJD conversion, rate scanning, obs merging, window object construction) for timed versions, and collects the results into a stats dictionary after each import call. When profiling is disabled nothing is wrapped, so there's no overhead.
+
+import time
+import tracemalloc
+from collections import OrderedDict
+
+# names of the import stages that get timed
+IMPORT_STAGES = ['mjd_conversion','rate_scanning','obs_merging','object_construction']
+
+
+class TimedCall():
+    """ callable that times (and optionally counts things for) every call to func, adding the results to a profiler"""
+
+    def __init__(self,profiler,stage,func,counter_name=None,count_func=None):
+        self.profiler = profiler
+        self.stage = stage
+        self.func = func
+        self.counter_name = counter_name
+        self.count_func = count_func
+
+    def __call__(self,*args,**kwargs):
+        start = time.perf_counter()
+        try:
+            return self.func(*args,**kwargs)
+        finally:
+            self.profiler.stage_times_s[self.stage] += time.perf_counter() - start
+            self.profiler.stage_calls[self.stage] += 1
+            if self.counter_name is not None:
+                self.profiler.add_count(self.counter_name,self.count_func(*args,**kwargs))
+
+
+class ImportProfiler():
+    """ collects wall time per import stage, counters and peak memory for a single import call"""
+
+    def __init__(self,import_name,trace_memory=True):
+        """
+        :param import_name: name of the import, for the stats
+        :type import_name: str
+        :param trace_memory: trace peak memory with tracemalloc, defaults to True. Note that tracing makes every allocation slower, so it inflates the stage times - allocation-heavy stages (object construction, obs merging) much more than the others
+        :type trace_memory: bool, optional
+        """
+        self.import_name = import_name
+        self.trace_memory = trace_memory
+
+        self.stage_times_s = OrderedDict((stage,0.0) for stage in IMPORT_STAGES)
+        self.stage_calls = OrderedDict((stage,0) for stage in IMPORT_STAGES)
+        self.counters = OrderedDict()
+
+        self._start_time = None
+        self._started_tracemalloc = False
+        self._mem_baseline = 0
+        #  whether the traced peak was reset at start, so that it only covers this import
+        self._peak_is_own = False
+
+    def timed(self,stage,func,counter_name=None,count_func=None):
+        """ wrap func so that calls to it are timed as part of stage
+
+        :param stage: import stage name (one of IMPORT_STAGES)
+        :type stage: str
+        :param func: function to wrap
+        :type func: callable
+        :param counter_name: if given, also add count_func(*args,**kwargs) to this counter for every call, defaults to None
+        :type counter_name: str, optional
+        :param count_func: function that takes the same args as func and returns a count, defaults to None
+        :type count_func: callable, optional
+        :returns: timed version of func
+        :rtype: {TimedCall}
+        """
+        return TimedCall(self,stage,func,counter_name,count_func)
+
+    def add_count(self,counter_name,count):
+        self.counters[counter_name] = self.counters.get(counter_name,0) + count
+
+    def start(self):
+        if self.trace_memory:
+            if tracemalloc.is_tracing():
+                # somebody else is already tracing, so measure relative to the current usage
+                self._mem_baseline = tracemalloc.get_traced_memory()[0]
+                # reset_peak() is only available from python 3.9. Without it the traced peak may be from before this import, so it can't be used
+                self._peak_is_own = hasattr(tracemalloc,'reset_peak')
+                if self._peak_is_own:
+                    tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+                self._started_tracemalloc = True
+                self._mem_baseline = 0
+                self._peak_is_own = True
+
+        self._start_time = time.perf_counter()
+
+    def stop(self):
+        """ stop profiling and return the collected stats
+
+        :returns: stats dictionary with import name, total wall time, wall time and number of calls for each stage, counters and peak memory increase over the course of the import (None if not tracing memory; if tracemalloc was already tracing and reset_peak() isn't available, this is the increase at the end of the import instead). When tracing memory, the wall times are inflated by tracemalloc, unevenly across stages, so for timing comparisons profile without memory tracing
+        :rtype: {OrderedDict}
+        """
+
+        wall_time_s = time.perf_counter() - self._start_time
+
+        peak_mem_delta_bytes = None
+        if self.trace_memory:
+            current_mem, peak_mem = tracemalloc.get_traced_memory()
+            if self._peak_is_own:
+                peak_mem_delta_bytes = peak_mem - self._mem_baseline
+            else:
+                #  fall back on the memory increase at the end of the import, which is a lower bound on the peak increase
+                peak_mem_delta_bytes = max(current_mem - self._mem_baseline,0)
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+        stats = OrderedDict()
+        stats['import'] = self.import_name
+        stats['wall_time_s'] = wall_time_s
+        stats['stage_times_s'] = OrderedDict(self.stage_times_s)
+        stats['stage_calls'] = OrderedDict(self.stage_calls)
+        stats['counters'] = OrderedDict(self.counters)
+        stats['peak_mem_delta_bytes'] = peak_mem_delta_bytes
+        return stats
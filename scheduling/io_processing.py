@@ -7,24 +7,307 @@
 # TODO: this file needs to be scrubbed to fix inconsistent usage of "flat" windows terminology
 
 import collections 
+import functools
+import inspect
 from copy import copy, deepcopy
+from datetime import timedelta
+
+import numpy as np
 
 from circinus_tools  import time_tools as tt
 from circinus_tools  import io_tools
+from circinus_tools  import other_tools
 from circinus_tools  import  constants as const
-from circinus_tools.scheduling.custom_window import   ObsWindow,  DlnkWindow, XlnkWindow, EclipseWindow
+from circinus_tools.scheduling.custom_window import   ObsWindow,  DlnkWindow, XlnkWindow, EclipseWindow, calc_comm_data_vol
 from circinus_tools.scheduling.schedule_objects  import Dancecard
 from circinus_tools.scheduling.routing_objects import LinkInfo
+from circinus_tools.scheduling.window_cache import get_window_cache_key
+from circinus_tools.scheduling.import_profiling import ImportProfiler
+
+# the SchedIOProcessor instance used by import worker processes. Set once per worker by the pool initializer, so that the (potentially very large) input data doesn't have to be sent along with every task
+_import_worker_io_proc = None
+
+def _init_import_worker(io_proc):
+    global _import_worker_io_proc
+    _import_worker_io_proc = io_proc
+
+def _run_import_worker_task(method_name,args):
+    return getattr(_import_worker_io_proc,method_name)(*args)
+
+def run_import_tasks(io_proc,method_name,args_list,num_procs):
+    """ run a SchedIOProcessor method for every set of args in args_list, in a process pool
+
+    :param io_proc: the processor to run the method on (made available to the worker processes once, at pool startup)
+    :type io_proc: SchedIOProcessor
+    :param method_name: name of the method to run
+    :type method_name: str
+    :param args_list: list of args tuples, one per task
+    :type args_list: list(tuple)
+    :param num_procs: number of worker processes
+    :type num_procs: int
+    :returns: list of method return values, in the same order as args_list
+    :rtype: {list}
+    """
+
+    #  the processor holds all of the accesses data, so workers are forked where possible rather than sent a pickled copy of it (see other_tools.get_shared_state_pool_context())
+    with other_tools.get_shared_state_pool_context().Pool(num_procs,initializer=_init_import_worker,initargs=(io_proc,)) as pool:
+        return pool.starmap(_run_import_worker_task,[(method_name,args) for args in args_list])
+
+def get_task_window_uid_ranges(num_winds_by_task,next_window_uid):
+    """ figure out the first window ID for each task, given how many window IDs each task will use up
+
+    This is what lets tasks run in any order (or in parallel) and still produce the same window IDs as running them serially
+
+    :param num_winds_by_task: number of window IDs used by each task, in serial order
+    :type num_winds_by_task: list(int)
+    :param next_window_uid: first window ID for the first task
+    :type next_window_uid: int
+    :returns: first window ID for each task, next window ID after all tasks
+    :rtype: {list(int),int}
+    """
+
+    first_window_uids = []
+    for num_winds in num_winds_by_task:
+        first_window_uids.append(next_window_uid)
+        next_window_uid += num_winds
+
+    return first_window_uids, next_window_uid
+
+def _count_obs_import(profiler,first_window_uid,result):
+    obs_winds, next_window_uid = result
+    num_merged = sum(len(sat_obs_winds) for sat_obs_winds in obs_winds)
+    profiler.add_count('obs_windows_created',num_merged)
+    # the pre-merge obs windows use up the rest of the window IDs
+    profiler.add_count('obs_windows_pre_merge',next_window_uid - first_window_uid - num_merged)
+
+def _count_xlnk_import(profiler,first_window_uid,result):
+    xlnk_winds, xlnk_winds_flat, next_window_uid = result
+    num_created = sum(len(winds) for sat_xlnk_winds in xlnk_winds for winds in sat_xlnk_winds)
+    profiler.add_count('xlnk_windows_created',num_created)
+    profiler.add_count('xlnk_windows_discarded',next_window_uid - first_window_uid - num_created)
+
+def _count_dlnk_import(profiler,first_window_uid,result):
+    dlnk_winds, dlnk_winds_flat, next_window_uid = result
+    num_created = sum(len(winds) for winds in dlnk_winds_flat)
+    profiler.add_count('dlnk_windows_created',num_created)
+    profiler.add_count('dlnk_windows_discarded',next_window_uid - first_window_uid - num_created)
+
+def _count_ecl_import(profiler,first_window_uid,result):
+    ecl_winds, next_window_uid = result
+    profiler.add_count('ecl_windows_created',sum(len(winds) for winds in ecl_winds))
+
+def _count_rates_mat_rows(rates_mat,*args,**kwargs):
+    return len(rates_mat)
+
+def _profiled_import(import_name,count_func=None):
+    """ decorator for SchedIOProcessor import methods that collects import stats into self.last_import_stats when self.profile_import is True
+
+    Imports called from within another profiled import (e.g. from import_all_winds()) add to the outer import's stats.
+
+    :param import_name: name of the import, for the stats
+    :type import_name: str
+    :param count_func: function (profiler, first window ID, import result) that adds window counters to the profiler, defaults to None
+    :type count_func: callable, optional
+    """
+
+    def decorator(func):
+        func_sig = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(self,*args,**kwargs):
+            if not self.profile_import:
+                return func(self,*args,**kwargs)
+
+            bound_args = func_sig.bind(self,*args,**kwargs)
+            bound_args.apply_defaults()
+            first_window_uid = bound_args.arguments['next_window_uid']
+
+            outer_profiler = self._import_profiler
+            profiler = outer_profiler if outer_profiler is not None else ImportProfiler(import_name,trace_memory=self.profile_import_memory)
+
+            if outer_profiler is None:
+                self._set_import_stage_funcs(profiler)
+                profiler.start()
+            try:
+                result = func(self,*args,**kwargs)
+                if count_func is not None:
+                    count_func(profiler,first_window_uid,result)
+            finally:
+                if outer_profiler is None:
+                    self.last_import_stats = profiler.stop()
+                    self.last_import_stats['num_procs'] = bound_args.arguments.get('num_procs',1)
+                    self._set_import_stage_funcs(None)
+
+            return result
+
+        return wrapper
+    return decorator
+
+def get_rows_in_t_slice(rows,t_slice_mjd):
+    """ get the indices of the rows that start within a time slice
+
+    The rows must be sorted by start time (the first column), as they are in the accesses data. The slice bounds are found by binary search, so the cost is proportional to the number of rows in the slice rather than the total number of rows.
+
+    :param rows: rows of [start mjd, ...]
+    :type rows: list
+    :param t_slice_mjd: (start, end) of the slice in MJD. The start is inclusive and the end exclusive, so that consecutive slices don't pick up the same rows. If None, all rows are included
+    :type t_slice_mjd: tuple(float,float)
+    :returns: indices of the rows in the slice
+    :rtype: {range}
+    """
+
+    if t_slice_mjd is None:
+        return range(len(rows))
+
+    def bisect_left(t_mjd):
+        lo = 0
+        hi = len(rows)
+        while lo < hi:
+            mid = (lo+hi)//2
+            if rows[mid][0] < t_mjd:
+                lo = mid+1
+            else:
+                hi = mid
+        return lo
+
+    return range(bisect_left(t_slice_mjd[0]),bisect_left(t_slice_mjd[1]))
+
+def get_rows_overlapping_t_slice(rows,t_slice_mjd,max_row_dur_mjd):
+    """ get the indices of the rows that are ongoing at some point within a time slice
+
+    Same as get_rows_in_t_slice(), except that rows that start before the slice and are still going at its start are included too. Rows can't be binary searched by end time, so this searches back from the start of the slice by the longest row duration and filters by end time from there
+
+    :param rows: rows of [start mjd, end mjd, ...], sorted by start time
+    :type rows: list
+    :param t_slice_mjd: (start, end) of the slice in MJD. Rows that end exactly at the start are included, rows that start exactly at the end are not
+    :type t_slice_mjd: tuple(float,float)
+    :param max_row_dur_mjd: upper bound on the duration of any of the rows, in days
+    :type max_row_dur_mjd: float
+    :returns: indices of the rows overlapping the slice
+    :rtype: {list(int)}
+    """
+
+    candidate_indcs = get_rows_in_t_slice(rows,(t_slice_mjd[0]-max_row_dur_mjd,t_slice_mjd[1]))
+    return [row_indx for row_indx in candidate_indcs if rows[row_indx][1] >= t_slice_mjd[0]]
+
+def validate_sliced_obs_winds(full_obs_winds,sliced_obs_winds):
+    """ check that merged obs windows imported in consecutive slices match those from a full import
+
+    The windows from the slices must not overlap each other on any satellite, and pasting back together the windows that were split at a slice boundary (back-to-back windows with the same targets) must give the same windows as the full import, with the same times and targets. Window IDs aren't compared.
+
+    :param full_obs_winds: obs windows by sat index, from a full import
+    :type full_obs_winds: list(list(ObsWindow))
+    :param sliced_obs_winds: obs windows by sat index from each slice, in any order
+    :type sliced_obs_winds: list(list(list(ObsWindow)))
+    """
+
+    def get_timeline(winds):
+        #  (start, end, targets) for each stretch of time with a constant, non-empty list of targets
+        timeline = []
+        for wind in sorted(winds,key=lambda wind: wind.start):
+            targets = collections.Counter(wind.target_IDs)
+            if len(timeline) > 0:
+                last_start, last_end, last_targets = timeline[-1]
+                if wind.start < last_end:
+                    raise RuntimeWarning('Found overlapping obs windows from slices: %s ends after %s starts'%(last_targets,wind))
+                if wind.start == last_end and targets == last_targets:
+                    timeline[-1] = (last_start,wind.end,last_targets)
+                    continue
+            timeline.append((wind.start,wind.end,targets))
+        return timeline
+
+    for sat_indx, sat_full_obs_winds in enumerate(full_obs_winds):
+        sat_sliced_obs_winds = [wind for slice_obs_winds in sliced_obs_winds for wind in slice_obs_winds[sat_indx]]
+        if not get_timeline(sat_sliced_obs_winds) == get_timeline(sat_full_obs_winds):
+            raise RuntimeWarning('Obs windows from slices do not match full import for sat %d'%(sat_indx))
+
+def save_sat_history_columns(path,columns,compress=True):
+    """ save the output of SchedIOProcessor.make_sat_history_columns() to a .npz file
+
+    :param path: file path
+    :type path: str
+    :param columns: sat history columns
+    :type columns: dict(str: np.ndarray)
+    :param compress: compress the file, defaults to True
+    :type compress: bool, optional
+    """
+
+    if compress:
+        np.savez_compressed(path,**columns)
+    else:
+        np.savez(path,**columns)
+
+def load_sat_history_columns(path):
+    """ load sat history columns saved with save_sat_history_columns()
+
+    :param path: file path
+    :type path: str
+    :returns: sat history columns
+    :rtype: {dict(str: np.ndarray)}
+    """
+
+    with np.load(path) as npz:
+        return collections.OrderedDict ((key,npz[key]) for key in npz.files)
+
+def sat_history_columns_to_outputs(columns):
+    """ turn columnar sat history outputs back into the (JSON-ready) nested list structure from SchedIOProcessor.make_sat_history_outputs()
+
+    :param columns: sat history columns from SchedIOProcessor.make_sat_history_columns()
+    :type columns: dict(str: np.ndarray)
+    :returns: same outputs as make_sat_history_outputs()
+    :rtype: {collections.OrderedDict}
+    """
+
+    def split_by_sat(values,offsets):
+        return [values[offsets[sat_indx]:offsets[sat_indx+1]] for sat_indx in range(len(offsets)-1)]
+
+    obs_offsets = columns['obs_offsets'].tolist()
+    obs_times = [list(times) for times in zip(columns['obs_start_mjd'].tolist(),columns['obs_end_mjd'].tolist())]
+
+    link_outputs = {}
+    for link_type in ['dlnk','xlnk']:
+        offsets = columns['%s_offsets'%(link_type)].tolist()
+        start_mjds = columns['%s_start_mjd'%(link_type)].tolist()
+        end_mjds = columns['%s_end_mjd'%(link_type)].tolist()
+        route_offsets = columns['%s_route_offsets'%(link_type)].tolist()
+        route_ids = columns['%s_route_ids'%(link_type)].tolist()
+
+        # this reproduces str(LinkInfo)
+        link_info_strs = ["routes: ["+", ".join(route_ids[route_offsets[link_indx]:route_offsets[link_indx+1]])+"]" + " ; dv %.0f/%.0f Mb" % (used_dv, total_dv) for link_indx, (used_dv, total_dv) in enumerate(zip(columns['%s_used_dv'%(link_type)].tolist(),columns['%s_total_dv'%(link_type)].tolist()))]
+
+        link_outputs['%s_times_flat'%(link_type)] = split_by_sat([[start_mjd, end_mjd] for start_mjd, end_mjd in zip(start_mjds,end_mjds)],offsets)
+        link_outputs['%s_partners'%(link_type)] = split_by_sat(columns['%s_partners'%(link_type)].tolist(),offsets)
+        link_outputs['%s_link_info_history_flat'%(link_type)] = split_by_sat([[start_mjd, end_mjd, link_info_str] for start_mjd, end_mjd, link_info_str in zip(start_mjds,end_mjds,link_info_strs)],offsets)
+
+    # ordered dictionary so we can preserve order in the output file
+    outputs = collections.OrderedDict ()
+    outputs['obs_times_flat']  = split_by_sat(obs_times,obs_offsets)
+    outputs['obs_locations']  = split_by_sat(columns['obs_locations'].tolist(),obs_offsets)
+    outputs['dlnk_times_flat']  = link_outputs['dlnk_times_flat']
+    outputs['dlnk_partners']  = link_outputs['dlnk_partners']
+    outputs['dlnk_link_info_history_flat']  = link_outputs['dlnk_link_info_history_flat']
+    outputs['xlnk_times_flat']  = link_outputs['xlnk_times_flat']
+    outputs['xlnk_partners']  = link_outputs['xlnk_partners']
+    outputs['xlnk_link_info_history_flat']  = link_outputs['xlnk_link_info_history_flat']
+    return outputs
 
 class SchedIOProcessor():
     """docstring for GPInputProcessor"""
 
-    def __init__(self,module_params):
+    def __init__(self,module_params,accesses_store=None,rates_store=None,profile_import=False,profile_import_memory=True):
         """initializes based on parameters
         
         initializes based on parameters
         :param module_params: global namespace parameters created from input files (possibly with some small non-structural modifications to params). The name spaces here should trace up all the way to the input files. (e.g. sim_params, gp_params)
         :type params: dict
+        :param accesses_store: if provided, the accesses data (obs/dlnk/xlnk/eclipse times and rates) are read lazily from this on-disk store rather than from module_params['data_rates_params'], defaults to None
+        :type accesses_store: accesses_store.AccessesStore, optional
+        :param rates_store: if provided, the xlnk and dlnk rates are read from this memory-mapped store (overriding those from accesses_store or module_params), defaults to None
+        :type rates_store: accesses_store.RatesStore, optional
+        :param profile_import: collect timing, counter and memory stats for each import call into self.last_import_stats, defaults to False
+        :type profile_import: bool, optional
+        :param profile_import_memory: when profiling imports, also trace peak memory with tracemalloc. Tracing slows down allocation-heavy stages (object construction, obs merging) much more than the others, so turn this off to get representative stage times, defaults to True
+        :type profile_import_memory: bool, optional
         """
 
         #  assume modified Julian date for now. todo: make this a parameter
@@ -35,8 +318,21 @@ class SchedIOProcessor():
         obs_params = module_params['orbit_prop_params']['obs_params']
         gs_params = module_params['orbit_prop_params']['gs_params']
         gp_general_other_params = module_params['gp_general_params']['other_params']
-        data_rates_accesses_params = module_params['data_rates_params']['accesses_data_rates']
-        data_rates_other_params = module_params['data_rates_params']['other_data']
+
+        # the accesses data either comes from the data rates params (fully in memory), or is read block by block from an on-disk store
+        self.accesses_store = accesses_store
+        if accesses_store is None:
+            data_rates_accesses_params = module_params['data_rates_params']['accesses_data_rates']
+            data_rates_other_params = module_params['data_rates_params']['other_data']
+        else:
+            data_rates_accesses_params = {kind: getattr(accesses_store,kind) for kind in ['obs_times','dlnk_times','dlnk_rates','xlnk_times','xlnk_rates']}
+            data_rates_other_params = {'eclipse_times': accesses_store.eclipse_times}
+
+        self.rates_store = rates_store
+        if rates_store is not None:
+            data_rates_accesses_params = dict(data_rates_accesses_params)
+            data_rates_accesses_params['xlnk_rates'] = rates_store.xlnk_rates
+            data_rates_accesses_params['dlnk_rates'] = rates_store.dlnk_rates
 
         self.link_disables = module_params['orbit_link_params']['link_disables']
         self.sat_id_order = sat_params['sat_id_order']
@@ -82,54 +378,121 @@ class SchedIOProcessor():
 
         self.use_symmetric_xlnk_windows = gp_general_other_params['use_symmetric_xlnk_windows']
 
+        # longest raw obs duration, in days. Only needed (and only computed) for importing obs in slices
+        self._max_obs_dur_mjd = None
+
+        # import profiling. Stats from the most recent import call go in last_import_stats. Note that with a process pool, stage times and rate rows scanned only cover work done in this process
+        self.profile_import = profile_import
+        self.profile_import_memory = profile_import_memory
+        self.last_import_stats = None
+        self._import_profiler = None
+        self._set_import_stage_funcs(None)
+
+    def _set_import_stage_funcs(self,profiler):
+        """ set the functions used for each stage of import - timed versions if profiler is given, otherwise the plain functions
+
+        Note that the merged obs windows are created within obs merging, so their construction time counts towards obs merging rather than object construction
+        """
+
+        self._import_profiler = profiler
+
+        stage_funcs = {
+            '_mjd2datetime': ('mjd_conversion',tt.mjd2datetime,None,None),
+            '_calc_comm_data_vol': ('rate_scanning',calc_comm_data_vol,'rate_rows_scanned',_count_rates_mat_rows),
+            '_merge_sat_obs_windows': ('obs_merging',self.merge_sat_obs_windows,None,None),
+            '_ObsWindow': ('object_construction',ObsWindow,None,None),
+            '_XlnkWindow': ('object_construction',XlnkWindow,None,None),
+            '_DlnkWindow': ('object_construction',DlnkWindow,None,None),
+            '_EclipseWindow': ('object_construction',EclipseWindow,None,None),
+        }
+
+        for attr, (stage,func,counter_name,count_func) in stage_funcs.items():
+            if profiler is None:
+                setattr(self,attr,func)
+            else:
+                setattr(self,attr,profiler.timed(stage,func,counter_name,count_func))
+
 
-    def merge_sat_obs_windows(self,obs_window_list,next_window_uid):
+    def merge_sat_obs_windows(self,obs_window_list,next_window_uid,merge_end=None,emit_start=None,emit_end=None):
         '''
         Use obs_window_list to create a new list of non-overlapping obs windows, in which each obs activity includes a list of ALL targets being observed at all times.
 
         :param obs_window_list: the old list of possibly-overlapping obs windows
         :param next_window_uid: unique window ID for unique identification of the windows
+        :param merge_end: end of the timestep grid to merge over (the grid always starts at scenario start). Defaults to scenario end
+        :param emit_start: if given, only output the merged windows from this time on, cutting off any window that starts before it. Should be on the timestep grid. Defaults to None
+        :param emit_end: if given, only output the merged windows up to this time, cutting off any window that runs past it. Should be on the timestep grid. Defaults to None
         :return: new obs list with non-overlapping obs events that replaces input obs_window_list
         '''
 
-        dc_target_IDs = Dancecard(self.scenario_start, self.scenario_end, self.tstep_sec)
+        # This is an event sweep over the timestep grid for the scenario (the same grid as a Dancecard spanning the scenario). The multiset of targets being observed can only change at a timestep where some obs starts or ends, so we only visit those timesteps instead of walking every timestep in the scenario. The output windows (including snapping of start/end times to timestep boundaries) are the same as for painting every obs into a dancecard and comparing the target lists at every timestep.
+
+        if merge_end is None:
+            merge_end = self.scenario_end
+
+        num_timesteps = int((merge_end - self.scenario_start).total_seconds() / self.tstep_sec)
 
         sat_indx = obs_window_list[0].sat_indx
 
-        # populate the dancecard with the obs targets at each time
-        for obs in obs_window_list:
+        # find the timesteps at which each obs starts and stops being ongoing. keys are timestep indices, values are lists of indices into obs_window_list
+        obs_starts_by_ts_indx = {}
+        obs_ends_by_ts_indx = {}
+        for obs_list_indx, obs in enumerate(obs_window_list):
             obs_start = obs.start
             obs_end = obs.end
-            if obs_start > self.scenario_end:
+            if obs_start > merge_end:
                 continue
-            elif obs_end > self.scenario_end:
-                obs_end = self.scenario_end
+            elif obs_end > merge_end:
+                obs_end = merge_end
 
-            obs_start_indx = dc_target_IDs.get_ts_indx_from_t(obs_start)
-            obs_end_indx = dc_target_IDs.get_ts_indx_from_t(obs_end)
+            obs_start_indx = max(Dancecard.get_ts_indx(obs_start, self.scenario_start, self.tstep_sec),0)
+            obs_end_indx = Dancecard.get_ts_indx(obs_end, self.scenario_start, self.tstep_sec)
 
             # if we're at end of scenario, just discard that very last point. Should have unmeasurable effect on results
-            obs_end_indx = min(obs_end_indx,dc_target_IDs.num_timesteps-1)
+            obs_end_indx = min(obs_end_indx,num_timesteps-1)
 
-            for indx in range(obs_start_indx,obs_end_indx+1): #  make sure to include end index (because we are using "timesteps" here, which indicate that the obs is ongoing during the timestep)
-                dc_target_IDs.dancecard[indx] += obs.target_IDs
+            if obs_end_indx < obs_start_indx:
+                continue
 
-        curr_id_list = dc_target_IDs.dancecard[0]
+            # the obs is ongoing from obs_start_indx through obs_end_indx (inclusive - because we are using "timesteps" here, which indicate that the obs is ongoing during the timestep). So it's no longer ongoing at the timestep after that
+            obs_starts_by_ts_indx.setdefault(obs_start_indx,[]).append(obs_list_indx)
+            obs_ends_by_ts_indx.setdefault(obs_end_indx+1,[]).append(obs_list_indx)
+
+        # only need to look at timesteps within the scenario
+        event_ts_indcs = sorted(ts_indx for ts_indx in set(obs_starts_by_ts_indx.keys()) | set(obs_ends_by_ts_indx.keys()) if ts_indx < num_timesteps)
+
+        #  indices of the obs that are currently ongoing
+        active_obs_list_indcs = set()
+
+        curr_id_list = []
         obs_start = copy(self.scenario_start)
         new_obs_window_list = []
         sat_target_indx = 0
-        for indx, target_ID_list in enumerate(dc_target_IDs.dancecard):
+        for indx in event_ts_indcs:
+            active_obs_list_indcs.difference_update(obs_ends_by_ts_indx.get(indx,[]))
+            active_obs_list_indcs.update(obs_starts_by_ts_indx.get(indx,[]))
+
+            # targets are listed in the same order as obs_window_list, same as they would be in a dancecard
+            target_ID_list = [target_ID for obs_list_indx in sorted(active_obs_list_indcs) for target_ID in obs_window_list[obs_list_indx].target_IDs]
+
+            # at the first timestep there is no previous set of targets to compare with
+            if indx == 0:
+                curr_id_list = target_ID_list
+                continue
 
             # check if lists have the all the same elements in each other (order not important)
             if not collections.Counter(target_ID_list) == collections.Counter(curr_id_list):
-                # obs_end = self.scenario_start + timedelta(seconds=(indx+1)*self.tstep_sec)
-                obs_end = dc_target_IDs.get_pre_tp_from_ts_indx(indx+1)  # plus one on index because we're looking for abs time after last timestep
+                obs_end = self.scenario_start + timedelta(seconds=(indx+1)*self.tstep_sec)  # plus one on index because we're looking for abs time after last timestep
 
                 # todo: should probably add filtering for minimum length observations here
 
-                if len(curr_id_list) > 0:  # if it's not empty
+                #  cut the window down to the stretch of time we're outputting
+                emit_obs_start = max(obs_start,emit_start) if emit_start is not None else obs_start
+                emit_obs_end = min(obs_end,emit_end) if emit_end is not None else obs_end
+
+                if len(curr_id_list) > 0 and emit_obs_start < emit_obs_end:  # if it's not empty
                     # create a new observation based on the previous set of targets
-                    new_obs_window_list.append(ObsWindow(next_window_uid,sat_indx,curr_id_list,sat_target_indx=sat_target_indx,start=obs_start,end=obs_end))
+                    new_obs_window_list.append(ObsWindow(next_window_uid,sat_indx,curr_id_list,sat_target_indx=sat_target_indx,start=emit_obs_start,end=emit_obs_end))
                     next_window_uid += 1
                     sat_target_indx += 1
 
@@ -139,104 +502,286 @@ class SchedIOProcessor():
 
         return new_obs_window_list,next_window_uid
 
-    def import_obs_winds( self,next_window_uid=0):
+    def _get_t_slice_mjd(self,t_from,t_to):
+        """ convert a [t_from,t_to) import slice to MJD, or None if not slicing"""
+
+        if t_from is None and t_to is None:
+            return None
+
+        if self.input_date_format != const.MODIFIED_JULIAN_DATE:
+            raise NotImplementedError
+
+        return (tt.datetime2mjd(t_from) if t_from is not None else float('-inf'), tt.datetime2mjd(t_to) if t_to is not None else float('inf'))
+
+    def _get_obs_slice(self,t_from,t_to):
+        """ figure out which raw obs are needed to import a [t_from,t_to) slice, and which stretch of the merged obs timeline the slice outputs
+
+        The merged obs windows are cut at timestep boundaries tied to t_from and t_to, so consecutive slices output back-to-back stretches of the same merged timeline that a full import gives. A merged window that runs across a boundary is split between the two slices. The target list at any time only depends on the obs ongoing within a timestep or so of it, so every raw obs that's ongoing near the output stretch is merged, including ones that started before t_from.
+
+        :returns: None if not slicing, otherwise (MJD slice of raw obs to merge, start of merged output, end of merged output)
+        :rtype: {tuple(tuple(float,float),datetime,datetime)}
+        """
+
+        if t_from is None and t_to is None:
+            return None
+
+        if self.input_date_format != const.MODIFIED_JULIAN_DATE:
+            raise NotImplementedError
+
+        def get_emit_boundary(t):
+            # the target list in effect from the end of a timestep on is the one for that timestep (see merge_sat_obs_windows()), so the boundary for t is the end of the timestep t is in. The first timestep's target list goes back to scenario start
+            ts_indx = Dancecard.get_ts_indx(t, self.scenario_start, self.tstep_sec)
+            if ts_indx <= 0:
+                return self.scenario_start
+            return self.scenario_start + timedelta(seconds=(ts_indx+1)*self.tstep_sec)
+
+        emit_start = get_emit_boundary(t_from) if t_from is not None else None
+        emit_end = get_emit_boundary(t_to) if t_to is not None else None
+
+        #  the output from emit_start on depends on the obs ongoing from the timestep before the one emit_start ends. The output up to emit_end only depends on obs starting before it. Both are padded a little, which is safe because extra obs only affect the output outside of [emit_start,emit_end)
+        raw_slice_mjd = (
+            tt.datetime2mjd(emit_start - timedelta(seconds=2*self.tstep_sec)) if emit_start is not None else float('-inf'),
+            tt.datetime2mjd(emit_end) if emit_end is not None else float('inf')
+        )
+
+        return raw_slice_mjd, emit_start, emit_end
+
+    def _get_max_obs_dur_mjd(self):
+        """ longest raw obs duration across all sats and targets, in days (for finding the obs ongoing at the start of an import slice)"""
+
+        if self._max_obs_dur_mjd is None:
+            self._max_obs_dur_mjd = max((obs[1]-obs[0] for sat_obs in self.obs_times for target_obs in sat_obs for obs in target_obs),default=0.0)
+        return self._max_obs_dur_mjd
+
+    def _get_raw_obs_indcs(self,target_obs,obs_slice):
+        """ indices of the raw obs for a single sat and target that go into the merge, given the output of _get_obs_slice()"""
+
+        if obs_slice is None:
+            return range(len(target_obs))
+        return get_rows_overlapping_t_slice(target_obs,obs_slice[0],self._get_max_obs_dur_mjd())
+
+    def _count_sat_raw_obs_winds(self,sat_indx,obs_slice=None):
+        """ number of window IDs used up creating the (pre-merge) obs windows for sat_indx"""
+        return sum(len(self._get_raw_obs_indcs(target_obs,obs_slice)) for targ_indx, target_obs in enumerate(self.obs_times[sat_indx]) if not self.all_targ_IDs[targ_indx] in self.targ_id_ignore_list)
+
+    def _make_sat_obs_winds(self,sat_indx,next_window_uid,next_merged_window_uid,obs_slice=None):
+        """ create the merged obs windows for a single satellite
+
+        :param sat_indx: satellite index
+        :type sat_indx: int
+        :param next_window_uid: first window ID to use for the (pre-merge) obs windows
+        :type next_window_uid: int
+        :param next_merged_window_uid: first window ID to use for the merged obs windows
+        :type next_merged_window_uid: int
+        :param obs_slice: if not None, only make the merged windows for the stretch of time given by this output of _get_obs_slice(), defaults to None
+        :type obs_slice: tuple, optional
+        :returns: merged obs windows, next window ID after the pre-merge obs windows, next window ID after the merged obs windows
+        :rtype: {list(ObsWindow),int,int}
+        """
+
+        sat_obs_winds = []
+
+        for targ_indx, target_obs in enumerate(self.obs_times[sat_indx]):
+            targ_id = self.all_targ_IDs[targ_indx]
+
+            if targ_id in self.targ_id_ignore_list:
+                continue
+
+            for obs_indx in self._get_raw_obs_indcs(target_obs,obs_slice):
+                obs = target_obs[obs_indx]
+
+                #   convert input date format over to datetime
+                if self.input_date_format == const.MODIFIED_JULIAN_DATE:
+                    start =self._mjd2datetime(obs[0])
+                    end=self._mjd2datetime(obs[1])
+                else:
+                    raise NotImplementedError
+
+                sat_obs_winds.append(self._ObsWindow(next_window_uid,sat_indx,[targ_id],sat_target_indx=obs_indx,start= start,end= end))
+                next_window_uid+=1
+
+        if sat_obs_winds:
+            # when importing a slice, extend the merge grid just past the end of the last raw obs, so that every merged window gets closed off (the grid is still aligned with scenario start). Then only output the slice's stretch of the merged timeline
+            merge_end = None
+            emit_start = None
+            emit_end = None
+            if obs_slice is not None:
+                merge_end = min(max(wind.end for wind in sat_obs_winds) + timedelta(seconds=2*self.tstep_sec),self.scenario_end)
+                dummy, emit_start, emit_end = obs_slice
+
+            sat_obs_winds,next_merged_window_uid = self._merge_sat_obs_windows(sat_obs_winds,next_merged_window_uid,merge_end,emit_start,emit_end)
+            for wind in sat_obs_winds:
+                wind.set_data_vol(self.pl_data_rate)
+
+        return sat_obs_winds, next_window_uid, next_merged_window_uid
+
+    @_profiled_import('obs',_count_obs_import)
+    def import_obs_winds( self,next_window_uid=0,num_procs=1,t_from=None,t_to=None):
         """  Turn observation times into observation windows
 
         Parse input data structure to create observation windows. Uses
           indexing  of the input data structure
-        
-        :returns: [description]
-        :rtype: {[type]}
+
+        Each satellite is processed independently, so if num_procs > 1 the satellites are processed in a process pool. The windows (and window IDs) are exactly the same as for serial processing.
+
+        :param next_window_uid: first window ID to use, defaults to 0
+        :type next_window_uid: int, optional
+        :param num_procs: number of processes to use, defaults to 1 (serial)
+        :type num_procs: int, optional
+        :param t_from: if given, only import the merged obs from (the end of the timestep containing) this time on, for importing a slice of the scenario, e.g. when extending the planning horizon. Obs that started before t_from but are still going are merged in too, see _get_obs_slice(). Defaults to None
+        :type t_from: datetime, optional
+        :param t_to: if given, only import the merged obs up to (the end of the timestep containing) this time, defaults to None
+        :type t_to: datetime, optional
+        :returns: obs windows by sat index, next window ID
+        :rtype: {list(list(ObsWindow)),int}
         """
-        obs_winds = []
-        for sat_indx, all_sat_obs in enumerate(self.obs_times):
-            sat_obs_winds = []
 
-            for targ_indx, target_obs in enumerate(all_sat_obs):
-                targ_id = self.all_targ_IDs[targ_indx]
+        obs_slice = self._get_obs_slice(t_from,t_to)
 
-                if targ_id in self.targ_id_ignore_list:
-                    continue
+        #  first all of the pre-merge obs windows get IDs, then the merged obs windows get IDs, in order of satellite index
+        if num_procs > 1:
+            first_window_uids,next_window_uid = get_task_window_uid_ranges([self._count_sat_raw_obs_winds(sat_indx,obs_slice) for sat_indx in range(len(self.obs_times))],next_window_uid)
 
-                for obs_indx, obs in enumerate(target_obs):
+            # we don't know how many merged windows each satellite will have until the merge is done, so merge with IDs starting at zero and then shift them into place
+            results = run_import_tasks(self,'_make_sat_obs_winds',[(sat_indx,first_window_uids[sat_indx],0,obs_slice) for sat_indx in range(len(self.obs_times))],num_procs)
 
-                    #   convert input date format over to datetime
-                    if self.input_date_format == const.MODIFIED_JULIAN_DATE:
-                        start =tt.mjd2datetime(obs[0])
-                        end=tt.mjd2datetime(obs[1])
-                    else:
-                        raise NotImplementedError
+            obs_winds = []
+            for sat_obs_winds, dummy, num_merged in results:
+                for wind in sat_obs_winds:
+                    wind.window_ID += next_window_uid
+                next_window_uid += num_merged
+                obs_winds.append(sat_obs_winds)
 
-                    sat_obs_winds.append(ObsWindow(next_window_uid,sat_indx,[targ_id],sat_target_indx=obs_indx,start= start,end= end))
-                    next_window_uid+=1
+            return obs_winds, next_window_uid
 
+        next_merged_window_uid = next_window_uid + sum(self._count_sat_raw_obs_winds(sat_indx,obs_slice) for sat_indx in range(len(self.obs_times)))
+
+        obs_winds = []
+        for sat_indx in range(len(self.obs_times)):
+            sat_obs_winds,next_window_uid,next_merged_window_uid = self._make_sat_obs_winds(sat_indx,next_window_uid,next_merged_window_uid,obs_slice)
             obs_winds.append(sat_obs_winds)
 
-        for sat_indx in range(self.num_sats):
-            if obs_winds[sat_indx]:
-                new_windows,next_window_uid = self.merge_sat_obs_windows(obs_winds[sat_indx],next_window_uid)
-                for wind in new_windows:
-                    wind.set_data_vol(self.pl_data_rate)
-                obs_winds[sat_indx] = new_windows
+        return obs_winds, next_merged_window_uid
 
-        return obs_winds, next_window_uid
+    def _make_sat_xlnk_winds(self,sat_indx,next_window_uid,t_slice_mjd=None):
+        """ create the xlnk windows between sat_indx and all higher sat indices
 
-    def import_xlnk_winds( self, next_window_uid=0, sort= True):
-        xlink_winds_flat = [[] for i in range(self.num_sats)]
-        xlink_winds = [[[] for j in range(self.num_sats)] for i in range(self.num_sats)]
-        for sat_indx in range(self.num_sats):
-            # xlnk_times  matrix should be symmetrical, so there's no reason to look at lower left  triangle
-            sat_id = self.sat_id_order[sat_indx]
+        If t_slice_mjd is given, only windows that start within that (start, end) MJD slice are made
 
-            for xsat_indx in range(sat_indx+1,self.num_sats):
-                xsat_id = self.sat_id_order[xsat_indx]
-                xlnk_list = self.xlnk_times[sat_indx][xsat_indx]
+        :returns: list of xlnk windows for each xsat_indx (empty for xsat_indx <= sat_indx), next window ID
+        :rtype: {list(list(XlnkWindow)),int}
+        """
 
-                for xlnk_indx, xlnk in enumerate(xlnk_list):
+        xlink_winds_sat = [[] for j in range(self.num_sats)]
 
-                    #   convert input date format over to datetime
-                    if self.input_date_format == const.MODIFIED_JULIAN_DATE:
-                        start =tt.mjd2datetime(xlnk[0])
-                        end=tt.mjd2datetime(xlnk[1])
-                    else:
-                        raise NotImplementedError
+        # xlnk_times  matrix should be symmetrical, so there's no reason to look at lower left  triangle
+        sat_id = self.sat_id_order[sat_indx]
 
-                    # first satellite is transmitting
-                    sat_indx_tx = bool(xlnk[2])
-                    # second satellite is transmitting
-                    xsat_indx_tx = bool(xlnk[3])
-                    #  if their data rates are both the same and they are both transmitting, then the cross-link window is symmetric
-                    symmetric = bool(xlnk[4]) and (sat_indx_tx and xsat_indx_tx)
+        for xsat_indx in range(sat_indx+1,self.num_sats):
+            xsat_id = self.sat_id_order[xsat_indx]
+            xlnk_list = self.xlnk_times[sat_indx][xsat_indx]
 
-                    xlnk_rates_mat =  self.xlnk_rates[sat_indx][xsat_indx][xlnk_indx]
+            # the direction enables are the same for every xlnk between these two sats
+            sat_tx_enable = io_tools.xlnk_direction_enabled(sat_id,xsat_id,self.link_disables)
+            xsat_tx_enable = io_tools.xlnk_direction_enabled(xsat_id,sat_id,self.link_disables)
 
-                    def make_xlnk_wind(symmetric,tx_sat,next_window_uid, rates_mat_dv_indx):
-                        # create a new window 
-                        new_wind = XlnkWindow(next_window_uid,sat_indx,xsat_indx,xlnk_indx, start, end, symmetric,tx_sat)
+            for xlnk_indx in get_rows_in_t_slice(xlnk_list,t_slice_mjd):
+                xlnk = xlnk_list[xlnk_indx]
 
-                        # figure out the data volume for this window
-                        new_wind.set_data_vol(xlnk_rates_mat,rates_mat_dv_indx)
+                # first satellite is transmitting
+                sat_indx_tx = bool(xlnk[2])
+                # second satellite is transmitting
+                xsat_indx_tx = bool(xlnk[3])
+                #  if their data rates are both the same and they are both transmitting, then the cross-link window is symmetric
+                symmetric = bool(xlnk[4]) and (sat_indx_tx and xsat_indx_tx)
 
-                        if new_wind.data_vol >  self.min_allowed_dv_xlnk:
-                            #  add to regular matrix
-                            xlink_winds[sat_indx][xsat_indx].append(new_wind)
-                            # add it to the  flat lists for the sats on both ends of the crosslink. Note that the same object is stored for both, so any modification of the object by one sat modifies it for the other sat as well
-                            xlink_winds_flat[sat_indx].append(new_wind)
-                            xlink_winds_flat[xsat_indx].append(new_wind)
+                #  figure out which windows this xlnk could turn into (symmetric, tx sat, rates matrix column) before doing any of the more expensive work
+                #  if it's a symmetric cross-link only make one window
+                if symmetric and self.use_symmetric_xlnk_windows:
+                    wind_options = [(True,None,1)]
+                #  otherwise, we have to make a window for each of the satellites that is transmitting
+                else:
+                    wind_options = []
+                    if sat_indx_tx and sat_tx_enable: wind_options.append((False,sat_indx,1))
+                    if xsat_indx_tx and xsat_tx_enable: wind_options.append((False,xsat_indx,2))
 
-                        return next_window_uid+1
+                if len(wind_options) == 0:
+                    continue
 
-                    #  if it's a symmetric cross-link only make one window
-                    if symmetric and self.use_symmetric_xlnk_windows:
-                        next_window_uid = make_xlnk_wind(True,None,next_window_uid,rates_mat_dv_indx=1)
-                    #  otherwise, we have to make a window for each of the satellites that is transmitting
-                    else:
-                        sat_tx_enable = io_tools.xlnk_direction_enabled(sat_id,xsat_id,self.link_disables) if sat_indx_tx else False
-                        xsat_tx_enable = io_tools.xlnk_direction_enabled(xsat_id,sat_id,self.link_disables) if xsat_indx_tx else False
+                #   convert input date format over to datetime
+                if self.input_date_format == const.MODIFIED_JULIAN_DATE:
+                    start =self._mjd2datetime(xlnk[0])
+                    end=self._mjd2datetime(xlnk[1])
+                else:
+                    raise NotImplementedError
+
+                # a window with no duration has no data volume, so don't bother with the data rates. Still use up the window IDs, so that IDs don't depend on which windows are kept
+                if (end - start).total_seconds() <= 0 and self.min_allowed_dv_xlnk >= 0:
+                    next_window_uid += len(wind_options)
+                    continue
 
-                        if sat_indx_tx and sat_tx_enable: next_window_uid = make_xlnk_wind( False,sat_indx,next_window_uid,rates_mat_dv_indx=1)
-                        if xsat_indx_tx and xsat_tx_enable: next_window_uid = make_xlnk_wind( False,xsat_indx,next_window_uid,rates_mat_dv_indx=2)
+                xlnk_rates_mat =  self.xlnk_rates[sat_indx][xsat_indx][xlnk_indx]
 
+                for wind_symmetric, tx_sat, rates_mat_dv_indx in wind_options:
+                    # figure out the data volume for this window, and only create the window if it's worth keeping
+                    data_vol = self._calc_comm_data_vol(xlnk_rates_mat,start,end,rates_mat_dv_indx,wind_desc='xlnk %d between sats %d and %d'%(xlnk_indx,sat_indx,xsat_indx))
+
+                    if data_vol >  self.min_allowed_dv_xlnk:
+                        new_wind = self._XlnkWindow(next_window_uid,sat_indx,xsat_indx,xlnk_indx, start, end, wind_symmetric,tx_sat)
+                        new_wind.set_calculated_data_vol(data_vol)
+                        xlink_winds_sat[xsat_indx].append(new_wind)
+
+                    next_window_uid += 1
+
+        return xlink_winds_sat, next_window_uid
+
+    @_profiled_import('xlnk',_count_xlnk_import)
+    def import_xlnk_winds( self, next_window_uid=0, sort= True,num_procs=1,t_from=None,t_to=None):
+        """  Turn crosslink times into crosslink windows
+
+        Each satellite (along with all of its crosslinks to higher-index satellites) is processed independently, so if num_procs > 1 the satellites are processed in a process pool. The windows (and window IDs) are exactly the same as for serial processing.
+
+        :param next_window_uid: first window ID to use, defaults to 0
+        :type next_window_uid: int, optional
+        :param sort: sort the flat xlnk window lists by start time, defaults to True
+        :type sort: bool, optional
+        :param num_procs: number of processes to use, defaults to 1 (serial)
+        :type num_procs: int, optional
+        :param t_from: if given, only import xlnks that start at or after this time (for importing a slice of the scenario, e.g. when extending the planning horizon), defaults to None
+        :type t_from: datetime, optional
+        :param t_to: if given, only import xlnks that start before this time, defaults to None
+        :type t_to: datetime, optional
+        :returns: xlnk windows by sat index and xsat index (upper triangle only), xlnk windows by sat index, next window ID
+        :rtype: {list(list(list(XlnkWindow))),list(list(XlnkWindow)),int}
+        """
+
+        t_slice_mjd = self._get_t_slice_mjd(t_from,t_to)
+
+        if num_procs > 1:
+            # we don't know how many window IDs each satellite uses up until its xlnks have been read, and reading them is most of the work, so make the windows with IDs starting at zero and then shift them into place below
+            results = run_import_tasks(self,'_make_sat_xlnk_winds',[(sat_indx,0,t_slice_mjd) for sat_indx in range(self.num_sats)],num_procs)
+        else:
+            results = None
+
+        xlink_winds_flat = [[] for i in range(self.num_sats)]
+        xlink_winds = [[[] for j in range(self.num_sats)] for i in range(self.num_sats)]
+        for sat_indx in range(self.num_sats):
+            if results:
+                xlink_winds_sat, num_window_uids = results[sat_indx]
+                for xsat_winds in xlink_winds_sat:
+                    for wind in xsat_winds:
+                        wind.window_ID += next_window_uid
+                next_window_uid += num_window_uids
+            else:
+                xlink_winds_sat, next_window_uid = self._make_sat_xlnk_winds(sat_indx,next_window_uid,t_slice_mjd)
+
+            for xsat_indx in range(sat_indx+1,self.num_sats):
+                for new_wind in xlink_winds_sat[xsat_indx]:
+                    #  add to regular matrix
+                    xlink_winds[sat_indx][xsat_indx].append(new_wind)
+                    # add it to the  flat lists for the sats on both ends of the crosslink. Note that the same object is stored for both, so any modification of the object by one sat modifies it for the other sat as well
+                    xlink_winds_flat[sat_indx].append(new_wind)
+                    xlink_winds_flat[xsat_indx].append(new_wind)
 
             # sort the xlink windows for convenience
             if sort:
@@ -245,49 +790,116 @@ class SchedIOProcessor():
 
         return  xlink_winds, xlink_winds_flat, next_window_uid
 
-    def import_dlnk_winds( self,next_window_uid=0,sort= True):
-        # Import sat dlnk windows
-        dlink_winds_flat = []
-        dlink_winds = [[[] for j in range(self.num_gs)] for i in range(self.num_sats)]
-        for sat_indx, all_sat_dlnk in enumerate( self.dlnk_times):
-                        
-            sat_dlnk_winds = []
-            sat_id = self.sat_id_order[sat_indx]
+    def _count_sat_dlnk_winds(self,sat_indx,t_slice_mjd=None):
+        """ number of window IDs used up creating the dlnk windows for sat_indx"""
 
-            for gs_indx, dlnk_list in enumerate(all_sat_dlnk):
+        # if we're disabling dlnk for this sat
+        if str(sat_indx) in self.sat_indcs_disable_dlnk:
+            return 0
 
-                # if we're ignoring this GS
-                if self.all_gs_IDs[gs_indx] in self.gs_id_ignore_list:
-                    continue
+        return sum(len(get_rows_in_t_slice(dlnk_list,t_slice_mjd)) for gs_indx, dlnk_list in enumerate(self.dlnk_times[sat_indx]) if not self.all_gs_IDs[gs_indx] in self.gs_id_ignore_list)
 
-                gs_id = self.gs_id_order[gs_indx]
+    def _make_sat_dlnk_winds(self,sat_indx,next_window_uid,t_slice_mjd=None):
+        """ create the dlnk windows for a single satellite
 
-                # if we're disabling dlnk for this sat
-                if str(sat_indx) in self.sat_indcs_disable_dlnk:
-                    break
+        If t_slice_mjd is given, only windows that start within that (start, end) MJD slice are made
 
-                for dlnk_indx, dlnk in enumerate(dlnk_list):
+        :returns: list of dlnk windows for each gs_indx, next window ID
+        :rtype: {list(list(DlnkWindow)),int}
+        """
 
-                    #   convert input date format over to datetime
-                    if self.input_date_format == const.MODIFIED_JULIAN_DATE:
-                        start =tt.mjd2datetime(dlnk[0])
-                        end=tt.mjd2datetime(dlnk[1])
-                    else:
-                        raise NotImplementedError
+        dlink_winds_sat = [[] for j in range(self.num_gs)]
+        sat_id = self.sat_id_order[sat_indx]
+
+        for gs_indx, dlnk_list in enumerate(self.dlnk_times[sat_indx]):
 
-                    new_wind = DlnkWindow(next_window_uid,sat_indx,gs_indx,dlnk_indx,start, end)
+            # if we're ignoring this GS
+            if self.all_gs_IDs[gs_indx] in self.gs_id_ignore_list:
+                continue
+
+            gs_id = self.gs_id_order[gs_indx]
 
-                    rates_mat =  self.dlnk_rates[new_wind.sat_indx][new_wind.gs_indx][new_wind.sat_gs_indx]
-                    new_wind.set_data_vol(rates_mat)
+            # if we're disabling dlnk for this sat
+            if str(sat_indx) in self.sat_indcs_disable_dlnk:
+                break
 
-                    sat_tx_enable = io_tools.dlnk_direction_enabled(sat_id,gs_id,self.link_disables)
+            dlnk_indcs = get_rows_in_t_slice(dlnk_list,t_slice_mjd)
 
-                    if new_wind.data_vol >  self.min_allowed_dv_dlnk and sat_tx_enable:
+            # if dlnks from this sat to this GS are disabled, none of the windows would be kept. Still use up the window IDs, so that IDs don't depend on which windows are kept
+            sat_tx_enable = io_tools.dlnk_direction_enabled(sat_id,gs_id,self.link_disables)
+            if not sat_tx_enable:
+                next_window_uid += len(dlnk_indcs)
+                continue
 
-                        dlink_winds[sat_indx][gs_indx].append (new_wind) 
-                        sat_dlnk_winds.append(new_wind)
+            for dlnk_indx in dlnk_indcs:
+                dlnk = dlnk_list[dlnk_indx]
 
+                #   convert input date format over to datetime
+                if self.input_date_format == const.MODIFIED_JULIAN_DATE:
+                    start =self._mjd2datetime(dlnk[0])
+                    end=self._mjd2datetime(dlnk[1])
+                else:
+                    raise NotImplementedError
+
+                # a window with no duration has no data volume, so don't bother with the data rates
+                if (end - start).total_seconds() <= 0 and self.min_allowed_dv_dlnk >= 0:
                     next_window_uid+=1
+                    continue
+
+                # figure out the data volume for this window, and only create the window if it's worth keeping
+                rates_mat =  self.dlnk_rates[sat_indx][gs_indx][dlnk_indx]
+                data_vol = self._calc_comm_data_vol(rates_mat,start,end,wind_desc='dlnk %d between sat %d and gs %d'%(dlnk_indx,sat_indx,gs_indx))
+
+                if data_vol >  self.min_allowed_dv_dlnk:
+                    new_wind = self._DlnkWindow(next_window_uid,sat_indx,gs_indx,dlnk_indx,start, end)
+                    new_wind.set_calculated_data_vol(data_vol)
+                    dlink_winds_sat[gs_indx].append (new_wind) 
+
+                next_window_uid+=1
+
+        return dlink_winds_sat, next_window_uid
+
+    @_profiled_import('dlnk',_count_dlnk_import)
+    def import_dlnk_winds( self,next_window_uid=0,sort= True,num_procs=1,t_from=None,t_to=None):
+        """  Turn downlink times into downlink windows
+
+        Each satellite is processed independently, so if num_procs > 1 the satellites are processed in a process pool. The windows (and window IDs) are exactly the same as for serial processing.
+
+        :param next_window_uid: first window ID to use, defaults to 0
+        :type next_window_uid: int, optional
+        :param sort: sort the flat dlnk window lists by start time, defaults to True
+        :type sort: bool, optional
+        :param num_procs: number of processes to use, defaults to 1 (serial)
+        :type num_procs: int, optional
+        :param t_from: if given, only import dlnks that start at or after this time (for importing a slice of the scenario, e.g. when extending the planning horizon), defaults to None
+        :type t_from: datetime, optional
+        :param t_to: if given, only import dlnks that start before this time, defaults to None
+        :type t_to: datetime, optional
+        :returns: dlnk windows by sat index and gs index, dlnk windows by sat index, next window ID
+        :rtype: {list(list(list(DlnkWindow))),list(list(DlnkWindow)),int}
+        """
+
+        t_slice_mjd = self._get_t_slice_mjd(t_from,t_to)
+
+        if num_procs > 1:
+            first_window_uids,next_window_uid = get_task_window_uid_ranges([self._count_sat_dlnk_winds(sat_indx,t_slice_mjd) for sat_indx in range(len(self.dlnk_times))],next_window_uid)
+            results = run_import_tasks(self,'_make_sat_dlnk_winds',[(sat_indx,first_window_uids[sat_indx],t_slice_mjd) for sat_indx in range(len(self.dlnk_times))],num_procs)
+        else:
+            results = None
+
+        # Import sat dlnk windows
+        dlink_winds_flat = []
+        dlink_winds = [[[] for j in range(self.num_gs)] for i in range(self.num_sats)]
+        for sat_indx in range(len(self.dlnk_times)):
+            if results:
+                dlink_winds_sat, dummy = results[sat_indx]
+            else:
+                dlink_winds_sat, next_window_uid = self._make_sat_dlnk_winds(sat_indx,next_window_uid,t_slice_mjd)
+
+            sat_dlnk_winds = []
+            for gs_indx in range(self.num_gs):
+                dlink_winds[sat_indx][gs_indx] += dlink_winds_sat[gs_indx]
+                sat_dlnk_winds += dlink_winds_sat[gs_indx]
 
             # sort the downlink windows for convenience
             if sort:
@@ -298,37 +910,183 @@ class SchedIOProcessor():
 
         return dlink_winds,dlink_winds_flat, next_window_uid
 
-    def import_eclipse_winds( self,next_window_uid=0):
+    def _make_sat_ecl_winds(self,sat_indx,next_window_uid,t_slice_mjd=None):
+        """ create the eclipse windows for a single satellite
+
+        If t_slice_mjd is given, only windows that start within that (start, end) MJD slice are made
+
+        :returns: eclipse windows (sorted by start), next window ID
+        :rtype: {list(EclipseWindow),int}
+        """
+
+        sat_ecl_winds = []
+
+        ecl_list = self.eclipse_times[sat_indx]
+        for ecl_indx in get_rows_in_t_slice(ecl_list,t_slice_mjd):
+            ecl = ecl_list[ecl_indx]
+
+            #   convert input date format over to datetime
+            if self.input_date_format == const.MODIFIED_JULIAN_DATE:
+                start =self._mjd2datetime(ecl[0])
+                end=self._mjd2datetime(ecl[1])
+            else:
+                raise NotImplementedError
+
+            sat_ecl_winds.append(self._EclipseWindow(next_window_uid,start= start,end= end))
+            next_window_uid+=1
+
+        #  sort, just in case
+        sat_ecl_winds.sort(key = lambda w: w.start)
+
+        return sat_ecl_winds, next_window_uid
+
+    @_profiled_import('eclipse',_count_ecl_import)
+    def import_eclipse_winds( self,next_window_uid=0,num_procs=1,t_from=None,t_to=None):
         """  Turn Eclipse times into eclipse windows
 
         Parse input data structure to create eclipse windows. Uses
           indexing  of the input data structure
-        
-        :returns: [description]
-        :rtype: {[type]}
+
+        Each satellite is processed independently, so if num_procs > 1 the satellites are processed in a process pool. The windows (and window IDs) are exactly the same as for serial processing.
+
+        :param next_window_uid: first window ID to use, defaults to 0
+        :type next_window_uid: int, optional
+        :param num_procs: number of processes to use, defaults to 1 (serial)
+        :type num_procs: int, optional
+        :param t_from: if given, only import eclipses that start at or after this time (for importing a slice of the scenario, e.g. when extending the planning horizon), defaults to None
+        :type t_from: datetime, optional
+        :param t_to: if given, only import eclipses that start before this time, defaults to None
+        :type t_to: datetime, optional
+        :returns: eclipse windows by sat index, next window ID
+        :rtype: {list(list(EclipseWindow)),int}
         """
-        ecl_winds = []
-        for sat_indx, ecl_times in enumerate(self.eclipse_times):
-            sat_ecl_winds = []
 
-            for ecl_indx, ecl in enumerate(ecl_times):
+        t_slice_mjd = self._get_t_slice_mjd(t_from,t_to)
 
-                #   convert input date format over to datetime
-                if self.input_date_format == const.MODIFIED_JULIAN_DATE:
-                    start =tt.mjd2datetime(ecl[0])
-                    end=tt.mjd2datetime(ecl[1])
-                else:
-                    raise NotImplementedError
-
-                sat_ecl_winds.append(EclipseWindow(next_window_uid,start= start,end= end))
-                next_window_uid+=1
+        if num_procs > 1:
+            first_window_uids,next_window_uid = get_task_window_uid_ranges([len(get_rows_in_t_slice(ecl_times,t_slice_mjd)) for ecl_times in self.eclipse_times],next_window_uid)
+            results = run_import_tasks(self,'_make_sat_ecl_winds',[(sat_indx,first_window_uids[sat_indx],t_slice_mjd) for sat_indx in range(len(self.eclipse_times))],num_procs)
+            return [sat_ecl_winds for sat_ecl_winds, dummy in results], next_window_uid
 
-            #  sort, just in case
-            sat_ecl_winds.sort(key = lambda w: w.start)
+        ecl_winds = []
+        for sat_indx in range(len(self.eclipse_times)):
+            sat_ecl_winds, next_window_uid = self._make_sat_ecl_winds(sat_indx,next_window_uid,t_slice_mjd)
             ecl_winds.append(sat_ecl_winds)
 
         return ecl_winds, next_window_uid
 
+    @_profiled_import('all')
+    def import_all_winds( self,next_window_uid=0,sort=True,num_procs=1,window_cache=None,data_files=None,t_from=None,t_to=None):
+        """ import obs, xlnk, dlnk and eclipse windows (in that order), optionally through an on-disk window cache
+
+        If window_cache is given, the windows are reloaded from the cache when it has an entry for the same inputs, and stored in it otherwise. The window IDs are the same either way. See window_cache.get_window_cache_key() for data_files.
+
+        If t_from and/or t_to are given, only windows that start within [t_from,t_to) are imported. This is meant for extending the planning horizon: import the new slice with next_window_uid continuing from the last import, and the new windows get new IDs. The cost is proportional to the number of windows in the slice. Merged obs windows are the exception: each slice gets the stretch of the merged obs timeline between the timestep boundaries at t_from and t_to, merged from every obs ongoing in that stretch (including obs that started before t_from). A merged window that runs across a boundary is split between the two slices, so consecutive slices never cover the same time twice, and together they cover the same targets at the same times as a full import.
+
+        :param next_window_uid: first window ID to use, defaults to 0
+        :type next_window_uid: int, optional
+        :param sort: sort link windows by start time, defaults to True
+        :type sort: bool, optional
+        :param num_procs: number of worker processes to use for the import, defaults to 1
+        :type num_procs: int, optional
+        :param window_cache: cache to load windows from and store them in, defaults to None
+        :type window_cache: window_cache.WindowCache, optional
+        :param data_files: paths of the data files the accesses data was read from (used for the cache key), defaults to None
+        :type data_files: list(str), optional
+        :param t_from: if given, only import windows that start at or after this time, defaults to None
+        :type t_from: datetime, optional
+        :param t_to: if given, only import windows that start before this time, defaults to None
+        :type t_to: datetime, optional
+        :returns: dict with obs_winds, xlnk_winds, xlnk_winds_flat, dlnk_winds, dlnk_winds_flat, ecl_winds and next_window_uid
+        :rtype: {dict}
+        """
+
+        if window_cache is not None:
+            cache_key = get_window_cache_key(self,{'next_window_uid': next_window_uid,'sort': sort,'t_from': str(t_from),'t_to': str(t_to)},data_files)
+            windows = window_cache.load(cache_key)
+            if windows is not None:
+                return windows
+
+        windows = {}
+        windows['obs_winds'], next_window_uid = self.import_obs_winds(next_window_uid,num_procs=num_procs,t_from=t_from,t_to=t_to)
+        windows['xlnk_winds'], windows['xlnk_winds_flat'], next_window_uid = self.import_xlnk_winds(next_window_uid,sort=sort,num_procs=num_procs,t_from=t_from,t_to=t_to)
+        windows['dlnk_winds'], windows['dlnk_winds_flat'], next_window_uid = self.import_dlnk_winds(next_window_uid,sort=sort,num_procs=num_procs,t_from=t_from,t_to=t_to)
+        windows['ecl_winds'], next_window_uid = self.import_eclipse_winds(next_window_uid,num_procs=num_procs,t_from=t_from,t_to=t_to)
+        windows['next_window_uid'] = next_window_uid
+
+        if window_cache is not None:
+            window_cache.store(cache_key,windows)
+
+        return windows
+
+    def iter_obs_winds( self,next_window_uid=0):
+        """ generator version of import_obs_winds()
+
+        Yields the obs windows satellite by satellite rather than building the full list for all satellites. Paired with an accesses store, this means only the input data for one satellite needs to be in memory at a time. Window IDs are the same as for import_obs_winds()
+
+        :param next_window_uid: first window ID to use, defaults to 0
+        :type next_window_uid: int, optional
+        :returns: generator of (sat index, obs windows for sat, next window ID). The next window ID from the last item is the next window ID after all obs windows
+        :rtype: {generator(tuple(int,list(ObsWindow),int))}
+        """
+
+        #  all of the pre-merge obs windows get IDs before the merged obs windows
+        next_merged_window_uid = next_window_uid + sum(self._count_sat_raw_obs_winds(sat_indx) for sat_indx in range(len(self.obs_times)))
+
+        for sat_indx in range(len(self.obs_times)):
+            sat_obs_winds,next_window_uid,next_merged_window_uid = self._make_sat_obs_winds(sat_indx,next_window_uid,next_merged_window_uid)
+            yield sat_indx, sat_obs_winds, next_merged_window_uid
+
+    def iter_xlnk_winds( self,next_window_uid=0):
+        """ generator version of import_xlnk_winds()
+
+        Yields the xlnk windows for one satellite and all of its higher-index crosslink partners at a time (i.e. by row of the upper triangle of the xlnk matrix). Note that this means the flat list of xlnk windows for a satellite is only complete once all rows up to and including that satellite have been yielded. Window IDs are the same as for import_xlnk_winds()
+
+        :param next_window_uid: first window ID to use, defaults to 0
+        :type next_window_uid: int, optional
+        :returns: generator of (sat index, xlnk windows by xsat index, next window ID)
+        :rtype: {generator(tuple(int,list(list(XlnkWindow)),int))}
+        """
+
+        for sat_indx in range(self.num_sats):
+            xlink_winds_sat, next_window_uid = self._make_sat_xlnk_winds(sat_indx,next_window_uid)
+            yield sat_indx, xlink_winds_sat, next_window_uid
+
+    def iter_dlnk_winds( self,next_window_uid=0,sort=True):
+        """ generator version of import_dlnk_winds()
+
+        Yields the dlnk windows satellite by satellite. Window IDs are the same as for import_dlnk_winds()
+
+        :param next_window_uid: first window ID to use, defaults to 0
+        :type next_window_uid: int, optional
+        :param sort: sort the flat dlnk window list by start time, defaults to True
+        :type sort: bool, optional
+        :returns: generator of (sat index, dlnk windows by gs index, flat dlnk windows for sat, next window ID)
+        :rtype: {generator(tuple(int,list(list(DlnkWindow)),list(DlnkWindow),int))}
+        """
+
+        for sat_indx in range(len(self.dlnk_times)):
+            dlink_winds_sat, next_window_uid = self._make_sat_dlnk_winds(sat_indx,next_window_uid)
+
+            sat_dlnk_winds = [wind for gs_winds in dlink_winds_sat for wind in gs_winds]
+            if sort:
+                sat_dlnk_winds.sort(key=lambda x: x.start)
+
+            yield sat_indx, dlink_winds_sat, sat_dlnk_winds, next_window_uid
+
+    def iter_eclipse_winds( self,next_window_uid=0):
+        """ generator version of import_eclipse_winds()
+
+        :param next_window_uid: first window ID to use, defaults to 0
+        :type next_window_uid: int, optional
+        :returns: generator of (sat index, eclipse windows for sat, next window ID)
+        :rtype: {generator(tuple(int,list(EclipseWindow),int))}
+        """
+
+        for sat_indx in range(len(self.eclipse_times)):
+            sat_ecl_winds, next_window_uid = self._make_sat_ecl_winds(sat_indx,next_window_uid)
+            yield sat_indx, sat_ecl_winds, next_window_uid
+
     def extract_flat_windows( self, routes_flat,  copy_windows= False):
         """ extracts all the activity windows used from a set of routes
         
@@ -341,9 +1099,9 @@ class SchedIOProcessor():
         :rtype: {list(list() by sat_indx),list(list() by sat_indx),list(list() by sat_indx),dict(CommWindow: LinkInfo),dict(CommWindow: list()}
         """
 
-        all_obs = []
-        all_xlnk = []
-        all_dlnk = []
+        obs_flat = [[] for k in range( self.num_sats)]
+        xlnk_flat = [[] for k in range( self.num_sats)]
+        dlnk_flat = [[] for k in range( self.num_sats)]
 
         #  dictionary of named tuples that contain all of the information used for creating output link info.  keys are the window objects themselves
         link_info_by_wind = {}
@@ -351,65 +1109,38 @@ class SchedIOProcessor():
         #  dictionary of route indices, using windows as keys
         route_ids_by_wind  = {}
 
-        def copy_choice(wind):
-            if copy_windows:
-                return deepcopy(wind)
-            else:
-                return wind
+        # the (possibly copied) window object kept for each window seen so far. Windows hash by ID and type, so this dedups in constant time. keys are (window type, window), so that windows of different types are never mixed up
+        kept_wind_by_wind = {}
 
         # dr should be of type DataRoute or DataMultiRoute
         for dr_indx, dr in enumerate (routes_flat):
             for wind in dr.get_winds():
-                # copy the window before we make any changes to it, if so desired
-                wind = copy_choice(wind)
-
-                if type (wind)  == ObsWindow:
-                    if wind in all_obs:
-                        pass
-                    else:
-                        all_obs. append (wind)
-
-                elif type (wind)  == XlnkWindow or type (wind)  == DlnkWindow:
-
-                    if type (wind)  == XlnkWindow:
-
-                        if wind in all_xlnk:
-                            pass
-                        else:
-                            all_xlnk. append (wind)
-
-                    if type (wind)  == DlnkWindow:
-                        if wind in all_dlnk:
-                            pass
-                        else:
-                            all_dlnk. append (wind)
-
+                if not (type(wind),wind) in kept_wind_by_wind:
+                    # first time seeing this window. copy the window before we make any changes to it, if so desired
+                    if copy_windows:
+                        wind = deepcopy(wind)
+                    kept_wind_by_wind[(type(wind),wind)] = wind
+
+                    if type (wind)  == ObsWindow:
+                        obs_flat[wind.sat_indx].append(wind)
+                    elif type (wind)  == XlnkWindow:
+                        xlnk_flat[wind.sat_indx].append(wind)
+                        xlnk_flat[wind.xsat_indx].append(wind)
+                    elif type (wind)  == DlnkWindow:
+                        dlnk_flat[wind.sat_indx].append(wind)
+
+                if type (wind)  == XlnkWindow or type (wind)  == DlnkWindow:
                     #  create link info for this window
-                    if not wind in link_info_by_wind.keys (): 
+                    link_info = link_info_by_wind.get(wind)
+                    if link_info is None:
                         link_info_by_wind[wind]  = LinkInfo ([dr.ID], wind.data_vol, dr.scheduled_dv )
                     else:
                         # note: don't have to grab the original window here because we're only using it as an index
-                        link_info_by_wind[wind].data_routes.append ( dr.ID) 
-                        link_info_by_wind[wind].used_data_vol  +=  dr.scheduled_dv 
+                        link_info.data_routes.append ( dr.ID) 
+                        link_info.used_data_vol  +=  dr.scheduled_dv 
                     
                     #  add the route index  for this window,  initializing a list for the window if needed
-                    if not wind in route_ids_by_wind.keys (): 
-                        route_ids_by_wind[wind] = []
-                    route_ids_by_wind[wind].append (dr.ID)
-
-
-        obs_flat = [[] for k in range( self.num_sats)]
-        xlnk_flat = [[] for k in range( self.num_sats)]
-        dlnk_flat = [[] for k in range( self.num_sats)]
-
-
-        for obs in all_obs: 
-            obs_flat[obs.sat_indx].append(obs)
-        for xlnk in all_xlnk: 
-            xlnk_flat[xlnk.sat_indx].append(xlnk)
-            xlnk_flat[xlnk.xsat_indx].append(xlnk)
-        for dlnk in all_dlnk: 
-            dlnk_flat[dlnk.sat_indx].append(dlnk)
+                    route_ids_by_wind.setdefault(wind,[]).append (dr.ID)
 
         for sat_indx in range ( self.num_sats): 
             obs_flat[sat_indx].sort(key=lambda x: x.start)
@@ -457,8 +1188,6 @@ class SchedIOProcessor():
                 dlnk_partners[sat_indx].append ( wind.gs_indx)
 
 
-        # data_history =self.create_data_history( obs_winds_flat,dlnk_winds_flat,xlnk_winds_flat)
-
         # ordered dictionary so we can preserve order in the output file
         outputs = collections.OrderedDict ()
         outputs['obs_times_flat']  = obs_times_flat 
@@ -473,108 +1202,168 @@ class SchedIOProcessor():
         return outputs
 
 
-    def create_data_history( self,obs_winds_flat,dlink_winds_flat,xlink_winds_flat):
-
-        #  TODO :  haven't verified this code works, need to finish adapting it ( was copied over from small sat 2017 code)
-
-        raise RuntimeWarning('this code has not been updated')
-
-        all_wind = [[] for k in range(self.num_sats)]
-        for sat_indx in range(self.num_sats):
-            for obs in obs_winds_flat[sat_indx]:
-                all_wind[sat_indx].append(obs)
-
-            for dlnk in dlink_winds_flat[sat_indx]:
-                all_wind[sat_indx].append(dlnk)
-
-            for xlnk in xlink_winds_flat[sat_indx]:
-                all_wind[sat_indx].append(xlnk)
-                # all_wind[xlnk.xsat_indx].append(xlnk)
-
-            all_wind[sat_indx].sort(key=lambda x: x.start)
-
-
-        sat_dvs = [0 for i in range(self.num_sats)]
-        data_history =  []
-
-        for sat_indx in range(self.num_sats):
-            data_history_sat = []
-
-            data_history_sat.append([0,0])
+    def make_sat_history_columns (self, obs_winds_flat, xlnk_winds_flat, dlnk_winds_flat, link_info_by_wind):
+        """ columnar version of make_sat_history_outputs()
 
-            latest_time_sec = 0
+        Holds the same information as make_sat_history_outputs(), but as flat numpy arrays rather than nested lists. For each of obs, dlnk and xlnk there is an offsets array of length num_sats+1; the rows for sat_indx are [offsets[sat_indx],offsets[sat_indx+1]) in each of the flat arrays. Times are converted to MJD in one vectorized call. The link info for each link is stored as used/total data volume columns plus the reprs of its data route IDs (with their own per-link offsets), rather than as a string. Use sat_history_columns_to_outputs() to get back the make_sat_history_outputs() structure.
 
-            sat_pkts_state = []
-            sat_dv_from_pkts = 0
+        :param obs_winds_flat: obs windows by sat index
+        :type obs_winds_flat: list(list(ObsWindow))
+        :param xlnk_winds_flat: xlnk windows by sat index
+        :type xlnk_winds_flat: list(list(XlnkWindow))
+        :param dlnk_winds_flat: dlnk windows by sat index
+        :type dlnk_winds_flat: list(list(DlnkWindow))
+        :param link_info_by_wind: link info for each dlnk/xlnk window
+        :type link_info_by_wind: dict(CommWindow: LinkInfo)
+        :returns: dictionary of column arrays
+        :rtype: {dict(str: np.ndarray)}
+        """
 
-            for dummy, wind in enumerate(all_wind[sat_indx]):
-                old_sat_dv = sat_dvs[sat_indx]
-                new_sat_dv = old_sat_dv
-                start_time_sec = (wind.start -  self.scenario_start).total_seconds()
-                end_time_sec = (wind.end -  self.scenario_start).total_seconds()
+        # the windows (in output order) and the partner for each, by link type
+        obs_rows = []
+        obs_locations = []
+        obs_offsets = [0]
+        xlnk_rows = []
+        xlnk_partners = []
+        xlnk_offsets = [0]
+        dlnk_rows = []
+        dlnk_partners = []
+        dlnk_offsets = [0]
 
-                # sanity check
-                # add the tstep_sec/2 to give some sub-timestep wiggle room - sometimes the times calculated for the windows aren't quite on the timestep border
-                print ( start_time_sec)
-                print ( all_wind[sat_indx])
+        for sat_indx in range ( self.num_sats): 
+            for wind in obs_winds_flat[sat_indx]:
+                #  this  observation window could have multiple targets that it seeing, so it gets a row per target
+                for target in wind.target_IDs:
+                    obs_rows.append(wind)
+                    obs_locations.append(target)
+            obs_offsets.append(len(obs_rows))
 
-                if start_time_sec < (latest_time_sec - self.tstep_sec/2):
-                    raise Exception ('create_data_history: problem in data history construction, times wrong')
+            for wind in xlnk_winds_flat[sat_indx]:
+                # same filtering of duplicate windows as in make_sat_history_outputs
+                if wind.sat_indx  > sat_indx or wind.xsat_indx  > sat_indx:
+                    xlnk_rows.append(wind)
+                    xlnk_partners.append(wind.xsat_indx)
+            xlnk_offsets.append(len(xlnk_rows))
 
-                if type(wind) == ObsWindow:
-                    dv_created = wind.collected_data_vol
-                    new_sat_dv +=  dv_created
+            for wind in dlnk_winds_flat[sat_indx]:
+                dlnk_rows.append(wind)
+                dlnk_partners.append(wind.gs_indx)
+            dlnk_offsets.append(len(dlnk_rows))
 
-                    if dv_created != sum(pkt.data_vol for pkt in wind.data_pkts):
-                        raise Exception ('create_data_history: problem 3')
+        columns = collections.OrderedDict ()
 
-                    for pkt in wind.data_pkts:
-                        sat_pkts_state.append(pkt)
+        columns['obs_offsets'] = np.array(obs_offsets,dtype=np.int64)
+        columns['obs_start_mjd'] = tt.datetimes2mjd([wind.start for wind in obs_rows])
+        columns['obs_end_mjd'] = tt.datetimes2mjd([wind.end for wind in obs_rows])
+        columns['obs_locations'] = np.array(obs_locations) if obs_locations else np.array([],dtype=str)
 
-                elif type(wind) == DlnkWindow:
-                    dv_dlnked = wind.routed_data_vol
-                    new_sat_dv -= dv_dlnked
+        for link_type, rows, partners, offsets in [('dlnk',dlnk_rows,dlnk_partners,dlnk_offsets),('xlnk',xlnk_rows,xlnk_partners,xlnk_offsets)]:
+            link_infos = [link_info_by_wind[wind] for wind in rows]
 
-                    if dv_dlnked != sum(pkt.data_vol for pkt in wind.data_pkts):
-                        raise Exception ('create_data_history: problem 4')
+            columns['%s_offsets'%(link_type)] = np.array(offsets,dtype=np.int64)
+            columns['%s_start_mjd'%(link_type)] = tt.datetimes2mjd([wind.start for wind in rows])
+            columns['%s_end_mjd'%(link_type)] = tt.datetimes2mjd([wind.end for wind in rows])
+            columns['%s_partners'%(link_type)] = np.array(partners,dtype=np.int64)
+            columns['%s_used_dv'%(link_type)] = np.array([link_info.used_data_vol for link_info in link_infos],dtype=np.float64)
+            columns['%s_total_dv'%(link_type)] = np.array([link_info.total_data_vol for link_info in link_infos],dtype=np.float64)
 
-                    for pkt in wind.data_pkts:
-                        sat_pkts_state.remove(pkt)
+            route_offsets = np.zeros(len(link_infos)+1,dtype=np.int64)
+            route_offsets[1:] = np.cumsum([len(link_info.data_routes) for link_info in link_infos])
+            columns['%s_route_offsets'%(link_type)] = route_offsets
+            columns['%s_route_ids'%(link_type)] = np.array([repr(dr_id) for link_info in link_infos for dr_id in link_info.data_routes],dtype=str)
 
-                elif type(wind) == XlnkWindow:
-                    for sat_indx_to in wind.routed_data_vol_to_sat_indx.keys():
-                        dv_xlnked = wind.routed_data_vol_to_sat_indx[sat_indx_to]
-                        pkts_xlnked = wind.routed_pkts_to_sat_indx[sat_indx_to]
+        return columns
 
-                        if dv_xlnked != sum(pkt.data_vol for pkt in pkts_xlnked):
-                            raise Exception ('create_data_history: problem 5')
+    def create_data_history( self,routes_flat):
+        """ create the history of stored data volume on each satellite, from a set of scheduled routes
 
-                        if sat_indx_to == sat_indx:
-                            new_sat_dv +=  dv_xlnked
-                            for pkt in pkts_xlnked:
-                                sat_pkts_state.append(pkt)
-                        else:
-                            new_sat_dv -= dv_xlnked
-                            for pkt in pkts_xlnked:
-                                sat_pkts_state.remove(pkt)
+        Every window in every route moves the route's scheduled data volume: an obs adds it to the obs sat, an xlnk moves it from the tx sat to the rx sat and a dlnk removes it from the sat. The data volume is assumed to move at a constant rate over the course of each window (as in the old data history code, which drew a line from the start to the end of each window). The data volume moved through each (sat, window) is first totalled up across all routes in a dictionary, and then each satellite's history is built with a single time-sorted sweep over window start and end events, keeping running totals of the current rate of change and the stored data volume.
 
-                sat_dv_from_pkts = sum(pkt.data_vol for pkt in sat_pkts_state)
+        :param routes_flat: a flat list of all the routes scheduled
+        :type routes_flat: list(DataRoute or DataMultiRoute)
+        :returns: for each sat index, an array of [time, stored data volume] rows (time in seconds since scenario start, data volume in Mb), sorted by time. Data volume changes linearly between rows. If data volume changes instantaneously (zero length window), there are two rows at that time
+        :rtype: {list(np.ndarray)}
+        """
 
-                if new_sat_dv < -0.9:
-                    print('create_data_history: sat data volume < 0')
-                    print('new_sat_dv: '+str(new_sat_dv))
-                    print('sat_dv_from_pkts: '+str(sat_dv_from_pkts))
-                    # 1/0
+        # total data volume moved into (positive) or out of (negative) each sat by each window. keys are (sat_indx,window)
+        dv_delta_by_sat_wind = {}
 
-                data_history_sat.append([start_time_sec, old_sat_dv])
-                data_history_sat.append([end_time_sec, new_sat_dv])
+        def add_dv_delta(sat_indx,wind,dv_delta):
+            key = (sat_indx,wind)
+            dv_delta_by_sat_wind[key] = dv_delta_by_sat_wind.get(key,0) + dv_delta
 
-                sat_dvs[sat_indx] = new_sat_dv
-                latest_time_sec = max(end_time_sec,latest_time_sec)  # use this max in case for some reason the end times of the windows are bouncing around.
+        for route in routes_flat:
+            # DataMultiRoutes schedule data volume separately for each of their DataRoutes
+            if hasattr(route,'data_routes'):
+                dr_dvs = route.scheduled_dv_by_dr.items()
+            else:
+                dr_dvs = [(route,route.scheduled_dv)]
+
+            for dr, dv in dr_dvs:
+                if dv == const.UNASSIGNED:
+                    raise RuntimeWarning('Saw unassigned scheduled data volume for route %s'%(dr))
+
+                for wind in dr.get_winds():
+                    if type(wind) == ObsWindow:
+                        add_dv_delta(wind.sat_indx,wind,dv)
+                    elif type(wind) == XlnkWindow:
+                        tx_sat_indx = dr.window_start_sats[wind]
+                        add_dv_delta(tx_sat_indx,wind,-dv)
+                        add_dv_delta(wind.get_xlnk_partner(tx_sat_indx),wind,dv)
+                    elif type(wind) == DlnkWindow:
+                        add_dv_delta(wind.sat_indx,wind,-dv)
+
+        # (time, change in rate, instantaneous change in dv) events by sat
+        events_by_sat = [[] for sat_indx in range(self.num_sats)]
+        for (sat_indx,wind), dv_delta in dv_delta_by_sat_wind.items():
+            start_time_sec = (wind.start -  self.scenario_start).total_seconds()
+            end_time_sec = (wind.end -  self.scenario_start).total_seconds()
+            duration = end_time_sec - start_time_sec
+
+            if duration > 0:
+                events_by_sat[sat_indx].append((start_time_sec,dv_delta/duration,0))
+                events_by_sat[sat_indx].append((end_time_sec,-dv_delta/duration,0))
+            else:
+                events_by_sat[sat_indx].append((start_time_sec,0,dv_delta))
 
-            data_history.append(data_history_sat)
+        data_history = []
+        for sat_indx in range(self.num_sats):
+            events = events_by_sat[sat_indx]
 
-            if len(sat_pkts_state) > 0:
-                raise Exception ('create_data_history: should not have any packets left in here')
+            if len(events) == 0:
+                data_history.append(np.zeros((1,2)))
+                continue
 
-        return data_history
\ No newline at end of file
+            events_arr = np.array(events,dtype=np.float64)
+
+            # combine all the events at each time
+            times, event_times_indcs = np.unique(events_arr[:,0],return_inverse=True)
+            rate_deltas = np.zeros(len(times))
+            dv_steps = np.zeros(len(times))
+            np.add.at(rate_deltas,event_times_indcs,events_arr[:,1])
+            np.add.at(dv_steps,event_times_indcs,events_arr[:,2])
+
+            # rate of change of dv from each time until the next
+            rates = np.cumsum(rate_deltas)
+            # dv after each time = all the steps so far + all the rate*time so far
+            dv_ramps = np.zeros(len(times))
+            dv_ramps[1:] = np.cumsum(rates[:-1]*np.diff(times))
+            dv_after = dv_ramps + np.cumsum(dv_steps)
+            dv_before = dv_after - dv_steps
+
+            # one row per time, plus an extra row wherever there's an instantaneous change
+            has_step = dv_steps != 0
+            rows = np.empty((len(times)+np.count_nonzero(has_step),2))
+            row_indcs = np.arange(len(times)) + np.cumsum(has_step)
+            rows[row_indcs,0] = times
+            rows[row_indcs,1] = dv_after
+            rows[row_indcs[has_step]-1,0] = times[has_step]
+            rows[row_indcs[has_step]-1,1] = dv_before[has_step]
+
+            # start from zero at the beginning of the scenario
+            if times[0] > 0:
+                rows = np.vstack((np.zeros((1,2)),rows))
+
+            data_history.append(rows)
+
+        return data_history
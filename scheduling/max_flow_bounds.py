@@ -0,0 +1,232 @@
+# Max-flow upper bounds on deliverable data volume
+#
+# Gives the most data volume each observation (and the constellation as a whole) could possibly get to the ground through the imported xlnk and dlnk windows, with each window's data volume as its capacity. This is a bound on what any route selection and activity scheduling could achieve, which is useful for judging how good they are.
+#
+# The flow network is time-expanded. Each satellite gets a chain of storage nodes, one per time at which data arrives at or leaves the satellite, linked in time order with unlimited capacity. A window is a pair of nodes linked by an edge with the window's data volume as capacity. Data leaves a satellite's storage chain into a window at the window's start and comes back into the storage chain of the receiving satellite at the window's end. Both directions of a symmetric xlnk go through the same window edge, so they share its capacity (flow that goes "back" to the sat it came from is no different than the data just staying in storage). Dlnk windows drain into the sink.
+#
+# Transition times between activities are not modeled, so the result is an upper bound. Max flow is found with Dinic's algorithm. Because of the storage chains, the number of edges is linear in the number of windows, so scenarios with tens of thousands of windows are fine.
+
+from collections import deque
+
+INF_CAPACITY = float('inf')
+
+
+class WindowFlowGraph():
+    """ time-expanded flow network over a set of obs, xlnk and dlnk windows"""
+
+    def __init__(self,obs_winds,xlnk_winds,dlnk_winds,min_wind_dv=0):
+        """
+        :param obs_winds: observation windows
+        :type obs_winds: iterable(ObsWindow)
+        :param xlnk_winds: crosslink windows (duplicates are okay)
+        :type xlnk_winds: iterable(XlnkWindow)
+        :param dlnk_winds: downlink windows
+        :type dlnk_winds: iterable(DlnkWindow)
+        :param min_wind_dv: windows with less data volume than this are left out (windows with no data volume are always left out), defaults to 0
+        :type min_wind_dv: float, optional
+        """
+
+        #  flow network, as adjacency lists of edge indices. Edges are added in pairs, so the reverse of edge e is e^1
+        self.adj = []
+        self.edge_to = []
+        self.edge_caps = []
+
+        self.sink = self._add_node()
+
+        #  storage node for each (sat, time)
+        self._storage_nodes = {}
+
+        #  the input node of each obs window (where flow from the source goes in)
+        self.obs_in_node_by_wind = {}
+
+        seen_winds = set()
+        def include_wind(wind):
+            if wind in seen_winds:
+                return False
+            seen_winds.add(wind)
+            return wind.data_vol > 0 and wind.data_vol >= min_wind_dv
+
+        for wind in obs_winds:
+            if include_wind(wind):
+                wind_in, wind_out = self._add_wind(wind)
+                self.obs_in_node_by_wind[wind] = wind_in
+                self._add_edge(wind_out,self._get_storage_node(wind.sat_indx,wind.end),INF_CAPACITY)
+
+        for wind in xlnk_winds:
+            if include_wind(wind):
+                wind_in, wind_out = self._add_wind(wind)
+                for sat_indx in [wind.sat_indx,wind.xsat_indx]:
+                    #  for unidirectional windows, data can only go out from the tx sat
+                    if not wind.symmetric and sat_indx != wind.tx_sat:
+                        continue
+                    self._add_edge(self._get_storage_node(sat_indx,wind.start),wind_in,INF_CAPACITY)
+                    self._add_edge(wind_out,self._get_storage_node(wind.get_xlnk_partner(sat_indx),wind.end),INF_CAPACITY)
+
+        for wind in dlnk_winds:
+            if include_wind(wind):
+                wind_in, wind_out = self._add_wind(wind)
+                self._add_edge(self._get_storage_node(wind.sat_indx,wind.start),wind_in,INF_CAPACITY)
+                self._add_edge(wind_out,self.sink,INF_CAPACITY)
+
+        #  link up the storage nodes for each sat in time order
+        storage_keys_by_sat = {}
+        for sat_indx, time in self._storage_nodes.keys():
+            storage_keys_by_sat.setdefault(sat_indx,[]).append(time)
+        for sat_indx, times in storage_keys_by_sat.items():
+            times.sort()
+            for time1, time2 in zip(times[:-1],times[1:]):
+                self._add_edge(self._storage_nodes[(sat_indx,time1)],self._storage_nodes[(sat_indx,time2)],INF_CAPACITY)
+
+        #  a super source feeding every obs, for the constellation-wide bound
+        self.source = self._add_node()
+        self._source_edge_by_obs = {}
+        for obs, obs_in in self.obs_in_node_by_wind.items():
+            self._source_edge_by_obs[obs] = self._add_edge(self.source,obs_in,INF_CAPACITY)
+
+    @property
+    def num_nodes(self):
+        return len(self.adj)
+
+    @property
+    def num_edges(self):
+        return len(self.edge_to)
+
+    def _add_node(self):
+        self.adj.append([])
+        return len(self.adj)-1
+
+    def _add_edge(self,node1,node2,cap):
+        """ add an edge and its reverse, returning the index of the (forward) edge"""
+
+        edge = len(self.edge_to)
+        self.edge_to.append(node2)
+        self.edge_caps.append(cap)
+        self.adj[node1].append(edge)
+        self.edge_to.append(node1)
+        self.edge_caps.append(0)
+        self.adj[node2].append(edge+1)
+        return edge
+
+    def _add_wind(self,wind):
+        wind_in = self._add_node()
+        wind_out = self._add_node()
+        self._add_edge(wind_in,wind_out,wind.data_vol)
+        return wind_in, wind_out
+
+    def _get_storage_node(self,sat_indx,time):
+        node = self._storage_nodes.get((sat_indx,time))
+        if node is None:
+            node = self._add_node()
+            self._storage_nodes[(sat_indx,time)] = node
+        return node
+
+    def _get_levels(self,source,residual_caps):
+        """ BFS from source over edges with residual capacity, giving the distance to each node (-1 if not reachable)"""
+
+        levels = [-1]*self.num_nodes
+        levels[source] = 0
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            for edge in self.adj[node]:
+                next_node = self.edge_to[edge]
+                if residual_caps[edge] > 0 and levels[next_node] < 0:
+                    levels[next_node] = levels[node] + 1
+                    queue.append(next_node)
+        return levels
+
+    def _augment(self,source,levels,next_edge_indcs,residual_caps):
+        """ find a single path from source to the sink in the level graph and push as much flow along it as possible
+
+        :returns: flow pushed (0 if there's no path left in the level graph)
+        """
+
+        path_edges = []
+        node = source
+        while node != self.sink:
+            adj = self.adj[node]
+            found_edge = None
+            while next_edge_indcs[node] < len(adj):
+                edge = adj[next_edge_indcs[node]]
+                if residual_caps[edge] > 0 and levels[self.edge_to[edge]] == levels[node] + 1:
+                    found_edge = edge
+                    break
+                next_edge_indcs[node] += 1
+
+            if found_edge is None:
+                #  dead end - back up and don't come through this node again in this phase
+                if node == source:
+                    return 0
+                levels[node] = -1
+                edge = path_edges.pop()
+                node = self.edge_to[edge^1]
+                next_edge_indcs[node] += 1
+                continue
+
+            path_edges.append(found_edge)
+            node = self.edge_to[found_edge]
+
+        flow = min(residual_caps[edge] for edge in path_edges)
+        for edge in path_edges:
+            residual_caps[edge] -= flow
+            residual_caps[edge^1] += flow
+        return flow
+
+    def _max_flow(self,source,residual_caps):
+        """ Dinic's algorithm from source to the sink. residual_caps is updated in place"""
+
+        total_flow = 0
+        while True:
+            levels = self._get_levels(source,residual_caps)
+            if levels[self.sink] < 0:
+                break
+
+            next_edge_indcs = [0]*self.num_nodes
+            while True:
+                flow = self._augment(source,levels,next_edge_indcs,residual_caps)
+                if flow == 0:
+                    break
+                total_flow += flow
+
+        return total_flow
+
+    def get_obs_max_dv(self,obs):
+        """ get the most data volume that could be delivered from obs, if it had all of the windows to itself
+
+        :param obs: observation window
+        :type obs: ObsWindow
+        :returns: max deliverable data volume (0 if obs isn't in the graph)
+        :rtype: {float}
+        """
+
+        obs_in = self.obs_in_node_by_wind.get(obs)
+        if obs_in is None:
+            return 0
+
+        return self._max_flow(obs_in,list(self.edge_caps))
+
+    def get_max_dv_by_obs(self,obs_winds=None):
+        """ get the most data volume that could be delivered from each obs, if it had all of the windows to itself
+
+        :param obs_winds: observation windows, defaults to None (all obs in the graph)
+        :type obs_winds: iterable(ObsWindow), optional
+        :returns: max deliverable data volume for each obs
+        :rtype: {dict}
+        """
+
+        if obs_winds is None:
+            obs_winds = self.obs_in_node_by_wind.keys()
+        return {obs: self.get_obs_max_dv(obs) for obs in obs_winds}
+
+    def get_constellation_max_dv(self):
+        """ get the most data volume that could be delivered across all observations at once
+
+        :returns: total max deliverable data volume, and the data volume from each obs in one flow that achieves it (the split across obs isn't unique)
+        :rtype: {float, dict}
+        """
+
+        residual_caps = list(self.edge_caps)
+        total_dv = self._max_flow(self.source,residual_caps)
+        #  flow out of the source along each obs edge is what's built up on its reverse edge
+        dv_by_obs = {obs: residual_caps[edge^1] for obs, edge in self._source_edge_by_obs.items()}
+        return total_dv, dv_by_obs
@@ -0,0 +1,212 @@
+# Sparse route-window incidence matrices
+#
+# A lot of calculations over large sets of routes come down to "which routes use which windows, and with how much data volume" - e.g. overlap between routes, the data volume used in each window, and checking that no window is oversubscribed. This builds a sparse (routes x windows) matrix from a set of DataRoute/DataMultiRoute objects, so those calculations can be done as sparse matrix products rather than nested loops over routes and windows.
+
+import numpy as np
+from scipy import sparse
+
+from circinus_tools  import  constants as const
+from .custom_window import   XlnkWindow
+
+
+class RouteWindowIncidence():
+    """ sparse incidence matrix between a set of routes (rows) and all of the windows they use (columns)
+
+    The value at (route, window) is the data volume the route moves through the window. For a DataMultiRoute that's the total across all of its data routes that go through the window. Each window gets at most one entry per route.
+    """
+
+    def __init__(self,routes,dv_option='data_vol'):
+        """
+        :param routes: routes to build the matrix for
+        :type routes: list(DataRoute or DataMultiRoute)
+        :param dv_option: which data volume to use for each route - the possible data volume ('data_vol') or the scheduled data volume ('scheduled_dv'), defaults to 'data_vol'
+        :type dv_option: str, optional
+        """
+
+        if not dv_option in ['data_vol','scheduled_dv']:
+            raise NotImplementedError('Unknown dv_option %s'%(dv_option))
+
+        self.routes = list(routes)
+        self.route_indx_by_route = {route: route_indx for route_indx, route in enumerate(self.routes)}
+
+        #  all the windows used by any of the routes, in the order they're first seen
+        self.winds = []
+        self.wind_indx_by_wind = {}
+
+        row_indcs = []
+        col_indcs = []
+        dvs = []
+        for route_indx, route in enumerate(self.routes):
+            # a window only gets one entry per route, even if it somehow shows up twice in the route
+            route_wind_indcs = set()
+
+            for wind in route.get_winds():
+                wind_indx = self.wind_indx_by_wind.get(wind)
+                if wind_indx is None:
+                    wind_indx = len(self.winds)
+                    self.wind_indx_by_wind[wind] = wind_indx
+                    self.winds.append(wind)
+
+                if wind_indx in route_wind_indcs:
+                    continue
+                route_wind_indcs.add(wind_indx)
+
+                row_indcs.append(route_indx)
+                col_indcs.append(wind_indx)
+                dvs.append(self._get_route_wind_dv(route,wind,dv_option))
+
+        shape = (len(self.routes),len(self.winds))
+        self.dv_matrix = sparse.csr_matrix((np.array(dvs,dtype=np.float64),(np.array(row_indcs,dtype=np.int64),np.array(col_indcs,dtype=np.int64))),shape=shape)
+        #  same sparsity pattern, but with ones for the values
+        self.incidence_matrix = sparse.csr_matrix((np.ones(len(dvs)),(np.array(row_indcs,dtype=np.int64),np.array(col_indcs,dtype=np.int64))),shape=shape)
+
+        #  total data volume of each window
+        self.wind_capacities = np.array([wind.data_vol for wind in self.winds],dtype=np.float64)
+
+    @staticmethod
+    def _get_route_wind_dv(route,wind,dv_option):
+        # DataMultiRoutes can move different amounts of data volume through different windows
+        if hasattr(route,'data_routes'):
+            if dv_option == 'data_vol':
+                return route.data_vol_for_wind(wind)
+            else:
+                dv = route.scheduled_dv_for_wind(wind)
+        else:
+            if dv_option == 'data_vol':
+                return route.data_vol
+            else:
+                dv = route.scheduled_dv
+
+        if dv == const.UNASSIGNED:
+            raise RuntimeWarning('Saw unassigned scheduled data volume for route %s'%(route))
+        return dv
+
+    @property
+    def num_routes(self):
+        return len(self.routes)
+
+    @property
+    def num_winds(self):
+        return len(self.winds)
+
+    def get_wind_mask(self,wind_types):
+        """ get a boolean array that's True for windows of the given types
+
+        :param wind_types: window classes
+        :type wind_types: list(type)
+        :rtype: {np.ndarray}
+        """
+        return np.array([type(wind) in wind_types for wind in self.winds],dtype=bool)
+
+    def get_wind_loads(self,route_weights=None):
+        """ get the data volume used in each window across all routes
+
+        :param route_weights: multiplier on the data volume of each route (e.g. utilization), defaults to None (all ones)
+        :type route_weights: np.ndarray, optional
+        :returns: used data volume for each window, in the same order as self.winds
+        :rtype: {np.ndarray}
+        """
+
+        if route_weights is None:
+            route_weights = np.ones(self.num_routes)
+        return self.dv_matrix.T.dot(route_weights)
+
+    def get_wind_utilizations(self,route_weights=None):
+        """ get the fraction of the data volume of each window that's used across all routes
+
+        :param route_weights: multiplier on the data volume of each route, defaults to None (all ones)
+        :type route_weights: np.ndarray, optional
+        :returns: utilization for each window (windows with no data volume get 0)
+        :rtype: {np.ndarray}
+        """
+
+        loads = self.get_wind_loads(route_weights)
+        utilizations = np.zeros(self.num_winds)
+        has_capacity = self.wind_capacities > 0
+        utilizations[has_capacity] = loads[has_capacity] / self.wind_capacities[has_capacity]
+        return utilizations
+
+    def get_oversubscribed_winds(self,route_weights=None,dv_epsilon=1e-5):
+        """ find the windows where the routes use more data volume than is available
+
+        :param route_weights: multiplier on the data volume of each route, defaults to None (all ones)
+        :type route_weights: np.ndarray, optional
+        :param dv_epsilon: allowed slop in data volume, defaults to 1e-5
+        :type dv_epsilon: float, optional
+        :returns: list of (window, used data volume) for every oversubscribed window
+        :rtype: {list(tuple)}
+        """
+
+        loads = self.get_wind_loads(route_weights)
+        oversubscribed_wind_indcs = np.nonzero(loads > self.wind_capacities + dv_epsilon)[0]
+        return [(self.winds[wind_indx],loads[wind_indx]) for wind_indx in oversubscribed_wind_indcs]
+
+    def get_shared_wind_counts(self,wind_types=None):
+        """ count the windows of the given types that each pair of routes share
+
+        This is the same as the overlap count from DataRoute.count_overlap() with window_option 'mutex_window' (for xlnk windows)
+
+        :param wind_types: only count shared windows of these types, defaults to None (XlnkWindow only)
+        :type wind_types: list(type), optional
+        :returns: (num routes x num routes) sparse matrix of shared window counts. The diagonal is the number of windows of those types in each route
+        :rtype: {sparse.csr_matrix}
+        """
+
+        if wind_types is None:
+            wind_types = [XlnkWindow]
+
+        incidence = self.incidence_matrix.dot(sparse.diags(self.get_wind_mask(wind_types).astype(np.float64)))
+        return incidence.dot(incidence.T).tocsr()
+
+    def get_overlap_counts(self,window_option='shared_window',wind_types=None):
+        """ count the overlapping windows for each pair of routes
+
+        Same as DataRoute.count_overlap(): with 'mutex_window', any shared window is an overlap. With 'shared_window' a shared window is only an overlap if the two routes' data volumes together are more than the window's data volume
+
+        :param window_option: 'shared_window' or 'mutex_window', defaults to 'shared_window'
+        :type window_option: str, optional
+        :param wind_types: only count windows of these types, defaults to None (XlnkWindow only)
+        :type wind_types: list(type), optional
+        :returns: (num routes x num routes) sparse matrix of overlap counts, with zeros on the diagonal
+        :rtype: {sparse.csr_matrix}
+        """
+
+        if wind_types is None:
+            wind_types = [XlnkWindow]
+
+        if window_option == 'mutex_window':
+            overlap_counts = self.get_shared_wind_counts(wind_types).tolil()
+            overlap_counts.setdiag(0)
+            return overlap_counts.tocsr()
+        elif window_option != 'shared_window':
+            raise NotImplementedError
+
+        # for each window, find the pairs of routes through it whose data volumes add up to more than the window's
+        wind_mask = self.get_wind_mask(wind_types)
+        dv_matrix_csc = self.dv_matrix.tocsc()
+
+        pair_rows = []
+        pair_cols = []
+        for wind_indx in np.nonzero(wind_mask)[0]:
+            start, end = dv_matrix_csc.indptr[wind_indx], dv_matrix_csc.indptr[wind_indx+1]
+            if end - start < 2:
+                continue
+
+            route_indcs = dv_matrix_csc.indices[start:end]
+            route_dvs = dv_matrix_csc.data[start:end]
+
+            over = np.add.outer(route_dvs,route_dvs) > self.wind_capacities[wind_indx]
+            np.fill_diagonal(over,False)
+            over_i, over_j = np.nonzero(over)
+            pair_rows.append(route_indcs[over_i])
+            pair_cols.append(route_indcs[over_j])
+
+        if pair_rows:
+            pair_rows = np.concatenate(pair_rows)
+            pair_cols = np.concatenate(pair_cols)
+        else:
+            pair_rows = np.zeros(0,dtype=np.int64)
+            pair_cols = np.zeros(0,dtype=np.int64)
+
+        # duplicate entries get summed, which gives the count over all windows
+        return sparse.csr_matrix((np.ones(len(pair_rows)),(pair_rows,pair_cols)),shape=(self.num_routes,self.num_routes))
@@ -0,0 +1,187 @@
+# Prefix trie over the window sequences of a set of routes
+#
+# The constellation sim matches partially executed routes against the routes in a plan over and over (DataRoute.contains_route(), DataRoute.get_split(), DataMultiRoute.contains_route()), which compares the routes window by window each time. This builds a trie over the window sequences of all of the planned routes, so that "which planned routes extend this executed route" and "where do these two routes diverge" only need to walk the executed route once.
+#
+# Windows are keyed by their hash (window ID combined with window object type), which is what windows compare equal on, so copies of a window map to the same trie node.
+
+class RouteTrieNode():
+    """ node in a RouteTrie, for a single window along one or more routes"""
+
+    def __init__(self,wind=None,depth=0):
+        #  the window this node is for (None for the root)
+        self.wind = wind
+        #  index of wind within the routes that go through this node
+        self.depth = depth
+        #  child nodes, keyed by window hash
+        self.children = {}
+        #  the routes added to the trie that go through this node, in the order they were added
+        self.routes = []
+        #  the data routes that go through this node (same as routes, except for data multi-routes, where this has the data routes within them)
+        self.data_routes = []
+
+
+class RouteTrie():
+    """ trie over the window sequences of a set of routes
+
+    Every route starts at its observation window, so the children of the root are observation windows. Data multi-routes are added as all of the data routes within them. The trie holds the routes as they were when added, so if a route is changed afterwards it should be added to a new trie.
+    """
+
+    def __init__(self,routes=None):
+        """
+        :param routes: routes to add to the trie, defaults to None (empty trie)
+        :type routes: list(DataRoute or DataMultiRoute), optional
+        """
+
+        if routes is None:
+            routes = []
+
+        self.root = RouteTrieNode()
+        #  the trie nodes along each data route that's been added, keyed by id() of the data route. Data routes are keyed by object rather than by route ID, because an executed route can share its ID with the planned route it's part of
+        self._nodes_by_dr_id = {}
+
+        for route in routes:
+            self.add_route(route)
+
+    def add_route(self,route):
+        """ add a data route or data multi-route to the trie
+
+        :param route: route to add
+        :type route: DataRoute or DataMultiRoute
+        """
+
+        data_routes = route.data_routes if hasattr(route,'data_routes') else [route]
+
+        for dr in data_routes:
+            node = self.root
+            nodes = []
+            for wind in dr.route:
+                child = node.children.get(hash(wind))
+                if child is None:
+                    child = RouteTrieNode(wind,node.depth+1)
+                    node.children[hash(wind)] = child
+                node = child
+                nodes.append(node)
+
+                #  all the data routes in a multi-route get added together, so if route has already been listed for this node it's at the end
+                if len(node.routes) == 0 or node.routes[-1] is not route:
+                    node.routes.append(route)
+                node.data_routes.append(dr)
+
+            self._nodes_by_dr_id[id(dr)] = (dr,nodes)
+
+    def _find_node(self,winds):
+        """ walk down the trie along winds, returning the node for the last window or None if the trie doesn't contain that window sequence"""
+
+        node = self.root
+        for wind in winds:
+            node = node.children.get(hash(wind))
+            if node is None:
+                return None
+        return node
+
+    def _walk(self,winds):
+        """ walk down the trie along winds as far as possible, returning the nodes passed through"""
+
+        nodes = []
+        node = self.root
+        for wind in winds:
+            node = node.children.get(hash(wind))
+            if node is None:
+                break
+            nodes.append(node)
+        return nodes
+
+    def _get_added_nodes(self,dr):
+        """ get the nodes along data route dr, if it's been added to the trie (None otherwise)"""
+
+        added_dr, nodes = self._nodes_by_dr_id.get(id(dr),(None,None))
+        if added_dr is not dr:
+            return None
+        return nodes
+
+    @staticmethod
+    def _get_winds(prefix):
+        return prefix.route if hasattr(prefix,'route') else prefix
+
+    def get_extending_routes(self,prefix):
+        """ get the routes in the trie that extend (i.e. contain, at least partly) prefix
+
+        This gives the same routes as checking DataRoute.contains_route() or DataMultiRoute.contains_route() against every route in the trie
+
+        :param prefix: executed route, or its sequence of windows starting from the observation window
+        :type prefix: DataRoute or list(ActivityWindow)
+        :returns: routes extending prefix, in the order they were added to the trie
+        :rtype: {list(DataRoute or DataMultiRoute)}
+        """
+
+        node = self._find_node(self._get_winds(prefix))
+        if node is None or node is self.root:
+            return []
+        return list(node.routes)
+
+    def get_extending_data_routes(self,prefix):
+        """ same as get_extending_routes(), but gives the data routes within any data multi-routes that extend prefix, instead of the multi-routes themselves"""
+
+        node = self._find_node(self._get_winds(prefix))
+        if node is None or node is self.root:
+            return []
+        return list(node.data_routes)
+
+    def contains_route(self,prefix):
+        """ check if any route in the trie extends prefix"""
+
+        node = self._find_node(self._get_winds(prefix))
+        return node is not None and node is not self.root
+
+    def get_next_winds(self,prefix):
+        """ get the windows that come directly after prefix in any of the routes in the trie
+
+        :param prefix: executed route, or its sequence of windows starting from the observation window
+        :type prefix: DataRoute or list(ActivityWindow)
+        :returns: next windows (empty if no route extends prefix, or they all end with prefix)
+        :rtype: {list(ActivityWindow)}
+        """
+
+        node = self._find_node(self._get_winds(prefix))
+        if node is None:
+            return []
+        return [child.wind for child in node.children.values()]
+
+    def get_split(self,dr1,dr2):
+        """ return the last window the two data routes have in common
+
+        Same as DataRoute.get_split(). At least one of the data routes should have been added to the trie - if neither has, this falls back on DataRoute.get_split()
+
+        :param dr1: data route
+        :type dr1: DataRoute
+        :param dr2: other data route
+        :type dr2: DataRoute
+        :returns: last common window
+        :rtype: {ActivityWindow}
+        """
+
+        nodes1 = self._get_added_nodes(dr1)
+        nodes2 = self._get_added_nodes(dr2)
+        if nodes1 is None and nodes2 is None:
+            return dr1.get_split(dr2)
+
+        #  route should always start the same place, the initial observation window
+        assert hash(dr1.route[0]) == hash(dr2.route[0])
+
+        #  a route that hasn't been added can only share nodes with one that has, up to where it leaves the trie, so walking it is enough
+        if nodes1 is None:
+            nodes1 = self._walk(dr1.route)
+        if nodes2 is None:
+            nodes2 = self._walk(dr2.route)
+
+        #  the node lists are the same up to the split and different after it, so binary search for the last shared node
+        lo = 0
+        hi = min(len(nodes1),len(nodes2))
+        while lo < hi:
+            mid = (lo+hi+1)//2
+            if nodes1[mid-1] is nodes2[mid-1]:
+                lo = mid
+            else:
+                hi = mid-1
+
+        return dr1.route[lo-1]
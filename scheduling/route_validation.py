@@ -0,0 +1,328 @@
+# Batch validation of route sets
+#
+# DataRoute.validate() and DataMultiRoute.validate() check one route at a time and raise on the first problem found. This runs the same checks over a whole set of routes at once, and returns every violation found instead of raising.
+#
+# The windows of all the routes are laid out in flat numpy arrays (one entry per window in each route), so the timing, start sat, data volume and tx sat checks are array comparisons across all the routes at once. Transition time requirements are looked up once per distinct (window, window, sat) triple. Window oversubscription, both within each DataMultiRoute and (optionally) across the whole route set, is checked with a RouteWindowIncidence.
+
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+
+from circinus_tools  import  constants as const
+from circinus_tools  import other_tools
+from .custom_window import   ObsWindow,  XlnkWindow
+from .route_incidence import RouteWindowIncidence
+
+# a single problem found with a route
+#  route_ID: ID of the data route (None for problems with a whole route set)
+#  dmr_ID: ID of the data multi-route the data route is in (None if it's not in one)
+#  windex: index of the window within the data route (None if not about a specific window)
+#  wind: the window involved (None if not about a specific window)
+#  violation_type: one of VIOLATION_TYPES
+#  message: description of the problem
+RouteViolation = namedtuple('RouteViolation','route_ID dmr_ID windex wind violation_type message')
+
+VIOLATION_TYPES = [
+    'first_wind_not_obs',
+    'scheduled_dv',
+    'start_sat',
+    'time_order',
+    'wind_dv',
+    'xlnk_tx_sat',
+    'transition_time',
+    'dmr_obs_mismatch',
+    'dmr_dlnk_mismatch',
+    'dmr_oversubscription',
+    'route_set_oversubscription',
+]
+
+_ONE_US = timedelta(microseconds=1)
+_UNCHECKABLE_TRANS_US = np.iinfo(np.int64).max
+
+# the activity timing helper used by validation worker processes. Set once per worker by the pool initializer
+_validation_worker_timing_helper = None
+
+def _init_validation_worker(act_timing_helper):
+    global _validation_worker_timing_helper
+    _validation_worker_timing_helper = act_timing_helper
+
+def _run_validation_worker_task(drs,time_option,dv_epsilon):
+    return get_dr_violations(drs,_validation_worker_timing_helper,time_option,dv_epsilon)
+
+def get_dr_violations(drs,act_timing_helper,time_option='start_end',dv_epsilon=None):
+    """ run the checks from DataRoute.validate() on a list of data routes
+
+    This returns indices rather than objects, so that it can be run in a worker process and the results mapped back onto the caller's objects
+
+    :param drs: data routes
+    :type drs: list(DataRoute)
+    :param act_timing_helper: used to look up transition time requirements
+    :type act_timing_helper: ActivityTimingHelper
+    :param time_option: 'start_end' or 'center' (see DataRoute.validate()), defaults to 'start_end'
+    :type time_option: str, optional
+    :param dv_epsilon: data volume slop, defaults to None (each route's own dv_epsilon)
+    :type dv_epsilon: float, optional
+    :returns: list of (index in drs, windex, violation type, message), in order of data route and window
+    :rtype: {list(tuple)}
+    """
+
+    if not time_option in ['start_end','center']:
+        raise NotImplementedError
+
+    violations = []
+
+    #  per-window arrays, with one entry for each window in each route (a "position")
+    pos_dr_indcs = []
+    pos_windcs = []
+    pos_start_sats = []
+    pos_allowed_overlap = []
+    pos_uniq_wind_indcs = []
+
+    #  distinct window objects (by identity, not hash - window copies can have different times)
+    uniq_winds = []
+    uniq_wind_indx_by_id = {}
+
+    dr_epsilons = []
+    checked_dr_indcs = []
+    for dr_indx, dr in enumerate(drs):
+        if len(dr.route) == 0:
+            continue
+
+        epsilon = dr.dv_epsilon if dv_epsilon is None else dv_epsilon
+
+        if not type(dr.route[0]) is ObsWindow:
+            violations.append((dr_indx,0,'first_wind_not_obs','First window on route was not an ObsWindow instance. Route string: %s'%(dr.get_route_string())))
+            #  the rest of the checks trace the route from the obs, so can't be done
+            continue
+
+        if not dr.scheduled_dv <= dr.data_vol + epsilon:
+            violations.append((dr_indx,None,'scheduled_dv','scheduled data volume (%f) is more than available data volume (%f). Route string: %s'%(dr.scheduled_dv,dr.data_vol,dr.get_route_string())))
+
+        checked_dr_indcs.append(dr_indx)
+        dr_epsilons.append(epsilon)
+        for windex, wind in enumerate(dr.route):
+            uniq_wind_indx = uniq_wind_indx_by_id.get(id(wind))
+            if uniq_wind_indx is None:
+                uniq_wind_indx = len(uniq_winds)
+                uniq_wind_indx_by_id[id(wind)] = uniq_wind_indx
+                uniq_winds.append(wind)
+
+            pos_dr_indcs.append(dr_indx)
+            pos_windcs.append(windex)
+            pos_uniq_wind_indcs.append(uniq_wind_indx)
+            pos_start_sats.append(dr.window_start_sats.get(wind,const.UNASSIGNED))
+            pos_allowed_overlap.append(len(dr.allowed_overlaps_start_wind) > 0 and wind in dr.allowed_overlaps_start_wind)
+
+    if len(pos_dr_indcs) == 0:
+        return sorted(violations,key=_violation_sort_key)
+
+    #  per distinct window arrays. Times are integer microseconds, so comparisons are exact
+    time_base = min(wind.start for wind in uniq_winds)
+    uniq_starts = np.array([(wind.start-time_base)//_ONE_US for wind in uniq_winds],dtype=np.int64)
+    uniq_ends = np.array([(wind.end-time_base)//_ONE_US for wind in uniq_winds],dtype=np.int64)
+    uniq_centers = np.array([(wind.center-time_base)//_ONE_US for wind in uniq_winds],dtype=np.int64)
+    uniq_dvs = np.array([wind.data_vol for wind in uniq_winds],dtype=np.float64)
+    uniq_is_xlnk = np.array([type(wind) is XlnkWindow for wind in uniq_winds],dtype=bool)
+    uniq_sats = np.array([wind.sat_indx for wind in uniq_winds],dtype=np.int64)
+    uniq_xsats = np.array([wind.xsat_indx if type(wind) is XlnkWindow else const.UNASSIGNED for wind in uniq_winds],dtype=np.int64)
+    uniq_unidirectional = np.array([type(wind) is XlnkWindow and not wind.symmetric for wind in uniq_winds],dtype=bool)
+    uniq_tx_sats = np.array([wind.tx_sat if type(wind) is XlnkWindow and not wind.symmetric else const.UNASSIGNED for wind in uniq_winds],dtype=np.int64)
+
+    pos_uniq_wind_indcs = np.array(pos_uniq_wind_indcs,dtype=np.int64)
+    pos_dr_indcs = np.array(pos_dr_indcs,dtype=np.int64)
+    pos_windcs = np.array(pos_windcs,dtype=np.int64)
+    pos_start_sats = np.array(pos_start_sats,dtype=np.int64)
+    pos_allowed_overlap = np.array(pos_allowed_overlap,dtype=bool)
+
+    starts = uniq_starts[pos_uniq_wind_indcs]
+    ends = uniq_ends[pos_uniq_wind_indcs]
+    centers = uniq_centers[pos_uniq_wind_indcs]
+    wind_dvs = uniq_dvs[pos_uniq_wind_indcs]
+    is_xlnk = uniq_is_xlnk[pos_uniq_wind_indcs]
+    sats = uniq_sats[pos_uniq_wind_indcs]
+    xsats = uniq_xsats[pos_uniq_wind_indcs]
+
+    is_first = pos_windcs == 0
+    #  index of the previous position in the same route (only meaningful where not is_first)
+    prev_pos = np.arange(len(pos_windcs)) - 1
+    prev_pos[is_first] = 0
+
+    #  the sat the data is on after each window. For xlnks that's the partner of the start sat (see XlnkWindow.get_xlnk_partner())
+    end_sats = np.where(is_xlnk,np.where(pos_start_sats == sats,xsats,sats),pos_start_sats)
+    #  the sat the data should be on at the start of each window
+    expected_start_sats = np.where(is_first,sats,end_sats[prev_pos])
+
+    #  start sat continuity
+    bad_start_sat = pos_start_sats != expected_start_sats
+
+    #  time order (the first window in a route is compared against itself, same as in DataRoute.validate())
+    if time_option == 'start_end':
+        last_times = np.where(is_first,starts,ends[prev_pos])
+        time_valid = (starts >= last_times) & (ends >= last_times)
+    else:
+        last_times = np.where(is_first,centers,centers[prev_pos])
+        time_valid = centers >= last_times
+    bad_time = ~time_valid & ~pos_allowed_overlap
+
+    #  data volume
+    dr_dvs_by_indx = {dr_indx: drs[dr_indx].data_vol for dr_indx in checked_dr_indcs}
+    epsilon_by_indx = dict(zip(checked_dr_indcs,dr_epsilons))
+    pos_dr_dvs = np.array([dr_dvs_by_indx[dr_indx] for dr_indx in pos_dr_indcs],dtype=np.float64)
+    pos_epsilons = np.array([epsilon_by_indx[dr_indx] for dr_indx in pos_dr_indcs],dtype=np.float64)
+    bad_dv = ~(pos_dr_dvs <= wind_dvs + pos_epsilons)
+
+    #  unidirectional xlnks have to be sent from the tx sat
+    bad_tx_sat = uniq_unidirectional[pos_uniq_wind_indcs] & (expected_start_sats != uniq_tx_sats[pos_uniq_wind_indcs])
+
+    #  transition times between consecutive windows, looked up once per distinct (window, window, sat)
+    pair_pos = np.nonzero(~is_first)[0]
+    pair_keys = []
+    pair_trans_us = np.zeros(len(pair_pos),dtype=np.int64)
+    trans_us_by_key = {}
+    #  reasons the transition time couldn't be looked up, for pairs where it couldn't
+    lookup_error_by_key = {}
+    for pair_indx, pos in enumerate(pair_pos):
+        uniq1 = pos_uniq_wind_indcs[pos-1]
+        uniq2 = pos_uniq_wind_indcs[pos]
+        sat_indx = int(pos_start_sats[pos])
+        key = (uniq1,uniq2,sat_indx)
+        pair_keys.append(key)
+
+        trans_us = trans_us_by_key.get(key)
+        if trans_us is None:
+            #  a transition that couldn't be looked up always counts as insufficient
+            trans_us = _UNCHECKABLE_TRANS_US
+            if uniq_centers[uniq2] < uniq_centers[uniq1]:
+                #  the timing helper can't look up transitions to an earlier window. This will show up as a time order violation too
+                lookup_error_by_key[key] = 'second window is centered before first'
+            else:
+                try:
+                    trans_time_s = act_timing_helper.get_transition_time_req(uniq_winds[uniq1],uniq_winds[uniq2],sat_indx,sat_indx)
+                    trans_us = timedelta(seconds=trans_time_s)//_ONE_US
+                except Exception as e:
+                    lookup_error_by_key[key] = 'transition time lookup failed: %s'%(repr(e))
+            trans_us_by_key[key] = trans_us
+        pair_trans_us[pair_indx] = trans_us
+    pair_center_diffs = centers[pair_pos] - centers[pair_pos-1]
+    bad_trans_pairs = ~(pair_center_diffs >= pair_trans_us)
+
+    #  report everything, in the same words as DataRoute.validate()
+    def route_string(dr_indx):
+        return drs[dr_indx].get_route_string()
+
+    for pos in np.nonzero(bad_start_sat)[0]:
+        violations.append((int(pos_dr_indcs[pos]),int(pos_windcs[pos]),'start_sat','Found the incorrect sat indx at window indx %d in route. Route string: %s'%(pos_windcs[pos],route_string(pos_dr_indcs[pos]))))
+    for pos in np.nonzero(bad_time)[0]:
+        violations.append((int(pos_dr_indcs[pos]),int(pos_windcs[pos]),'time_order','Found a bad start time at window indx %d in route. Route string: %s'%(pos_windcs[pos],route_string(pos_dr_indcs[pos]))))
+    for pos in np.nonzero(bad_dv)[0]:
+        violations.append((int(pos_dr_indcs[pos]),int(pos_windcs[pos]),'wind_dv','Found bad dv at window indx %d in route. Route dv: %f, window dv: %f. Route string: %s'%(pos_windcs[pos],pos_dr_dvs[pos],wind_dvs[pos],route_string(pos_dr_indcs[pos]))))
+    for pos in np.nonzero(bad_tx_sat)[0]:
+        violations.append((int(pos_dr_indcs[pos]),int(pos_windcs[pos]),'xlnk_tx_sat','Found incorrect tx sat at window indx %d in route. Route string: %s'%(pos_windcs[pos],route_string(pos_dr_indcs[pos]))))
+    for pair_indx in np.nonzero(bad_trans_pairs)[0]:
+        pos = pair_pos[pair_indx]
+        wind1 = uniq_winds[pos_uniq_wind_indcs[pos-1]]
+        wind2 = uniq_winds[pos_uniq_wind_indcs[pos]]
+        lookup_error = lookup_error_by_key.get(pair_keys[pair_indx])
+        if lookup_error is not None:
+            message = 'could not check transition time between two windows in route (%s); wind1: %s, wind2: %s'%(lookup_error,wind1,wind2)
+        else:
+            message = 'found insufficient transition time between two windows in route; wind1: %s, wind2: %s, transition time required: %fs'%(wind1,wind2,pair_trans_us[pair_indx]/1e6)
+        violations.append((int(pos_dr_indcs[pos]),int(pos_windcs[pos]),'transition_time',message))
+
+    return sorted(violations,key=_violation_sort_key)
+
+def _violation_sort_key(violation):
+    dr_indx, windex, violation_type, message = violation
+    return (dr_indx, -1 if windex is None else windex, VIOLATION_TYPES.index(violation_type))
+
+def _chunk(items,num_chunks):
+    chunk_size = -(-len(items)//num_chunks)
+    return [items[indx:indx+chunk_size] for indx in range(0,len(items),chunk_size)]
+
+def validate_routes(routes,act_timing_helper,time_option='start_end',dv_epsilon=None,route_set_dv_option=None,num_procs=1):
+    """ validate a whole set of data routes and data multi-routes, returning all of the problems found
+
+    Does the same checks as DataRoute.validate() and DataMultiRoute.validate() on every route, plus (optionally) checks that the routes together don't oversubscribe any window
+
+    :param routes: routes to validate
+    :type routes: list(DataRoute or DataMultiRoute)
+    :param act_timing_helper: used to look up transition time requirements
+    :type act_timing_helper: ActivityTimingHelper
+    :param time_option: 'start_end' or 'center' (see DataRoute.validate()), defaults to 'start_end'
+    :type time_option: str, optional
+    :param dv_epsilon: data volume slop, defaults to None (each route's own dv_epsilon)
+    :type dv_epsilon: float, optional
+    :param route_set_dv_option: if given, also check that the total data volume through each window across all the routes doesn't exceed the window's data volume, using this data volume for each route ('data_vol' or 'scheduled_dv', see RouteWindowIncidence). The slop for this check is dv_epsilon, or const.dv_epsilon_Mb if that's None. Defaults to None (don't check)
+    :type route_set_dv_option: str, optional
+    :param num_procs: number of worker processes to spread the data route checks across. With 1, everything runs in this process, defaults to 1
+    :type num_procs: int, optional
+    :returns: all violations found, in order of route
+    :rtype: {list(RouteViolation)}
+    """
+
+    #  all the data routes, along with the multi-route each is in
+    drs = []
+    dmr_IDs = []
+    dmrs = []
+    for route in routes:
+        if hasattr(route,'data_routes'):
+            dmrs.append(route)
+            drs += route.data_routes
+            dmr_IDs += [route.ID]*len(route.data_routes)
+        else:
+            drs.append(route)
+            dmr_IDs.append(None)
+
+    if num_procs > 1 and len(drs) > 1:
+        dr_chunks = _chunk(drs,num_procs)
+        with other_tools.get_shared_state_pool_context().Pool(num_procs,initializer=_init_validation_worker,initargs=(act_timing_helper,)) as pool:
+            chunk_violations = pool.starmap(_run_validation_worker_task,[(dr_chunk,time_option,dv_epsilon) for dr_chunk in dr_chunks])
+
+        dr_violations = []
+        chunk_offset = 0
+        for dr_chunk, violations in zip(dr_chunks,chunk_violations):
+            dr_violations += [(dr_indx+chunk_offset,windex,violation_type,message) for dr_indx,windex,violation_type,message in violations]
+            chunk_offset += len(dr_chunk)
+    else:
+        dr_violations = get_dr_violations(drs,act_timing_helper,time_option,dv_epsilon)
+
+    violations = []
+    for dr_indx, windex, violation_type, message in dr_violations:
+        dr = drs[dr_indx]
+        wind = dr.route[windex] if windex is not None else None
+        violations.append(RouteViolation(dr.ID,dmr_IDs[dr_indx],windex,wind,violation_type,message))
+
+    #  checks for data multi-routes as a whole
+    for dmr in dmrs:
+        #  compare the first and last windows directly, rather than with get_obs()/get_dlnk(), so that a bad route gets reported instead of raising
+        dmr_drs = [dr for dr in dmr.data_routes if len(dr.route) > 0]
+        if len(dmr_drs) == 0:
+            continue
+        dmr_obs = dmr_drs[0].route[0]
+        dmr_dlnk = dmr_drs[0].route[-1]
+        for dr in dmr_drs:
+            if not dr.route[0] == dmr_obs:
+                violations.append(RouteViolation(dr.ID,dmr.ID,0,dr.route[0],'dmr_obs_mismatch','data route obs (%s) does not match multi-route obs (%s)'%(dr.route[0],dmr_obs)))
+            if not dr.route[-1] == dmr_dlnk:
+                violations.append(RouteViolation(dr.ID,dmr.ID,len(dr.route)-1,dr.route[-1],'dmr_dlnk_mismatch','data route dlnk (%s) does not match multi-route dlnk (%s)'%(dr.route[-1],dmr_dlnk)))
+
+    if len(dmrs) > 0:
+        #  each (dmr, window) entry in the incidence matrix is the data volume the dmr moves through the window, so it's oversubscribed if that's more than the window's data volume
+        dmr_incidence = RouteWindowIncidence(dmrs,'data_vol')
+        dv_matrix = dmr_incidence.dv_matrix.tocoo()
+        #  default dv_epsilon the same as DataMultiRoute.validate()
+        dmr_epsilons = np.array([getattr(dmr,'dv_epsilon',1) if dv_epsilon is None else dv_epsilon for dmr in dmrs],dtype=np.float64)
+        oversubscribed = dv_matrix.data > dmr_incidence.wind_capacities[dv_matrix.col] + dmr_epsilons[dv_matrix.row]
+        for entry_indx in np.nonzero(oversubscribed)[0]:
+            dmr = dmrs[dv_matrix.row[entry_indx]]
+            wind = dmr_incidence.winds[dv_matrix.col[entry_indx]]
+            violations.append(RouteViolation(None,dmr.ID,None,wind,'dmr_oversubscription','data routes in multi-route use %f of window data volume %f; window: %s'%(dv_matrix.data[entry_indx],wind.data_vol,wind)))
+
+    if route_set_dv_option is not None:
+        set_epsilon = dv_epsilon if dv_epsilon is not None else const.dv_epsilon_Mb
+        set_incidence = RouteWindowIncidence(routes,route_set_dv_option)
+        for wind, used_dv in set_incidence.get_oversubscribed_winds(dv_epsilon=set_epsilon):
+            violations.append(RouteViolation(None,None,None,wind,'route_set_oversubscription','routes use %f of window data volume %f; window: %s'%(used_dv,wind.data_vol,wind)))
+
+    return violations
@@ -2,9 +2,12 @@
 # 
 # @author Kit Kennedy
 
+import weakref
 from copy import copy
 from datetime import timedelta
 
+import numpy as np
+
 from circinus_tools  import  constants as const
 from circinus_tools  import  time_tools as tt
 from .custom_window import   ObsWindow,  DlnkWindow, XlnkWindow
@@ -73,7 +76,7 @@ class DataRoute:
 
     # note this route is simple:  there are no forks in the route; there is a simple linear path from an observation to a downlink through which data flows. all windows must be in temporal order.
 
-    def __init__(self, agent_ID,agent_ID_index, route  =[], window_start_sats={},dv=0,dv_epsilon=1e-5,obs_dv_multiplier=1,ro_ID=None):
+    def __init__(self, agent_ID,agent_ID_index, route=None, window_start_sats=None,dv=0,dv_epsilon=1e-5,obs_dv_multiplier=1,ro_ID=None):
 
         if ro_ID:
             if not type(ro_ID) == RoutingObjectID:
@@ -85,11 +88,12 @@ class DataRoute:
             self.ID = RoutingObjectID(agent_ID,agent_ID_index)
 
         # the list storing all objects in the route; a list ObsWindow, XlnkWindow, XlnkWindow...DlnkWindow
-        self.route =  route
+        # note: don't use a mutable default argument for this, or all the routes created without one would share the same list
+        self.route =  route if route is not None else []
 
         # this keeps track, for each window along the route, of the satellite (sat_indx) that the data was on at the beginning of the window. This is necessary because the window objects themselves are used across paths and do not store information about which sense they are used in
         #  dictionary with keys being the window objects themselves
-        self.window_start_sats = window_start_sats
+        self.window_start_sats = window_start_sats if window_start_sats is not None else {}
 
         self.data_vol = dv
 
@@ -109,6 +113,9 @@ class DataRoute:
 
         self.output_date_str_format = 'short'
 
+        #  cache of the xlnk windows in the route, keyed by window ID (see get_xlnk_wind_IDs())
+        self._clear_xlnk_winds_cache()
+
     # @property
     # def simple_data_routes(self):
     #     #  this provides a consistent API with DataMultiRoute
@@ -152,6 +159,35 @@ class DataRoute:
     def append_wind_to_route( self,wind,window_start_sat_indx):
         self.route.append(wind)
         self.window_start_sats[wind] = window_start_sat_indx
+        self._clear_xlnk_winds_cache()
+
+    def _clear_xlnk_winds_cache(self):
+        self._xlnk_winds_by_ID = None
+        self._xlnk_wind_IDs = None
+        self._xlnk_winds_route = None
+        self._xlnk_winds_route_len = 0
+
+    def _get_xlnk_winds_by_ID(self):
+        #  rebuild the cache if self.route has been replaced or changed length since it was built (or if self was pickled before the cache existed)
+        if getattr(self,'_xlnk_winds_route',None) is not self.route or self._xlnk_winds_route_len != len(self.route):
+            self._xlnk_winds_by_ID = {hash(wind):wind for wind in self.route if type(wind) == XlnkWindow}
+            self._xlnk_wind_IDs = frozenset(self._xlnk_winds_by_ID.keys())
+            self._xlnk_winds_route = self.route
+            self._xlnk_winds_route_len = len(self.route)
+
+        return self._xlnk_winds_by_ID
+
+    def get_xlnk_wind_IDs(self):
+        """ get the IDs of all of the xlnk windows in self
+
+        The IDs are window hashes (window ID combined with window object type), which are what windows compare equal on. The set is cached. It's rebuilt if the route is changed through the methods on self, or if self.route is replaced or changes length - if windows in self.route are swapped out some other way, call _clear_xlnk_winds_cache()
+
+        :returns: xlnk window IDs
+        :rtype: {frozenset}
+        """
+
+        self._get_xlnk_winds_by_ID()
+        return self._xlnk_wind_IDs
 
     def get_winds(self):
         return (wind for wind in self.route)
@@ -290,6 +326,8 @@ class DataRoute:
             elif type(wind) == XlnkWindow:
                 self.route[windex] = xlnk_winds_dict[wind]
 
+        self._clear_xlnk_winds_cache()
+
     def validate (self,act_timing_helper,time_option='start_end',dv_epsilon=None):
         """ validates timing and ordering of route
         
@@ -431,51 +469,42 @@ class DataRoute:
         return self.route[split_windex]
 
     def count_overlap(self,other,window_option ='shared_window'):
+        """ count the xlnk windows that self and other overlap on
 
-        overlap_count = 0
-        for wind1 in self.route:
-            if type(wind1) != XlnkWindow:
-                continue
-
-            for wind2 in  other.route:
-                if type(wind2) != XlnkWindow:
-                    continue
-
-                if wind1 == wind2:
-                    if window_option =='shared_window':
-                        #  only count true overlaps, meaning there's not enough space in the window for both routes
-                        if self.data_vol + other.data_vol > wind1.data_vol: 
-                            overlap_count += 1
-                    elif window_option == 'mutex_window':
-                        overlap_count += 1
-                    else:
-                        raise NotImplementedError
+        :param other: other data route
+        :type other: DataRoute
+        :param window_option: with 'mutex_window', every shared xlnk window is an overlap. With 'shared_window', a shared xlnk window is only an overlap if there's not enough space in the window for both routes. defaults to 'shared_window'
+        :type window_option: str, optional
+        :returns: number of overlapping windows
+        :rtype: {int}
+        """
 
+        shared_wind_IDs = self.get_xlnk_wind_IDs() & other.get_xlnk_wind_IDs()
 
-        return overlap_count
+        if window_option =='shared_window':
+            #  only count true overlaps, meaning there's not enough space in the window for both routes
+            xlnk_winds_by_ID = self._get_xlnk_winds_by_ID()
+            dv = self.data_vol + other.data_vol
+            return sum(1 for wind_ID in shared_wind_IDs if dv > xlnk_winds_by_ID[wind_ID].data_vol)
+        elif window_option == 'mutex_window':
+            return len(shared_wind_IDs)
+        else:
+            raise NotImplementedError
 
     def is_overlapping(self,other,window_option ='shared_window'):
+        """ check if self and other overlap on any xlnk window (see count_overlap())"""
 
-        overlap_count = 0
-        for wind1 in self.route:
-            if type(wind1) != XlnkWindow:
-                continue
-
-            for wind2 in  other.route:
-                if type(wind2) != XlnkWindow:
-                    continue
-
-                if wind1 == wind2:
-                    if window_option =='shared_window':
-                        #  only count true overlaps, meaning there's not enough space in the window for both routes
-                        if self.data_vol + other.data_vol > wind1.data_vol: 
-                            return True
-                    elif window_option == 'mutex_window':
-                        return True
-                    else:
-                        raise NotImplementedError
+        shared_wind_IDs = self.get_xlnk_wind_IDs() & other.get_xlnk_wind_IDs()
 
-        return False
+        if window_option =='shared_window':
+            #  only count true overlaps, meaning there's not enough space in the window for both routes
+            xlnk_winds_by_ID = self._get_xlnk_winds_by_ID()
+            dv = self.data_vol + other.data_vol
+            return any(dv > xlnk_winds_by_ID[wind_ID].data_vol for wind_ID in shared_wind_IDs)
+        elif window_option == 'mutex_window':
+            return len(shared_wind_IDs) > 0
+        else:
+            raise NotImplementedError
 
     def get_data_storage_intervals(self):
         storage_intervals = []
@@ -550,6 +579,267 @@ class DataRoute:
     #     elif type(end_wind) == ObsWindow:
     #         return end_wind.sat_indx
 
+class _RouteSeqs:
+    """ the window ID, window object type and start sat sequences for a CompactDataRoute, shared between all the compact routes with the same sequences"""
+
+    #  __weakref__ so that these can go in the (weak) intern table. Tuples and bytes can't be weakly referenced themselves
+    __slots__ = ('wind_IDs','wind_obj_types','start_sats_bytes','__weakref__')
+
+    def __init__(self,wind_IDs,wind_obj_types,start_sats_bytes):
+        self.wind_IDs = wind_IDs
+        self.wind_obj_types = wind_obj_types
+        self.start_sats_bytes = start_sats_bytes
+
+class CompactDataRoute:
+    """ immutable, compact version of a DataRoute
+
+    Stores the route as a tuple of window IDs (and window object types, since those are separate window ID namespaces), the start sat for each window as an int16 array, and the data volume. The window ID, window object type and start sat sequences are interned, so candidate routes that go through the same windows (with the same start sats) share them. The intern table only holds the sequences weakly, so they're freed once no route uses them. There's no scheduled data volume - convert to a DataRoute for scheduling.
+
+    Convert with from_data_route() and to_data_route(). Converting back to a DataRoute needs the window objects, looked up by window key (see get_winds_by_key())
+    """
+
+    __slots__ = ('ID','_seqs','data_vol','obs_dv_multiplier')
+
+    #  table of interned sequences, keyed by (window IDs, window object types, start sat bytes). Weak, so entries drop out when no route uses them anymore. The key holds the same tuple and bytes objects as the _RouteSeqs, so it doesn't add any copies
+    _interned = weakref.WeakValueDictionary()
+
+    def __init__(self,ro_ID,wind_IDs,wind_obj_types,start_sats,dv,obs_dv_multiplier=1):
+        """
+        :param ro_ID: ID of the route
+        :type ro_ID: RoutingObjectID
+        :param wind_IDs: IDs of the windows in the route, in order from the obs window to the dlnk window
+        :type wind_IDs: iterable(int)
+        :param wind_obj_types: window object type for each window in the route
+        :type wind_obj_types: iterable(str)
+        :param start_sats: sat index that the data is on at the start of each window in the route
+        :type start_sats: iterable(int)
+        :param dv: data volume of the route
+        :type dv: float
+        :param obs_dv_multiplier: see DataRoute, defaults to 1
+        :type obs_dv_multiplier: number, optional
+        """
+
+        if not type(ro_ID) == RoutingObjectID:
+            raise RuntimeWarning(' should not use anything but a RoutingObjectID as the ID for a CompactDataRoute')
+
+        wind_IDs = tuple(wind_IDs)
+        wind_obj_types = tuple(wind_obj_types)
+        start_sats_bytes = np.asarray(start_sats,dtype=np.int16).tobytes()
+
+        if not len(wind_IDs) == len(wind_obj_types) == len(start_sats_bytes)//2:
+            raise ValueError('wind_IDs, wind_obj_types and start_sats should all be the same length')
+
+        object.__setattr__(self,'ID',ro_ID)
+        object.__setattr__(self,'_seqs',self.intern(wind_IDs,wind_obj_types,start_sats_bytes))
+        object.__setattr__(self,'data_vol',dv)
+        object.__setattr__(self,'obs_dv_multiplier',obs_dv_multiplier)
+
+    @classmethod
+    def intern(cls,wind_IDs,wind_obj_types,start_sats_bytes):
+        """ return the interned sequences matching the given ones, adding them to the intern table if they're not already there
+
+        :param wind_IDs: window IDs
+        :type wind_IDs: tuple(int)
+        :param wind_obj_types: window object types
+        :type wind_obj_types: tuple(str)
+        :param start_sats_bytes: int16 start sat indices, as bytes
+        :type start_sats_bytes: bytes
+        :rtype: {_RouteSeqs}
+        """
+
+        key = (wind_IDs,wind_obj_types,start_sats_bytes)
+        seqs = cls._interned.get(key)
+        if seqs is None:
+            seqs = _RouteSeqs(wind_IDs,wind_obj_types,start_sats_bytes)
+            cls._interned[key] = seqs
+        return seqs
+
+    @classmethod
+    def clear_intern_table(cls):
+        """ empty the intern table. Routes that already exist keep their sequences, they just aren't shared with routes created after this. Not needed to free memory, as sequences that no route uses drop out of the table on their own"""
+        cls._interned.clear()
+
+    @staticmethod
+    def get_winds_by_key(winds):
+        """ make the window lookup dictionary needed by to_data_route()
+
+        :param winds: all of the windows that routes could go through
+        :type winds: iterable(ActivityWindow)
+        :returns: windows keyed by (window ID, window object type)
+        :rtype: {dict}
+        """
+        return {(wind.window_ID,wind.wind_obj_type): wind for wind in winds}
+
+    @classmethod
+    def from_data_route(cls,dr):
+        """ make a compact route from a DataRoute
+
+        :param dr: data route
+        :type dr: DataRoute
+        :rtype: {CompactDataRoute}
+        """
+
+        return cls(
+            dr.ID,
+            (wind.window_ID for wind in dr.route),
+            (wind.wind_obj_type for wind in dr.route),
+            [dr.window_start_sats[wind] for wind in dr.route],
+            dr.data_vol,
+            dr.obs_dv_multiplier
+        )
+
+    def to_data_route(self,winds_by_key,dv_epsilon=1e-5):
+        """ make a DataRoute from self
+
+        :param winds_by_key: windows keyed by (window ID, window object type) (see get_winds_by_key())
+        :type winds_by_key: dict
+        :param dv_epsilon: dv_epsilon for the data route, defaults to 1e-5
+        :type dv_epsilon: float, optional
+        :returns: new data route, with the same ID as self
+        :rtype: {DataRoute}
+        """
+
+        route = self.get_winds(winds_by_key)
+        window_start_sats = {wind: int(sat_indx) for wind, sat_indx in zip(route,self.start_sats)}
+        return DataRoute(None,None,route=route,window_start_sats=window_start_sats,dv=self.data_vol,dv_epsilon=dv_epsilon,obs_dv_multiplier=self.obs_dv_multiplier,ro_ID=self.ID)
+
+    @property
+    def wind_IDs(self):
+        """ tuple of the window ID for each window in the route"""
+        return self._seqs.wind_IDs
+
+    @property
+    def wind_obj_types(self):
+        """ tuple of the window object type for each window in the route"""
+        return self._seqs.wind_obj_types
+
+    @property
+    def start_sats(self):
+        """ read-only int16 array of the start sat index for each window in the route"""
+        return np.frombuffer(self._seqs.start_sats_bytes,dtype=np.int16)
+
+    @property
+    def wind_keys(self):
+        """ (window ID, window object type) for each window in the route"""
+        return tuple(zip(self.wind_IDs,self.wind_obj_types))
+
+    def get_winds(self,winds_by_key):
+        """ get the window objects in the route, looked up in winds_by_key (see get_winds_by_key())"""
+        return [winds_by_key[wind_key] for wind_key in zip(self.wind_IDs,self.wind_obj_types)]
+
+    def with_dv(self,dv):
+        """ get a copy of self with data volume dv"""
+        return type(self)(self.ID,self.wind_IDs,self.wind_obj_types,self.start_sats,dv,self.obs_dv_multiplier)
+
+    def __setattr__(self,name,value):
+        raise AttributeError('CompactDataRoute is immutable')
+
+    def __delattr__(self,name):
+        raise AttributeError('CompactDataRoute is immutable')
+
+    def __reduce__(self):
+        #  needed because the default pickling for __slots__ classes goes through __setattr__. Re-interns the sequences on load
+        return (type(self),(self.ID,self.wind_IDs,self.wind_obj_types,self.start_sats,self.data_vol,self.obs_dv_multiplier))
+
+    def __copy__(self):
+        #  immutable, so no need for an actual copy
+        return self
+
+    def __hash__(self):
+        return hash(self.ID)
+
+    def __eq__(self, other):
+        return self.ID == other.ID
+
+    def __len__(self):
+        return len(self.wind_IDs)
+
+    def __repr__(self):
+        return '(cdr %s: winds %s; dv %.0f Mb)'%(self.ID,self.wind_IDs,self.data_vol)
+
+
+def get_overlapping_route_pairs(routes,window_option='shared_window'):
+    """ find all of the pairs of data routes that overlap on at least one xlnk window
+
+    Equivalent to calling DataRoute.count_overlap() on every pair of routes, but goes through an index of which routes use each xlnk window, so only routes that actually share windows are compared
+
+    :param routes: data routes to check
+    :type routes: list(DataRoute)
+    :param window_option: 'shared_window' or 'mutex_window' (see DataRoute.count_overlap()), defaults to 'shared_window'
+    :type window_option: str, optional
+    :returns: overlap count for every overlapping pair, keyed by the (lower, higher) indices of the routes in routes
+    :rtype: {dict}
+    """
+
+    if not window_option in ['shared_window','mutex_window']:
+        raise NotImplementedError
+
+    #  indices of the routes that use each xlnk window
+    route_indcs_by_wind_ID = {}
+    xlnk_winds_by_ID = {}
+    for route_indx, route in enumerate(routes):
+        for wind_ID, wind in route._get_xlnk_winds_by_ID().items():
+            route_indcs_by_wind_ID.setdefault(wind_ID,[]).append(route_indx)
+            xlnk_winds_by_ID.setdefault(wind_ID,wind)
+
+    overlap_counts = {}
+    for wind_ID, route_indcs in route_indcs_by_wind_ID.items():
+        wind_dv = xlnk_winds_by_ID[wind_ID].data_vol
+        for i, route_indx1 in enumerate(route_indcs):
+            route1_dv = routes[route_indx1].data_vol
+            for route_indx2 in route_indcs[i+1:]:
+                #  only count true overlaps, meaning there's not enough space in the window for both routes
+                if window_option == 'shared_window' and not route1_dv + routes[route_indx2].data_vol > wind_dv:
+                    continue
+                pair = (route_indx1,route_indx2)
+                overlap_counts[pair] = overlap_counts.get(pair,0) + 1
+
+    return overlap_counts
+
+
+class WindowCapacityLedger:
+    """ keeps track of the data volume still available in each activity window, as routes are allotted data volume through them
+
+    A window that hasn't been used yet has all of its data volume available. Note that a window's data volume is read when the window is first used, so if window data volumes change after that, the ledger should be rebuilt
+    """
+
+    def __init__(self):
+        #  remaining data volume by window, for all windows that have been used
+        self.avail_dv_by_wind = {}
+
+    def get_avail_dv(self,wind):
+        """ get the remaining data volume for wind"""
+        return self.avail_dv_by_wind.get(wind,wind.data_vol)
+
+    def get_route_avail_dv(self,dr,max_dv):
+        """ get the data volume that could be allotted to route dr, given the remaining data volume in each of its windows
+
+        :param dr: data route
+        :type dr: DataRoute
+        :param max_dv: most data volume that would be allotted to the route
+        :type max_dv: float
+        :returns: allottable data volume (<= max_dv)
+        :rtype: {float}
+        """
+
+        route_dv = max_dv
+        for wind in dr.get_winds():
+            usable_wind_dv = min(self.get_avail_dv(wind),max_dv)
+            route_dv = min(route_dv, usable_wind_dv)
+        return route_dv
+
+    def use_dv(self,winds,dv):
+        """ mark data volume dv as used in each of winds"""
+        for wind in winds:
+            #  if we didn't yet encounter this window
+            self.avail_dv_by_wind.setdefault(wind,wind.data_vol)
+            self.avail_dv_by_wind[wind] -= dv
+
+    def release_dv(self,winds,dv):
+        """ mark data volume dv as no longer used in each of winds"""
+        self.use_dv(winds,-dv)
+
+
 class DataMultiRoute:
     """ aggregates multiple DataRoute objects
     
@@ -584,6 +874,57 @@ class DataMultiRoute:
             if not type(dr) == DataRoute:
                 raise RuntimeError('only data route objects should be used to construct a new data multi-route')
 
+        #  index of which data routes go through each window
+        self._build_wind_index()
+
+    def _build_wind_index(self):
+        """ build the index of which data routes within self go through each window"""
+
+        self._drs_by_wind = {}
+        for dr in self.data_routes:
+            self._add_dr_to_wind_index(dr)
+
+        # keep track of which data routes list was indexed, so we can tell if it's changed out from under us
+        self._indexed_data_routes = self.data_routes
+        self._num_indexed_data_routes = len(self.data_routes)
+
+        self._clear_winds_caches()
+        self.reset_capacity_ledger()
+
+    def reset_capacity_ledger(self):
+        """ rebuild the record of how much data volume is still available in each window, after the data routes already in self
+
+        This is kept up to date by accumulate_dr(), and rebuilt automatically if the data routes are changed elsewhere. Call it directly if the data volumes of the windows or data routes in self change
+        """
+
+        self._capacity_ledger = WindowCapacityLedger()
+        for dr in self.data_routes:
+            self._capacity_ledger.use_dv(dr.get_winds(),dr.data_vol)
+
+    def _clear_winds_caches(self):
+        #  the set of windows in self, and the same windows sorted by center time. These are built from the window index when first needed
+        self._winds_set = None
+        self._winds_by_center = None
+
+    def _add_dr_to_wind_index(self,dr):
+        for wind in dr.get_winds():
+            drs = self._drs_by_wind.setdefault(wind,[])
+            # only list a data route once for a window. All of dr's windows are added together, so if dr is already listed for this window it's at the end
+            if len(drs) == 0 or drs[-1] is not dr:
+                drs.append(dr)
+
+    def _check_wind_index(self):
+        """ rebuild the window index if the data routes have been changed other than through accumulate_dr() (or if self was pickled before the index existed)"""
+
+        if getattr(self,'_indexed_data_routes',None) is not self.data_routes or self._num_indexed_data_routes != len(self.data_routes):
+            self._build_wind_index()
+
+    def get_drs_for_wind(self,wind):
+        """ get the data routes within self that go through wind, in the same order as self.data_routes"""
+
+        self._check_wind_index()
+        return self._drs_by_wind.get(wind,[])
+
     def __copy__(self):
 
         data_routes = [copy(data_route) for data_route in self.data_routes]
@@ -604,7 +945,8 @@ class DataMultiRoute:
         return  '(DataMultiRoute %s: %s)'%(self.ID,self.get_display_string())
 
     def __contains__(self,wind):
-        return wind in self.get_winds()
+        self._check_wind_index()
+        return wind in self._drs_by_wind
 
     def get_display_string(self):
         return 'sched/poss_dv_by_dr: %s'%({'DR - '+dr.get_route_string():'%d/%d'%(dv,self.data_vol_by_dr[dr]) for dr,dv in self.scheduled_dv_by_dr.items()})
@@ -651,7 +993,7 @@ class DataMultiRoute:
     # todo: I was a little carless before and used dmr.data_vol in places to get the data vol for windows, where i should have been using data_vol_for_wind(). I think I got most of these, but it would be good to do another sweep of the code later to check. Also it would be good in general if, when getting the data volume for a window from a data route, even just a plain DataRoute, data_vol_for_wind() were used. This points to the need to make DR and DMR actually have an inheritence relationship...
     def data_vol_for_wind(self,wind):
         """Get the amount of data volume of wind used within this route"""
-        wind_sum = sum(dv for dr,dv in self.data_vol_by_dr.items() if wind in dr.get_winds())
+        wind_sum = sum(self.data_vol_by_dr[dr] for dr in self.get_drs_for_wind(wind))
 
         if wind_sum == 0:
             raise KeyError('Found zero data volume for window, which assumedly means it is not in the route. self: %s, wind: %s'%(self,wind))
@@ -672,7 +1014,7 @@ class DataMultiRoute:
     def scheduled_dv_for_wind(self,wind):
         if self.has_scheduled_dv:
             # note: don't check minimum data volume here because scheduled data volume could go to zero
-            return sum(s_dv for dr,s_dv in self.scheduled_dv_by_dr.items() if wind in dr.get_winds())
+            return sum(self.scheduled_dv_by_dr[dr] for dr in self.get_drs_for_wind(wind))
         else:
             return const.UNASSIGNED    
 
@@ -700,12 +1042,29 @@ class DataMultiRoute:
     def get_winds(self):
         """ get the set of windows from all of the routes contained within this multi-route
         
-        Returns the set of all windows from all the DataRoutes within. Note that this is a set, so each window only shows up once
-        :returns: [description]
-        :rtype: {[type]}
+        Returns the set of all windows from all the DataRoutes within. Note that this is a set, so each window only shows up once. The set is cached until the data routes change, so it's a frozenset - copy it if you need to modify it
+        :returns: all windows in self
+        :rtype: {frozenset}
+        """
+
+        self._check_wind_index()
+        if getattr(self,'_winds_set',None) is None:
+            # (built the same way as the set used to be, so iteration order is unchanged)
+            self._winds_set = frozenset(wind for dr in self.data_routes for wind in dr.get_winds())
+        return self._winds_set
+
+    def get_winds_by_center(self):
+        """ get all windows from all of the routes contained within this multi-route, sorted by center time
+
+        Cached until the data routes change
+        :returns: all windows in self, sorted by center time
+        :rtype: {tuple}
         """
 
-        return set(wind for dr in self.data_routes for wind in dr.get_winds())
+        self._check_wind_index()
+        if getattr(self,'_winds_by_center',None) is None:
+            self._winds_by_center = tuple(sorted(self.get_winds(),key=lambda w:w.center))
+        return self._winds_by_center
 
     def get_obs( self):
         #  use first route because all routes should have the same observation
@@ -759,12 +1118,18 @@ class DataMultiRoute:
             assert(dv >= 0 - self.dv_epsilon)
 
 
-    def accumulate_dr( self, candidate_dr,min_dmr_candidate_dv=0):
+    def accumulate_dr( self, candidate_dr,min_dmr_candidate_dv=0,shared_ledger=None):
         """ add a simple data route to this data multi route
         
-        [description]
-        :param dmrs: data multi routes to combine into a new multiroute
-        :type dmrs: list(DataMultiRoute)
+        The window data volume already occupied by the data routes within self is kept in a ledger that's updated as routes are added, so the cost of this only depends on the length of the candidate route
+        :param candidate_dr: data route to add
+        :type candidate_dr: DataRoute
+        :param min_dmr_candidate_dv: only add the candidate if more than this much data volume can be allotted to it, defaults to 0
+        :type min_dmr_candidate_dv: float, optional
+        :param shared_ledger: if given, the candidate is also limited by the data volume remaining in this ledger, and the data volume allotted to it is marked as used there. Share one ledger across multiple DMRs to keep track of window capacity across all of them, defaults to None
+        :type shared_ledger: WindowCapacityLedger, optional
+        :returns: True if the candidate was added
+        :rtype: {bool}
         """
 
         # need to have matching observation and downlink for candidate to be added on to the multi-route
@@ -773,26 +1138,27 @@ class DataMultiRoute:
         if not candidate_dr.get_dlnk() == self.get_dlnk():
             return False
 
-        avail_dv_by_wind = {}
-         # figure out what window data volume is already occupied by the data routes within self        
-        for dr in self.data_routes:
-            for wind in dr.get_winds():
-                #  if we didn't yet encounter this window in any of the routes in self
-                avail_dv_by_wind.setdefault(wind,wind.data_vol)
-                avail_dv_by_wind[wind] -= dr.data_vol
+        # make sure the ledger is up to date with the data routes in self
+        self._check_wind_index()
 
         #  figure out how much data volume can be allotted to the candidate data route
-        candidate_dv =candidate_dr.data_vol
-        for wind in candidate_dr.get_winds():
-            usable_wind_dv = min(avail_dv_by_wind.get(wind,wind.data_vol),candidate_dr.data_vol)
-
-            candidate_dv = min(candidate_dv, usable_wind_dv)
+        candidate_dv = self._capacity_ledger.get_route_avail_dv(candidate_dr,candidate_dr.data_vol)
+        if shared_ledger is not None:
+            candidate_dv = shared_ledger.get_route_avail_dv(candidate_dr,candidate_dv)
 
         #  if there is enough data volume left, then add the data  route
         if candidate_dv > min_dmr_candidate_dv:
+            # note that the full data volume of the route is considered occupied within self (the same as when the ledger is rebuilt), but only the allotted data volume is marked as used in the shared ledger
+            self._capacity_ledger.use_dv(candidate_dr.get_winds(),candidate_dr.data_vol)
+            if shared_ledger is not None:
+                shared_ledger.use_dv(candidate_dr.get_winds(),candidate_dv)
+
             self.data_routes.append(candidate_dr)
             self.data_vol_by_dr[candidate_dr] = candidate_dv
             self.scheduled_dv_by_dr[candidate_dr] = const.UNASSIGNED
+            self._add_dr_to_wind_index(candidate_dr)
+            self._num_indexed_data_routes += 1
+            self._clear_winds_caches()
             return True
         else:
             return False
@@ -834,9 +1200,10 @@ class DataMultiRoute:
         if not self.contains_route(rt):
             raise RuntimeWarning('Attempting to find next planned wind for a non-contained route (self: %s, other rt: %s)'%(self,rt))
 
-        rt_winds = rt.get_winds()
+        # note: make this a set - DataRoute.get_winds() gives a generator, which would get used up by the membership checks below
+        rt_winds = set(rt.get_winds())
         # check every wind in self - the first wind that doesn't show up in rt is the next wind planned for rt. Make sure to look through self winds in temporal order
-        for wind in sorted(self.get_winds(),key=lambda w:w.center):
+        for wind in self.get_winds_by_center():
             if wind in rt_winds:
                 continue
             else:
@@ -4,10 +4,63 @@
 # 
 # @author Kit Kennedy
 
+import json
+import numbers
 from copy import copy, deepcopy
-from datetime import timedelta
+from datetime import datetime, timedelta
 from math import floor, ceil
 
+import numpy as np
+
+# datetime format used in the JSON headers of saved dancecards
+DANCECARD_HEADER_DT_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+def save_dancecard_arrays(base_path,values,header):
+    """ save a numeric dancecard array to base_path.npy, with its JSON header in base_path.json
+
+    :param base_path:  path to save to, without file extension
+    :type base_path: str
+    :param values:  numeric dancecard values
+    :type values: np.ndarray
+    :param header:  dancecard header info (start, end, tstep, mode, ...). datetimes are converted to strings
+    :type header: dict
+    """
+
+    header = dict(header)
+    for key in ['start','end']:
+        header[key] = header[key].strftime(DANCECARD_HEADER_DT_FORMAT)
+    header['dtype'] = str(values.dtype)
+    header['shape'] = list(values.shape)
+
+    np.save(base_path+'.npy',values)
+    with open(base_path+'.json','w') as f:
+        json.dump(header,f,indent=4)
+
+def load_dancecard_arrays(base_path,mmap_mode='r'):
+    """ load a numeric dancecard array saved with save_dancecard_arrays()
+
+    By default the array is memory-mapped, so nothing is read from disk until it's actually sliced. This means very large dancecards can be opened for post-run analysis without loading them into memory.
+
+    :param base_path:  path the dancecard was saved to, without file extension
+    :type base_path: str
+    :param mmap_mode:  memory-map mode passed to np.load (None to load fully into memory), defaults to 'r'
+    :type mmap_mode: str, optional
+    :returns:  the values array and the header dict (with datetimes parsed)
+    :rtype: {np.ndarray, dict}
+    """
+
+    with open(base_path+'.json','r') as f:
+        header = json.load(f)
+    for key in ['start','end']:
+        header[key] = datetime.strptime(header[key],DANCECARD_HEADER_DT_FORMAT)
+
+    values = np.load(base_path+'.npy',mmap_mode=mmap_mode)
+
+    if list(values.shape) != header['shape']:
+        raise RuntimeWarning('Dancecard array shape (%s) does not match header shape (%s) for %s'%(values.shape,header['shape'],base_path))
+
+    return values,header
+
 class Dancecard(object):
     def __init__(self, dancecard_start_dt, dancecard_end_dt, tstep_sec, item_init=list,item_type=list,mode='timestep'):
         """ Maintains a time series of objects for use in scheduling problems
@@ -442,4 +495,329 @@ class Dancecard(object):
                 try:
                     self.dancecard[indx].remove(wind)  # remove object
                 except ValueError:
-                    pass  #already been removed
\ No newline at end of file
+                    pass  #already been removed
+
+
+    def get_indx_slice_for_t_range(self,start,end):
+        """ get a slice object for the time indices between start and end (inclusive of the index containing end)
+
+        Useful for pulling out just a time range of interest from a large (possibly memory-mapped) dancecard
+        """
+
+        if self.mode == 'timestep':
+            start_indx = max(0,self.get_ts_indx_from_t(start))
+            end_indx = min(self.num_timesteps-1,self.get_ts_indx_from_t(end))
+        elif self.mode == 'timepoint':
+            start_indx = max(0,self.get_tp_indx_post_t(start,ignore_out_of_bounds=True))
+            end_indx = min(self.num_timepoints-1,self.get_tp_indx_pre_t(end,ignore_out_of_bounds=True))
+        else:
+            raise NotImplementedError
+
+        return slice(start_indx,end_indx+1)
+
+    def save_numeric(self,base_path,dtype=np.float64):
+        """ save this dancecard to disk as a .npy array with a JSON header
+
+        Only valid for dancecards storing numbers (e.g. item_init=None), whatever item_type is; unset (None) entries are stored as NaN. See load_numeric()
+
+        :param base_path:  path to save to, without file extension
+        :type base_path: str
+        :param dtype:  numpy data type to store values as, defaults to np.float64
+        :type dtype: numpy dtype, optional
+        """
+
+        # check the items themselves rather than item_type, which defaults to list even for numeric dancecards. A loaded numeric dancecard is already an array
+        if not isinstance(self.dancecard,np.ndarray) and any(not (item is None or isinstance(item,numbers.Number)) for item in self.dancecard):
+            raise RuntimeWarning("this method can only be used if this dancecard stores numbers (or None)")
+
+        header = {'type': 'Dancecard','start': self.dancecard_start_dt,'end': self.dancecard_end_dt,'tstep': self.tstep_sec,'mode': self.mode}
+        save_dancecard_arrays(base_path,np.array(self.dancecard,dtype=dtype),header)
+
+    @classmethod
+    def load_numeric(cls,base_path,mmap_mode='r'):
+        """ load a numeric dancecard saved with save_numeric()
+
+        The internal dancecard is a (by default memory-mapped, read-only) numpy array rather than a list, so slicing only reads the time range requested
+
+        :param base_path:  path the dancecard was saved to, without file extension
+        :type base_path: str
+        :param mmap_mode:  memory-map mode passed to np.load (None to load fully into memory), defaults to 'r'
+        :type mmap_mode: str, optional
+        :returns:  the loaded dancecard
+        :rtype: {Dancecard}
+        """
+
+        values,header = load_dancecard_arrays(base_path,mmap_mode)
+
+        if header['type'] != 'Dancecard':
+            raise RuntimeWarning('Expected a saved Dancecard, found %s'%(header['type']))
+
+        # construct on a zero-length time grid so we don't allocate a throwaway list, then fix up the time grid
+        newone = cls(header['start'],header['start'],header['tstep'],item_init=None,item_type=values.dtype.type,mode=header['mode'])
+        newone.total_duration = (header['end'] - header['start']).total_seconds()
+        newone.num_timesteps = int(newone.total_duration / header['tstep'])
+        newone.num_timepoints = newone.num_timesteps+1
+        newone.dancecard_end_dt = header['end']
+        newone.dancecard = values
+        return newone
+
+
+class ConstellationDancecard(object):
+    def __init__(self, num_agents, dancecard_start_dt, dancecard_end_dt, tstep_sec, dtype=np.int32, mode='timestep'):
+        """ Maintains a numeric time series for every agent in the constellation, on a single shared time grid
+
+        This is the 2-D analog of Dancecard. Rather than keeping one Dancecard per satellite (and stitching them together to answer cross-satellite questions like ground station contention or simultaneous downlinks), all agents share one contiguous numpy array indexed by (agent index, time index). The time grid follows exactly the same conventions as Dancecard, in both "timestep" and "timepoint" modes ( see Dancecard for the dancecard structure diagrams).
+
+        Note that unlike Dancecard, this only stores numbers, not arbitrary objects. Adding an interval adds a value to every time index covered by the interval, so the default usage (value of 1) produces an occupancy count for each agent at each time.
+
+        :param num_agents:  number of agents (e.g. satellites) in the dancecard
+        :type num_agents: int
+        :param dancecard_start_dt:  start time for the dance card
+        :type dancecard_start_dt: datetime
+        :param dancecard_end_dt: end time for the dance card
+        :type dancecard_end_dt: datetime
+        :param tstep_sec:  time step in seconds
+        :type tstep_sec:  float
+        :param dtype: numpy data type for the stored values, defaults to np.int32
+        :type dtype: numpy dtype, optional
+        :param mode: "timestep" or "timepoint", defaults to 'timestep'
+        :type mode: str, optional
+        """
+
+        self.total_duration = (dancecard_end_dt - dancecard_start_dt).total_seconds()
+        num_timesteps = int(self.total_duration / tstep_sec)
+        num_timepoints = num_timesteps+1
+
+        if mode == 'timestep':
+            num_indcs = num_timesteps
+        elif mode == 'timepoint':
+            num_indcs = num_timepoints
+        else:
+            raise NotImplementedError
+
+        # rows are agents, columns are time indices. One single allocation for the whole constellation
+        self.dancecard = np.zeros((num_agents,num_indcs),dtype=dtype)
+
+        self.num_agents = num_agents
+        self.dancecard_start_dt = dancecard_start_dt
+        self.dancecard_end_dt = dancecard_end_dt
+        self.tstep_sec = tstep_sec
+        self.tstep_td = timedelta(seconds=tstep_sec)
+        self.num_timesteps = num_timesteps
+        self.num_timepoints = num_timepoints
+        self.mode = mode
+
+    def __setitem__(self, key, value):
+        """ setter for internal dancecard by (agent index, time index)"""
+        self.dancecard[key] = value
+
+    def __getitem__(self, key):
+        """ getter for internal dancecard by (agent index, time index)"""
+        return self.dancecard[key]
+
+    def get_ts_indx_from_t(self, t, in_units='datetime'):
+        """get index of time step containing time t (see Dancecard.get_ts_indx_from_t)"""
+
+        if in_units == 'datetime':
+            return Dancecard.get_ts_indx(t, self.dancecard_start_dt, self.tstep_sec)
+        else:
+            raise NotImplementedError
+
+    def get_pre_tp_from_ts_indx(self, ts_indx,out_units='datetime'):
+        """ get time point preceding time step index (see Dancecard.get_pre_tp_from_ts_indx)"""
+
+        if out_units == 'datetime':
+            return self.dancecard_start_dt + timedelta(seconds=ts_indx*self.tstep_sec)
+        else:
+            raise NotImplementedError
+
+    def get_interval_indcs(self,starts,ends,drop_out_of_bounds=False):
+        """ get the inclusive time index ranges covered by a set of intervals
+
+        Uses the same index rounding conventions as Dancecard.add_item_in_interval() for the current mode, but operates on all of the intervals at once. Intervals that do not cover any time index come back with end index < start index.
+
+        :param starts:  start times for the intervals
+        :type starts: list(datetime)
+        :param ends:  end times for the intervals
+        :type ends: list(datetime)
+        :param drop_out_of_bounds:  if True, clip intervals to the dancecard rather than raising an error, defaults to False
+        :type drop_out_of_bounds: bool, optional
+        :returns: first and last (inclusive) time indices for every interval
+        :rtype: {np.ndarray, np.ndarray}
+        :raises: ValueError
+        """
+
+        start_secs = np.array([(start - self.dancecard_start_dt).total_seconds() for start in starts],dtype=np.float64)
+        end_secs = np.array([(end - self.dancecard_start_dt).total_seconds() for end in ends],dtype=np.float64)
+
+        if not drop_out_of_bounds and len(start_secs) > 0:
+            if np.any(start_secs < 0):
+                raise ValueError('found interval start before dancecard start (%s)'%(self.dancecard_start_dt.isoformat()))
+            if np.any(end_secs > self.total_duration):
+                raise ValueError('found interval end after dancecard end (%s)'%(self.dancecard_end_dt.isoformat()))
+
+        if self.mode == 'timepoint':
+            dancecard_last_indx = self.num_timepoints - 1
+            # same as get_tp_indx_post_t and get_tp_indx_pre_t in Dancecard
+            start_indcs = np.ceil(start_secs / self.tstep_sec).astype(np.int64)
+            end_indcs = np.floor(end_secs / self.tstep_sec).astype(np.int64)
+        elif self.mode == 'timestep':
+            dancecard_last_indx = self.num_timesteps - 1
+            # same as get_ts_indx in Dancecard
+            start_indcs = np.floor(start_secs / self.tstep_sec).astype(np.int64)
+            end_indcs = np.floor(end_secs / self.tstep_sec).astype(np.int64)
+        else:
+            raise NotImplementedError
+
+        start_indcs = np.maximum(start_indcs,0)
+        end_indcs = np.minimum(end_indcs,dancecard_last_indx)
+
+        return start_indcs,end_indcs
+
+    def add_intervals(self,intervals,value=1,drop_out_of_bounds=False):
+        """ bulk add a set of (agent index, start, end) intervals to the dancecard
+
+        Adds value to every time index covered by each interval (inclusive of the end index, as in Dancecard). This is done with a single difference array and cumulative sum over the time axis, so the cost is O(num intervals + num agents * num time indices) regardless of interval lengths.
+
+        :param intervals:  list of (agent index, start datetime, end datetime) tuples, e.g. from a window table
+        :type intervals: list(tuple)
+        :param value:  value to add over each interval, defaults to 1
+        :type value: number, optional
+        :param drop_out_of_bounds:  if True, clip intervals to the dancecard rather than raising an error, defaults to False
+        :type drop_out_of_bounds: bool, optional
+        """
+
+        if len(intervals) == 0:
+            return
+
+        agent_indcs,starts,ends = zip(*intervals)
+        agent_indcs = np.array(agent_indcs,dtype=np.int64)
+        start_indcs,end_indcs = self.get_interval_indcs(starts,ends,drop_out_of_bounds)
+
+        # ignore intervals that don't cover any time index (e.g. out of bounds entirely)
+        valid = end_indcs >= start_indcs
+        agent_indcs = agent_indcs[valid]
+        start_indcs = start_indcs[valid]
+        end_indcs = end_indcs[valid]
+
+        num_indcs = self.dancecard.shape[1]
+        # one extra column so that intervals running to the last index have somewhere to put their decrement
+        diff = np.zeros((self.num_agents,num_indcs+1),dtype=self.dancecard.dtype)
+        np.add.at(diff,(agent_indcs,start_indcs),value)
+        np.add.at(diff,(agent_indcs,end_indcs+1),-value)
+
+        self.dancecard += np.cumsum(diff[:,:-1],axis=1,dtype=self.dancecard.dtype)
+
+    def add_winds_to_dancecard(self,winds,agent_indx_getter=None,wind_time_getter_func=None,value=1,drop_out_of_bounds=False):
+        """ bulk add a set of windows to the dancecard according to their start and end times
+
+        :param winds: windows to add
+        :type winds: list(EventWindow)
+        :param agent_indx_getter: function returning the agent index for a window, defaults to using wind.sat_indx
+        :type agent_indx_getter: function, optional
+        :param wind_time_getter_func: function(wind,time_opt) returning window start/end times (as in Dancecard.add_winds_to_dancecard), defaults to using wind.start and wind.end
+        :type wind_time_getter_func: function, optional
+        """
+
+        if not agent_indx_getter:
+            def agent_indx_getter(wind): return wind.sat_indx
+
+        if not wind_time_getter_func:
+            def wind_time_getter_func(wind,time_opt):
+                if time_opt == 'start': return wind.start
+                if time_opt == 'end': return wind.end
+
+        intervals = [(agent_indx_getter(wind),wind_time_getter_func(wind,'start'),wind_time_getter_func(wind,'end')) for wind in winds]
+        self.add_intervals(intervals,value,drop_out_of_bounds)
+
+    def get_agent_row(self,agent_indx):
+        """ get the time series for a single agent (a view, not a copy)"""
+        return self.dancecard[agent_indx,:]
+
+    def get_column_at_indx(self,indx):
+        """ get the values for all agents at time index indx (a view, not a copy)"""
+        return self.dancecard[:,indx]
+
+    def get_column_at_t(self,t):
+        """ get the values for all agents at time t
+
+        In timestep mode this is the time step containing t, in timepoint mode it's the closest preceding time point
+        """
+
+        if self.mode == 'timestep':
+            indx = self.get_ts_indx_from_t(t)
+        elif self.mode == 'timepoint':
+            indx = floor((t - self.dancecard_start_dt).total_seconds() / self.tstep_sec)
+        else:
+            raise NotImplementedError
+
+        return self.get_column_at_indx(indx)
+
+    def get_active_agents_at_indx(self,indx):
+        """ get the indices of all agents with nonzero value at time index indx"""
+        return np.flatnonzero(self.dancecard[:,indx])
+
+    def get_num_active_agents(self):
+        """ get the number of agents with a nonzero value at every time index
+
+        :returns:  count of active agents for each time index
+        :rtype: {np.ndarray}
+        """
+        return np.count_nonzero(self.dancecard,axis=0)
+
+    def get_contention_indcs(self,max_active_agents=1):
+        """ get all time indices at which more than max_active_agents agents are active
+
+        e.g. for a dancecard populated with the downlinks for a single ground station, this returns the time indices at which multiple satellites are trying to use the ground station
+        """
+        return np.flatnonzero(self.get_num_active_agents() > max_active_agents)
+
+    def get_indx_slice_for_t_range(self,start,end):
+        """ get a slice object for the time indices between start and end (see Dancecard.get_indx_slice_for_t_range)"""
+
+        start_indcs,end_indcs = self.get_interval_indcs([start],[end],drop_out_of_bounds=True)
+        return slice(int(start_indcs[0]),int(end_indcs[0])+1)
+
+    def get_values_in_t_range(self,start,end,agent_indcs=None):
+        """ get the values for a time range (and optionally a subset of agents)
+
+        for a memory-mapped dancecard, this only reads the requested time range from disk
+        """
+
+        indx_slice = self.get_indx_slice_for_t_range(start,end)
+        if agent_indcs is None:
+            return self.dancecard[:,indx_slice]
+        return self.dancecard[agent_indcs,indx_slice]
+
+    def save(self,base_path):
+        """ save this dancecard to disk as a .npy array with a JSON header (see load())
+
+        :param base_path:  path to save to, without file extension
+        :type base_path: str
+        """
+
+        header = {'type': 'ConstellationDancecard','start': self.dancecard_start_dt,'end': self.dancecard_end_dt,'tstep': self.tstep_sec,'mode': self.mode,'num_agents': self.num_agents}
+        save_dancecard_arrays(base_path,self.dancecard,header)
+
+    @classmethod
+    def load(cls,base_path,mmap_mode='r'):
+        """ load a dancecard saved with save()
+
+        :param base_path:  path the dancecard was saved to, without file extension
+        :type base_path: str
+        :param mmap_mode:  memory-map mode passed to np.load (None to load fully into memory), defaults to 'r'
+        :type mmap_mode: str, optional
+        :returns:  the loaded dancecard, backed by a (by default memory-mapped, read-only) array
+        :rtype: {ConstellationDancecard}
+        """
+
+        values,header = load_dancecard_arrays(base_path,mmap_mode)
+
+        if header['type'] != 'ConstellationDancecard':
+            raise RuntimeWarning('Expected a saved ConstellationDancecard, found %s'%(header['type']))
+
+        # construct with zero agents so we don't allocate a throwaway array
+        newone = cls(0,header['start'],header['end'],header['tstep'],dtype=values.dtype,mode=header['mode'])
+        newone.num_agents = header['num_agents']
+        newone.dancecard = values
+        return newone
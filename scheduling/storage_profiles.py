@@ -0,0 +1,139 @@
+# Per-satellite data storage profiles for route sets
+#
+# DataRoute.get_data_storage_intervals() gives the intervals over which each satellite along a route holds the route's data. This adds those intervals up across a whole set of routes into a piecewise-constant storage curve for each satellite, e.g. for checking a plan against onboard storage limits.
+#
+# All of the intervals from all of the routes are turned into +dv/-dv events and sorted once (by sat, then time). The storage curve for each sat is then just a cumulative sum over its run of events.
+
+from datetime import timedelta
+
+import numpy as np
+
+
+class SatStorageProfile():
+    """ piecewise-constant data storage over time for a single satellite
+
+    storage[i] is the data volume stored on the satellite from times[i] up to (not including) times[i+1]. Storage is zero before times[0] and from times[-1] on.
+    """
+
+    def __init__(self,sat_indx,time_base,times,storage):
+        """
+        :param sat_indx: satellite index
+        :type sat_indx: int
+        :param time_base: time that times are measured from
+        :type time_base: datetime
+        :param times: times at which storage changes, in seconds from time_base, increasing
+        :type times: np.ndarray
+        :param storage: data volume stored from each time until the next
+        :type storage: np.ndarray
+        """
+
+        self.sat_indx = sat_indx
+        self.time_base = time_base
+        self.times = times
+        self.storage = storage
+
+        if len(storage) > 0:
+            peak_indx = int(np.argmax(storage))
+            self.peak_storage = storage[peak_indx]
+            #  first time the peak is reached
+            self.peak_time = time_base + timedelta(seconds=float(times[peak_indx]))
+        else:
+            self.peak_storage = 0.0
+            self.peak_time = None
+
+    def __repr__(self):
+        return '(SatStorageProfile sat %d: %d steps, peak %f at %s)'%(self.sat_indx,len(self.times),self.peak_storage,self.peak_time)
+
+    def get_storage(self,times_s):
+        """ get the data volume stored at the given times
+
+        :param times_s: times, in seconds from time_base
+        :type times_s: np.ndarray or float
+        :returns: stored data volume at each time
+        :rtype: {np.ndarray}
+        """
+
+        step_indcs = np.searchsorted(self.times,times_s,side='right') - 1
+        #  pad with a zero at the front for times before the first step
+        padded_storage = np.concatenate(([0.0],self.storage))
+        return padded_storage[step_indcs+1]
+
+
+def get_sat_storage_profiles(routes,route_dvs=None,time_base=None,sat_indcs=None):
+    """ add up the data storage intervals of a set of routes into a storage profile for each satellite
+
+    Each route holds its data volume on a satellite for each of its storage intervals (see DataRoute.get_data_storage_intervals()). For a DataMultiRoute, each of its data routes holds its own share of the data volume (from data_vol_by_dr).
+
+    :param routes: routes to add up
+    :type routes: list(DataRoute or DataMultiRoute)
+    :param route_dvs: data volume for each route, e.g. its scheduled data volume. For a DataMultiRoute this is split across its data routes in proportion to data_vol_by_dr. Defaults to None (each route's data_vol)
+    :type route_dvs: list(float), optional
+    :param time_base: time that profile times are measured from, defaults to None (earliest storage interval start)
+    :type time_base: datetime, optional
+    :param sat_indcs: satellites to make profiles for, including ones with no storage, defaults to None (every sat that stores data for some route)
+    :type sat_indcs: iterable(int), optional
+    :returns: storage profile for each satellite, keyed by sat index
+    :rtype: {dict(int, SatStorageProfile)}
+    """
+
+    if route_dvs is not None and len(route_dvs) != len(routes):
+        raise ValueError('Got %d route dvs for %d routes'%(len(route_dvs),len(routes)))
+
+    intervals = []
+    interval_dvs = []
+    for route_indx, route in enumerate(routes):
+        if hasattr(route,'data_routes'):
+            if route_dvs is None:
+                dv_scale = 1.0
+            elif route.data_vol > 0:
+                dv_scale = route_dvs[route_indx] / route.data_vol
+            else:
+                dv_scale = 0.0
+            for dr in route.data_routes:
+                dr_intervals = dr.get_data_storage_intervals()
+                intervals += dr_intervals
+                interval_dvs += [route.data_vol_by_dr[dr]*dv_scale]*len(dr_intervals)
+        else:
+            route_intervals = route.get_data_storage_intervals()
+            intervals += route_intervals
+            dv = route.data_vol if route_dvs is None else route_dvs[route_indx]
+            interval_dvs += [dv]*len(route_intervals)
+
+    if time_base is None and len(intervals) > 0:
+        time_base = min(interval.start for interval in intervals)
+
+    #  two events per interval: +dv at the start, -dv at the end
+    num_intervals = len(intervals)
+    event_sats = np.empty(2*num_intervals,dtype=np.int64)
+    event_times = np.empty(2*num_intervals,dtype=np.float64)
+    event_dvs = np.empty(2*num_intervals,dtype=np.float64)
+    for interval_indx, (interval, dv) in enumerate(zip(intervals,interval_dvs)):
+        event_sats[2*interval_indx] = event_sats[2*interval_indx+1] = interval.sat_indx
+        event_times[2*interval_indx] = (interval.start - time_base).total_seconds()
+        event_times[2*interval_indx+1] = (interval.end - time_base).total_seconds()
+        event_dvs[2*interval_indx] = dv
+        event_dvs[2*interval_indx+1] = -dv
+
+    #  sort by sat, then time, then dv so that at equal times data leaving is counted before data arriving (storage intervals are treated as half-open)
+    event_order = np.lexsort((event_dvs,event_times,event_sats))
+    event_sats = event_sats[event_order]
+    event_times = event_times[event_order]
+    event_dvs = event_dvs[event_order]
+
+    profiles = {}
+    sat_starts = np.nonzero(np.diff(event_sats,prepend=-1) != 0)[0] if len(event_sats) > 0 else np.zeros(0,dtype=np.int64)
+    sat_ends = np.append(sat_starts[1:],len(event_sats))
+    for start, end in zip(sat_starts,sat_ends):
+        times = event_times[start:end]
+        storage = np.cumsum(event_dvs[start:end])
+        #  only the last event at each time gives the storage from that time on
+        last_at_time = np.append(times[1:] != times[:-1],True)
+        sat_indx = int(event_sats[start])
+        profiles[sat_indx] = SatStorageProfile(sat_indx,time_base,times[last_at_time],storage[last_at_time])
+
+    if sat_indcs is not None:
+        for sat_indx in sat_indcs:
+            if not sat_indx in profiles:
+                profiles[sat_indx] = SatStorageProfile(sat_indx,time_base,np.zeros(0),np.zeros(0))
+
+    return profiles
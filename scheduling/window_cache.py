@@ -0,0 +1,218 @@
+# On-disk cache of the window sets imported by SchedIOProcessor
+#
+# Every pipeline stage that constructs a SchedIOProcessor re-imports (and re-merges) the same obs, xlnk, dlnk and eclipse windows from the same inputs. This caches the imported windows on disk, keyed by a hash of all of the inputs that go into the import, so that later imports from the same inputs just reload them. Window IDs are stored along with the windows, so they are the same on every reload.
+#
+# The cache directory is capped in size; the least recently used entries are removed first when it grows too large.
+
+import os
+import json
+import pickle
+import hashlib
+
+# bump this whenever the windows made for the same inputs change, so that stale cache entries aren't used
+WINDOW_CACHE_VERSION = 2
+
+# default cap on the total size of all cache entries, in bytes
+DEFAULT_MAX_CACHE_SIZE_BYTES = 2*1024**3
+
+CACHE_ENTRY_EXT = '.pkl'
+
+# the SchedIOProcessor attributes that affect the imported windows
+KEY_PARAM_ATTRS = [
+    'input_date_format',
+    'scenario_start',
+    'scenario_end',
+    'tstep_sec',
+    'num_sats',
+    'num_gs',
+    'sat_id_order',
+    'gs_id_order',
+    'link_disables',
+    'pl_data_rate',
+    'targ_id_ignore_list',
+    'all_targ_IDs',
+    'min_allowed_dv_dlnk',
+    'sat_indcs_disable_dlnk',
+    'gs_id_ignore_list',
+    'all_gs_IDs',
+    'min_allowed_dv_xlnk',
+    'use_symmetric_xlnk_windows',
+]
+
+# the SchedIOProcessor attributes holding the accesses data
+KEY_DATA_ATTRS = ['obs_times','dlnk_times','dlnk_rates','xlnk_times','xlnk_rates','eclipse_times']
+
+def _hash_file(hasher,path,chunk_size=1024**2):
+    with open(path,'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+
+def _hash_dir(hasher,dir_path):
+    for root, dirs, files in os.walk(dir_path):
+        # walk in a consistent order so the hash doesn't depend on file system ordering
+        dirs.sort()
+        for file_name in sorted(files):
+            path = os.path.join(root,file_name)
+            hasher.update(os.path.relpath(path,dir_path).encode())
+            _hash_file(hasher,path)
+
+def get_window_cache_key(io_proc,import_settings,data_files=None):
+    """ compute the cache key for the windows imported by a SchedIOProcessor
+
+    The key is a hash of all the params that affect window import, the import settings (e.g. the first window ID), and the accesses data. If data_files is given, the contents of those files are hashed instead of the in-memory accesses data - this is much faster, but it's up to the caller to make sure they are the files the data was actually read from. If the processor reads its data from an accesses store or rates store, the store files are hashed.
+
+    :param io_proc: processor that will do the import
+    :type io_proc: SchedIOProcessor
+    :param import_settings: any other settings that affect the imported windows (must be JSON serializable)
+    :type import_settings: dict
+    :param data_files: paths of the data files the accesses data was read from, defaults to None
+    :type data_files: list(str), optional
+    :returns: hex digest cache key
+    :rtype: {str}
+    """
+
+    hasher = hashlib.sha256()
+
+    params = {attr: getattr(io_proc,attr) for attr in KEY_PARAM_ATTRS}
+    params['window_cache_version'] = WINDOW_CACHE_VERSION
+    params['import_settings'] = import_settings
+    # default=str takes care of datetimes
+    hasher.update(json.dumps(params,sort_keys=True,default=str).encode())
+
+    if data_files is not None:
+        for path in data_files:
+            _hash_file(hasher,path)
+    else:
+        store_data_attrs = set()
+        accesses_store = getattr(io_proc,'accesses_store',None)
+        if accesses_store is not None:
+            _hash_dir(hasher,accesses_store.store_dir)
+            store_data_attrs |= set(KEY_DATA_ATTRS)
+        rates_store = getattr(io_proc,'rates_store',None)
+        if rates_store is not None:
+            _hash_dir(hasher,rates_store.store_dir)
+            store_data_attrs |= {'dlnk_rates','xlnk_rates'}
+
+        for attr in KEY_DATA_ATTRS:
+            if attr in store_data_attrs:
+                continue
+            hasher.update(pickle.dumps(getattr(io_proc,attr),protocol=pickle.HIGHEST_PROTOCOL))
+
+    return hasher.hexdigest()
+
+
+class WindowCache():
+    """ directory of cached window sets, one pickle file per cache key"""
+
+    def __init__(self,cache_dir,max_size_bytes=DEFAULT_MAX_CACHE_SIZE_BYTES):
+        """
+        :param cache_dir: directory to keep cache entries in (created if needed)
+        :type cache_dir: str
+        :param max_size_bytes: cap on the total size of all cache entries. When exceeded, least recently used entries are removed
+        :type max_size_bytes: int
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+
+        os.makedirs(cache_dir,exist_ok=True)
+
+    def _entry_path(self,key):
+        return os.path.join(self.cache_dir,key+CACHE_ENTRY_EXT)
+
+    def load(self,key):
+        """ load the cached windows for key
+
+        :param key: cache key (from get_window_cache_key())
+        :type key: str
+        :returns: the cached object, or None if there's no entry for key
+        :rtype: {dict}
+        """
+
+        path = self._entry_path(key)
+        try:
+            with open(path,'rb') as f:
+                windows = pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+        # mark as recently used
+        os.utime(path)
+
+        return windows
+
+    def store(self,key,windows):
+        """ store windows for key, then remove old entries if the cache is over its size cap
+
+        :param key: cache key (from get_window_cache_key())
+        :type key: str
+        :param windows: windows to cache (anything picklable)
+        :type windows: dict
+        """
+
+        path = self._entry_path(key)
+
+        # write to a temporary file first, so that a partly-written entry is never read
+        tmp_path = path + '.tmp%d'%(os.getpid())
+        with open(tmp_path,'wb') as f:
+            pickle.dump(windows,f,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path,path)
+
+        self.enforce_size_cap(keep_keys=[key])
+
+    def get_entries(self):
+        """ get all of the cache entries, least recently used first
+
+        :returns: list of (key, size in bytes, last used time)
+        :rtype: {list(tuple)}
+        """
+
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(CACHE_ENTRY_EXT):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir,file_name))
+            entries.append((file_name[:-len(CACHE_ENTRY_EXT)],stat.st_size,stat.st_mtime))
+
+        entries.sort(key=lambda entry: entry[2])
+        return entries
+
+    def enforce_size_cap(self,keep_keys=None):
+        """ remove least recently used entries until the cache is within its size cap
+
+        :param keep_keys: keys of entries to not remove, defaults to None (none kept)
+        :type keep_keys: list(str), optional
+        """
+
+        if keep_keys is None:
+            keep_keys = []
+
+        entries = self.get_entries()
+        total_size = sum(entry[1] for entry in entries)
+
+        for key, size, last_used in entries:
+            if total_size <= self.max_size_bytes:
+                break
+            if key in keep_keys:
+                continue
+            self.invalidate(key)
+            total_size -= size
+
+    def invalidate(self,key=None):
+        """ remove the cache entry for key, or all entries if key is None
+
+        :param key: cache key to remove, defaults to None
+        :type key: str, optional
+        """
+
+        if key is None:
+            for entry_key, size, last_used in self.get_entries():
+                self.invalidate(entry_key)
+            return
+
+        try:
+            os.remove(self._entry_path(key))
+        except FileNotFoundError:
+            pass
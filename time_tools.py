@@ -2,6 +2,8 @@ import jdcal
 import math
 from datetime import datetime
 
+import numpy as np
+
 def iso_string_to_dt(iso_string):
     return datetime.strptime(iso_string, "%Y-%m-%dT%H:%M:%S.%fZ")
 
@@ -38,6 +40,33 @@ def datetime2mjd(time):
 
     return mjd
 
+# day zero for modified julian dates
+MJD_EPOCH_DT64 = np.datetime64('1858-11-17','D')
+
+def datetimes2mjd(times):
+    '''  convert many datetimes to modified Julian dates at once
+
+    Gives exactly the same values as calling datetime2mjd() on each time (including ignoring microseconds), but does the conversion with numpy array operations rather than per-time Python calls
+
+    :param times: datetime objects
+    :type times: list(datetime)
+    :return: times as modified julian dates
+    :rtype: np.ndarray
+    '''
+
+    # datetime64[s] truncates microseconds, same as datetime2mjd
+    times_dt64 = np.array(times,dtype='datetime64[s]')
+    days_dt64 = times_dt64.astype('datetime64[D]')
+
+    mjd_midnight = (days_dt64 - MJD_EPOCH_DT64).astype(np.int64).astype(np.float64)
+    secs_of_day = (times_dt64 - days_dt64).astype(np.int64)
+    hours = secs_of_day // 3600
+    minutes = (secs_of_day % 3600) // 60
+    seconds = secs_of_day % 60
+
+    # same order of operations as datetime2mjd, so the floating point results match exactly
+    return mjd_midnight + hours/24.0 + minutes/24.0/60 + seconds/24.0/60/60
+
 def short_date_string(dt):
     return dt.strftime("%H:%M:%S")
 